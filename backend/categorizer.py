@@ -0,0 +1,142 @@
+"""
+Incremental naive Bayes expense categorizer.
+
+Learns (description/merchant features -> category) from expense history:
+one global model over every user, plus a per-user model whose counts are
+blended in with extra weight so personal labels win over the crowd's.
+Counts are updated in place on every expense write, and a prediction is a
+handful of dict lookups per feature, so it answers in microseconds. The
+counts round-trip through plain documents so one process can train and
+store a model that every other process loads.
+"""
+
+import math
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Add-one smoothing over the feature vocabulary
+ALPHA = 1.0
+# How much a user's own history counts relative to the global history
+USER_WEIGHT = 5.0
+# Floating point dust left behind by forget() is treated as zero
+EPSILON = 1e-9
+
+
+class CategoryCounts:
+    """Document and feature counts per category for one model"""
+
+    def __init__(self):
+        self.docs: Dict[str, float] = defaultdict(float)
+        self.features: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.feature_totals: Dict[str, float] = defaultdict(float)
+        self.vocabulary: Dict[str, float] = defaultdict(float)
+
+    def add(self, features: Iterable[str], category: str, weight: float):
+        self.docs[category] += weight
+        if self.docs[category] <= EPSILON:
+            del self.docs[category]
+        counts = self.features[category]
+        for feature in features:
+            counts[feature] += weight
+            self.feature_totals[category] += weight
+            self.vocabulary[feature] += weight
+            if counts[feature] <= EPSILON:
+                del counts[feature]
+            if self.vocabulary[feature] <= EPSILON:
+                del self.vocabulary[feature]
+        if self.feature_totals[category] <= EPSILON:
+            del self.feature_totals[category]
+            self.features.pop(category, None)
+
+    def to_document(self) -> Dict[str, list]:
+        """Counts as lists, since category and feature names need not be valid Mongo keys"""
+        return {
+            "docs": [[category, n] for category, n in self.docs.items()],
+            "features": [
+                [category, feature, n]
+                for category, counts in self.features.items()
+                for feature, n in counts.items()
+            ],
+        }
+
+    @classmethod
+    def from_document(cls, doc: Dict[str, Any]) -> "CategoryCounts":
+        counts = cls()
+        for category, n in doc["docs"]:
+            counts.docs[category] += n
+        for category, feature, n in doc["features"]:
+            counts.features[category][feature] += n
+            counts.feature_totals[category] += n
+            counts.vocabulary[feature] += n
+        return counts
+
+
+class Categorizer:
+    """Global plus per-user naive Bayes over set-of-word features"""
+
+    def __init__(self, user_weight: float = USER_WEIGHT):
+        self.user_weight = user_weight
+        self.global_counts = CategoryCounts()
+        self.users: Dict[str, CategoryCounts] = {}
+
+    def learn(self, user_id: str, features: Iterable[str], category: str, weight: float = 1.0):
+        """Count one labelled expense; a negative weight forgets it again"""
+        features = set(features)
+        self.global_counts.add(features, category, weight)
+        self.users.setdefault(user_id, CategoryCounts()).add(features, category, weight)
+
+    def forget(self, user_id: str, features: Iterable[str], category: str, weight: float = 1.0):
+        self.learn(user_id, features, category, -weight)
+
+    def predict(self, features: Iterable[str], user_id: Optional[str] = None) -> Tuple[Optional[str], float]:
+        """Most likely category and its posterior probability; (None, 0.0) when no feature is known"""
+        g = self.global_counts
+        u = self.users.get(user_id) if user_id else None
+        w = self.user_weight
+        known = [f for f in set(features) if f in g.vocabulary]
+        if not known or not g.docs:
+            return None, 0.0
+
+        categories = g.docs.keys()
+        total_docs = sum(g.docs.values()) + (w * sum(u.docs.values()) if u else 0)
+        vocabulary_size = len(g.vocabulary)
+        scores = {}
+        for category in categories:
+            docs = g.docs[category] + (w * u.docs.get(category, 0) if u else 0)
+            feature_total = g.feature_totals.get(category, 0) + (w * u.feature_totals.get(category, 0) if u else 0)
+            g_counts = g.features.get(category, {})
+            u_counts = u.features.get(category, {}) if u else {}
+            denominator = math.log(feature_total + ALPHA * vocabulary_size)
+            score = math.log((docs + ALPHA) / (total_docs + ALPHA * len(categories)))
+            for feature in known:
+                count = g_counts.get(feature, 0) + w * u_counts.get(feature, 0)
+                score += math.log(count + ALPHA) - denominator
+            scores[category] = score
+
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        # Softmax over log scores, shifted by the max for stability
+        confidence = 1.0 / sum(math.exp(s - top) for s in scores.values())
+        return best, confidence
+
+    def to_documents(self) -> Iterator[Dict[str, Any]]:
+        """One document for the global counts (user_id None), then one per user"""
+        yield {"user_id": None, **self.global_counts.to_document()}
+        for user_id, counts in self.users.items():
+            yield {"user_id": user_id, **counts.to_document()}
+
+    def load(self, doc: Dict[str, Any]):
+        """Take the counts of one document written by to_documents"""
+        counts = CategoryCounts.from_document(doc)
+        if doc["user_id"] is None:
+            self.global_counts = counts
+        else:
+            self.users[doc["user_id"]] = counts
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "categories": len(self.global_counts.docs),
+            "vocabulary": len(self.global_counts.vocabulary),
+            "users": len(self.users),
+            "documents": int(round(sum(self.global_counts.docs.values()))),
+        }
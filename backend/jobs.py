@@ -0,0 +1,205 @@
+"""
+Mongo-backed job queue for slow analyses.
+
+Submitting returns a job id at once; a bounded pool of asyncio workers in
+every server process claims queued jobs with an atomic find_one_and_update
+and a lease, so jobs survive restarts and are shared across processes.
+A failed attempt is retried with exponential backoff up to max_attempts,
+and a job whose worker died is picked up again once its lease runs out;
+every claim counts as an attempt, so a job that keeps killing its worker
+also fails after max_attempts.
+
+While a job is queued or running it holds an `active_key`, which is unique
+in the collection. A second submit with the same dedup key therefore
+returns the job already in flight instead of starting another one; once
+it is done or failed, the same key queues a fresh job.
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+ACTIVE = ["queued", "running"]
+FINISHED = ["done", "failed"]
+
+JOB_INDEXES = [
+    IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+    IndexModel(
+        [("active_key", ASCENDING)],
+        name="active_key_unique",
+        unique=True,
+        partialFilterExpression={"active_key": {"$exists": True}}
+    ),
+    IndexModel([("dedup_key", ASCENDING), ("created_at", DESCENDING)], name="dedup_key_created"),
+    IndexModel([("status", ASCENDING), ("run_after", ASCENDING)], name="status_run_after"),
+    IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+]
+
+
+class JobQueue:
+    def __init__(
+        self,
+        collection,
+        handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]],
+        workers: int = 4,
+        max_attempts: int = 3,
+        lease_seconds: float = 300.0,
+        poll_seconds: float = 2.0,
+        retain_seconds: float = 7 * 24 * 3600,
+        on_metric: Optional[Callable[[str, float], None]] = None
+    ):
+        self.collection = collection
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.retain_seconds = retain_seconds
+        self.on_metric = on_metric or (lambda name, value: None)
+        self.wakeup = asyncio.Event()
+        # job id -> event set when that job finishes in this process
+        self.finished: Dict[str, asyncio.Event] = {}
+
+    async def submit(self, kind: str, user_id: str, dedup_key: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Queue a job, or return the queued/running job with the same dedup key"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        existing = await self.collection.find_one({"active_key": dedup_key}, {"_id": 0})
+        if existing:
+            self.on_metric("jobs.reused", 1)
+            return {**existing, "reused": True}
+
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "user_id": user_id,
+            "params": params or {},
+            "dedup_key": dedup_key,
+            "active_key": dedup_key,
+            "status": "queued",
+            "attempts": 0,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "run_after": now
+        }
+        try:
+            await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            # Another request queued the same analysis a moment ago
+            self.on_metric("jobs.reused", 1)
+            existing = await self.collection.find_one({"active_key": dedup_key}, {"_id": 0})
+            if existing:
+                return {**existing, "reused": True}
+            return await self.submit(kind, user_id, dedup_key, params)
+        job.pop("_id", None)
+        self.on_metric("jobs.submitted", 1)
+        self.wakeup.set()
+        return {**job, "reused": False}
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0, "active_key": 0})
+
+    async def wait(self, job_id: str, timeout: float):
+        """Return early if the job finishes in this process; otherwise after timeout"""
+        event = self.finished.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if not event.is_set():
+                self.finished.pop(job_id, None)
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_after": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}}
+            ]},
+            {
+                "$set": {"status": "running", "lease_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now},
+                "$inc": {"attempts": 1}
+            },
+            {"_id": 0},
+            sort=[("run_after", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _finish(self, job: Dict[str, Any], update: Dict[str, Any], unset_active: bool):
+        now = datetime.now(timezone.utc)
+        change = {"$set": {**update, "updated_at": now}, "$unset": {"lease_until": ""}}
+        if unset_active:
+            change["$set"]["finished_at"] = now
+            change["$set"]["expires_at"] = now + timedelta(seconds=self.retain_seconds)
+            change["$unset"]["active_key"] = ""
+        await self.collection.update_one({"id": job["id"]}, change)
+        if unset_active:
+            event = self.finished.pop(job["id"], None)
+            if event:
+                event.set()
+
+    async def _run_one(self, job: Dict[str, Any]):
+        if job["attempts"] > self.max_attempts:
+            # Reclaimed after its lease ran out once too often: the worker running it keeps dying
+            logging.error(f"Job {job['id']} ({job['kind']}) abandoned after {self.max_attempts} attempts")
+            self.on_metric("jobs.failed", 1)
+            await self._finish(job, {
+                "status": "failed",
+                "attempts": self.max_attempts,
+                "error": job.get("error") or "lease expired"
+            }, unset_active=True)
+            return
+        started = asyncio.get_running_loop().time()
+        try:
+            result = await self.handlers[job["kind"]](job)
+        except Exception as e:
+            if job["attempts"] < self.max_attempts:
+                delay = 2 ** job["attempts"]
+                logging.error(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed, retrying in {delay}s: {str(e)}")
+                self.on_metric("jobs.retries", 1)
+                await self._finish(job, {
+                    "status": "queued",
+                    "error": str(e),
+                    "run_after": datetime.now(timezone.utc) + timedelta(seconds=delay)
+                }, unset_active=False)
+            else:
+                logging.error(f"Job {job['id']} ({job['kind']}) failed after {job['attempts']} attempts: {str(e)}")
+                self.on_metric("jobs.failed", 1)
+                await self._finish(job, {"status": "failed", "error": str(e)}, unset_active=True)
+            return
+        self.on_metric("jobs.done", 1)
+        self.on_metric("jobs.run_seconds_total", asyncio.get_running_loop().time() - started)
+        await self._finish(job, {"status": "done", "result": result, "error": None}, unset_active=True)
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logging.error(f"Job claim failed: {str(e)}")
+                job = None
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_one(job)
+            except Exception as e:
+                # Bookkeeping failed; the lease expiry hands the job to another worker
+                logging.error(f"Job {job['id']} bookkeeping failed: {str(e)}")
+
+    async def run(self):
+        """Run the worker pool until cancelled"""
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
@@ -0,0 +1,340 @@
+"""
+Shared gateway for every LLM call the backend makes.
+
+- One backend per process: the Emergent LlmChat integration, or, when
+  LLM_BASE_URL is set, any OpenAI-compatible endpoint over one pooled
+  httpx client (which is also how it is pointed at a local stub).
+- A global and a per-user concurrency cap, so a slow provider can't soak
+  up every task and socket the server has.
+- Token streaming for SSE routes; closing the stream closes the upstream
+  request, so a client that disconnects stops the generation.
+- Separate deadlines for waiting on a slot and for the request itself, so
+  a provider timeout always means the provider was slow, not the queue.
+- A circuit breaker that fails fast after repeated provider failures, so
+  routes drop to their canned fallbacks instead of waiting out timeouts.
+"""
+
+import asyncio
+import contextlib
+import json
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import httpx
+
+
+class LLMUnavailable(Exception):
+    """The call was not answered: circuit open, no free slot, timeout or provider error"""
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive failures; after reset_seconds lets one trial call through"""
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_in_flight or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+        self.trial_in_flight = False
+
+    def record_abandoned(self):
+        """The caller went away before the provider answered; neither success nor failure"""
+        self.trial_in_flight = False
+
+
+class EmergentBackend:
+    """LlmChat keeps per-session history, so each call gets its own session"""
+
+    def __init__(self, api_key: str, provider: str, model: str):
+        from emergentintegrations.llm.chat import ImageContent, LlmChat, UserMessage
+        self._image_content, self._llm_chat, self._user_message = ImageContent, LlmChat, UserMessage
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+
+    async def complete(self, prompt: str, system_message: str, images: Optional[List[str]] = None) -> str:
+        chat = self._llm_chat(
+            api_key=self.api_key,
+            session_id=str(uuid.uuid4()),
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+        files = [self._image_content(image_base64=image) for image in images or []]
+        message = self._user_message(text=prompt, file_contents=files) if files else self._user_message(text=prompt)
+        return await chat.send_message(message)
+
+    async def stream(self, prompt: str, system_message: str, images: Optional[List[str]] = None) -> AsyncIterator[str]:
+        # LlmChat has no streaming API; the whole completion arrives as one chunk
+        yield await self.complete(prompt, system_message, images)
+
+    async def aclose(self):
+        pass
+
+
+def image_mime(image_base64: str) -> str:
+    """Sniff the format from the first base64 characters of the image"""
+    if image_base64.startswith("UklGR"):
+        return "image/webp"
+    if image_base64.startswith("iVBOR"):
+        return "image/png"
+    return "image/jpeg"
+
+
+class OpenAICompatibleBackend:
+    """Chat completions over one pooled, keep-alive httpx client"""
+
+    def __init__(self, base_url: str, api_key: str, model: str, max_connections: int = 32):
+        self.model = model
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=None  # the gateway owns deadlines
+        )
+
+    def _payload(self, prompt: str, system_message: str, images: Optional[List[str]], stream: bool = False) -> Dict:
+        content = prompt
+        if images:
+            content = [{"type": "text", "text": prompt}] + [
+                {"type": "image_url", "image_url": {"url": f"data:{image_mime(image)};base64,{image}"}} for image in images
+            ]
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": content}
+            ],
+            "stream": stream
+        }
+
+    async def complete(self, prompt: str, system_message: str, images: Optional[List[str]] = None) -> str:
+        response = await self.client.post("/chat/completions", json=self._payload(prompt, system_message, images))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def stream(self, prompt: str, system_message: str, images: Optional[List[str]] = None) -> AsyncIterator[str]:
+        """Content deltas from a streamed completion; closing this closes the connection"""
+        payload = self._payload(prompt, system_message, images, stream=True)
+        async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        backend,
+        max_concurrency: int = 16,
+        per_user_concurrency: int = 2,
+        timeout: float = 30.0,
+        queue_timeout: float = 10.0,
+        breaker: Optional[CircuitBreaker] = None,
+        on_metric: Optional[Callable[[str, float], None]] = None,
+        latency_window: int = 1000
+    ):
+        self.backend = backend
+        self.per_user_concurrency = per_user_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.on_metric = on_metric or (lambda name, value: None)
+        self.global_slots = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        # user_id -> [semaphore, callers holding or waiting]; dropped when idle
+        self.user_slots: Dict[str, list] = {}
+        self.in_flight = 0
+        self.latencies = deque(maxlen=latency_window)
+
+    def _metric(self, name: str, value: float = 1):
+        self.on_metric(name, value)
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, semaphore: asyncio.Semaphore, deadline: float):
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(deadline - asyncio.get_running_loop().time(), 0))
+        except asyncio.TimeoutError:
+            self._metric("llm.queue_timeouts")
+            raise LLMUnavailable("timed out waiting for a free LLM slot")
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+    @contextlib.asynccontextmanager
+    async def _user_slot(self, user_id: Optional[str], deadline: float):
+        if user_id is None:
+            yield
+            return
+        entry = self.user_slots.setdefault(user_id, [asyncio.Semaphore(self.per_user_concurrency), 0])
+        entry[1] += 1
+        try:
+            async with self._slot(entry[0], deadline):
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self.user_slots.pop(user_id, None)
+
+    async def complete(
+        self,
+        prompt: str,
+        system_message: str,
+        user_id: Optional[str] = None,
+        images: Optional[List[str]] = None,
+        timeout: Optional[float] = None
+    ) -> str:
+        """Answer one prompt or raise LLMUnavailable; never waits past either deadline"""
+        if not self.breaker.allow():
+            self._metric("llm.circuit_rejections")
+            raise LLMUnavailable("LLM circuit is open")
+        loop = asyncio.get_running_loop()
+        queue_deadline = loop.time() + self.queue_timeout
+        try:
+            async with self._user_slot(user_id, queue_deadline), self._slot(self.global_slots, queue_deadline):
+                started = loop.time()
+                self.in_flight += 1
+                try:
+                    response = await asyncio.wait_for(
+                        self.backend.complete(prompt, system_message, images),
+                        timeout or self.timeout
+                    )
+                except asyncio.TimeoutError:
+                    self._metric("llm.timeouts")
+                    self.breaker.record_failure()
+                    raise LLMUnavailable("LLM call timed out")
+                except Exception as e:
+                    self._metric("llm.errors")
+                    self.breaker.record_failure()
+                    raise LLMUnavailable(f"LLM provider error: {e}") from e
+                finally:
+                    self.in_flight -= 1
+        except LLMUnavailable:
+            self.breaker.record_abandoned()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.record_abandoned()
+            raise
+        latency = loop.time() - started
+        self.latencies.append(latency)
+        self._metric("llm.calls")
+        self._metric("llm.latency_seconds_total", latency)
+        self.breaker.record_success()
+        return response
+
+    async def stream(
+        self,
+        prompt: str,
+        system_message: str,
+        user_id: Optional[str] = None,
+        images: Optional[List[str]] = None,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """Yield completion chunks as they arrive, holding the same slots as complete().
+
+        timeout bounds the wait for each chunk, so the first one arrives within
+        it and a stalled stream fails instead of hanging.
+        """
+        if not self.breaker.allow():
+            self._metric("llm.circuit_rejections")
+            raise LLMUnavailable("LLM circuit is open")
+        loop = asyncio.get_running_loop()
+        queue_deadline = loop.time() + self.queue_timeout
+        chunk_timeout = timeout or self.timeout
+        try:
+            async with self._user_slot(user_id, queue_deadline), self._slot(self.global_slots, queue_deadline):
+                started = loop.time()
+                self.in_flight += 1
+                chunks = self.backend.stream(prompt, system_message, images)
+                first = True
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), chunk_timeout)
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            self._metric("llm.timeouts")
+                            self.breaker.record_failure()
+                            raise LLMUnavailable("LLM stream stalled")
+                        except Exception as e:
+                            self._metric("llm.errors")
+                            self.breaker.record_failure()
+                            raise LLMUnavailable(f"LLM provider error: {e}") from e
+                        if first:
+                            first = False
+                            self._metric("llm.first_token_seconds_total", loop.time() - started)
+                            self.breaker.record_success()
+                        yield chunk
+                finally:
+                    self.in_flight -= 1
+                    await chunks.aclose()
+        except (LLMUnavailable, asyncio.CancelledError, GeneratorExit):
+            self.breaker.record_abandoned()
+            raise
+        latency = loop.time() - started
+        self.latencies.append(latency)
+        self._metric("llm.streams")
+        self._metric("llm.latency_seconds_total", latency)
+        if first:
+            self.breaker.record_success()  # empty but successful completion
+
+    def stats(self) -> Dict[str, object]:
+        ordered = sorted(self.latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            return ordered[min(int(p * len(ordered)), len(ordered) - 1)] if ordered else None
+
+        return {
+            "circuit": self.breaker.state,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "users_waiting_or_active": len(self.user_slots),
+            "latency_p50_seconds": percentile(0.5),
+            "latency_p95_seconds": percentile(0.95),
+        }
+
+    async def aclose(self):
+        await self.backend.aclose()
+
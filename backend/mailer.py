@@ -0,0 +1,127 @@
+"""
+Pooled, rate-limited SMTP delivery over aiosmtplib.
+
+- Up to `pool_size` connections, each opened on first use and kept open
+  across messages, so a batch pays the TCP/TLS/AUTH handshake once per
+  connection rather than once per message.
+- A process-wide rate limit: message starts are spaced at least
+  1/rate_per_second apart, which keeps a batch under the provider's quota.
+- Transient failures (dropped connections, 4xx replies) are retried with
+  exponential backoff, on a fresh connection after a transport error;
+  5xx replies and refused recipients are final.
+"""
+
+import asyncio
+import time
+from email.message import EmailMessage
+from typing import Callable, Optional
+
+import aiosmtplib
+
+
+class Mailer:
+    def __init__(
+        self,
+        hostname: str,
+        port: int,
+        sender: str,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        use_tls: bool = False,
+        start_tls: Optional[bool] = None,
+        pool_size: int = 4,
+        rate_per_second: float = 10.0,
+        max_attempts: int = 3,
+        timeout: float = 30.0,
+        on_metric: Optional[Callable[[str, float], None]] = None
+    ):
+        self.options = dict(
+            hostname=hostname, port=port, username=username, password=password,
+            use_tls=use_tls, start_tls=start_tls, timeout=timeout
+        )
+        self.sender = sender
+        self.max_attempts = max_attempts
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self.on_metric = on_metric or (lambda name, value: None)
+        # Idle connections; None stands for a slot whose connection isn't open yet
+        self.pool: asyncio.Queue = asyncio.Queue()
+        for _ in range(pool_size):
+            self.pool.put_nowait(None)
+        self.rate_lock = asyncio.Lock()
+        self.next_start = 0.0
+
+    async def _pace(self):
+        async with self.rate_lock:
+            now = time.monotonic()
+            wait = self.next_start - now
+            self.next_start = max(now, self.next_start) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(**self.options)
+        await smtp.connect()
+        self.on_metric("mail.connections", 1)
+        return smtp
+
+    @staticmethod
+    async def _discard(smtp: Optional[aiosmtplib.SMTP]):
+        if smtp is not None:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def message(self, to: str, subject: str, text: str, html: Optional[str] = None) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = to
+        message["Subject"] = subject
+        message.set_content(text)
+        if html:
+            message.add_alternative(html, subtype="html")
+        return message
+
+    async def send(self, message: EmailMessage):
+        """Deliver one message; raises the last error once every attempt has failed"""
+        for attempt in range(1, self.max_attempts + 1):
+            await self._pace()
+            smtp = await self.pool.get()
+            try:
+                if smtp is None or not smtp.is_connected:
+                    await self._discard(smtp)
+                    smtp = None
+                    smtp = await self._connect()
+                await smtp.send_message(message)
+                self.on_metric("mail.sent", 1)
+                return
+            except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPSenderRefused):
+                self.on_metric("mail.rejected", 1)
+                raise
+            except aiosmtplib.SMTPResponseException as e:
+                if e.code >= 500:
+                    self.on_metric("mail.rejected", 1)
+                    raise
+                error = e
+            except (aiosmtplib.SMTPException, OSError, asyncio.TimeoutError) as e:
+                # The connection is suspect after any transport error
+                await self._discard(smtp)
+                smtp = None
+                error = e
+            finally:
+                self.pool.put_nowait(smtp)
+            self.on_metric("mail.retries", 1)
+            if attempt < self.max_attempts:
+                await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+        self.on_metric("mail.failed", 1)
+        raise error
+
+    async def aclose(self):
+        while not self.pool.empty():
+            smtp = self.pool.get_nowait()
+            if smtp is not None and smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except Exception:
+                    smtp.close()
+
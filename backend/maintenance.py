@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Maintenance commands for the Finote backend.
+
+Usage:
+    python maintenance.py ensure-indexes
+    python maintenance.py check-indexes
+    python maintenance.py rebuild-rollups [--user-id USER]
+    python maintenance.py check-rollups [--user-id USER]
+    python maintenance.py reconcile-budgets [--user-id USER]
+    python maintenance.py backfill-expenses
+    python maintenance.py backfill-merchants [--all]
+    python maintenance.py migrate-dates
+    python maintenance.py trim-llm-cache [--max-entries N]
+    python maintenance.py process-recurring [--user-id USER]
+    python maintenance.py poll-prices
+    python maintenance.py rebuild-rankings [--all-periods]
+    python maintenance.py rebuild-user-stats [--user-id USER]
+    python maintenance.py weekly-reports [--run-day YYYY-MM-DD] [--no-email] [--force]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+
+import server
+
+
+async def cmd_ensure_indexes(args):
+    created = await server.ensure_indexes()
+    for collection, names in created.items():
+        print(f"{collection}: {', '.join(names)}")
+    return 0
+
+
+async def cmd_check_indexes(args):
+    await server.ensure_indexes()
+    failures = await server.verify_indexes()
+    for failure in failures:
+        print(f"COLLSCAN on {failure['collection']}: {json.dumps(failure['query'])}")
+    if failures:
+        print(f"{len(failures)} of {len(server.CANONICAL_QUERIES)} canonical queries are not index-backed")
+        return 1
+    print(f"All {len(server.CANONICAL_QUERIES)} canonical queries are index-backed")
+    return 0
+
+
+async def cmd_rebuild_rollups(args):
+    count = await server.rebuild_rollups(args.user_id)
+    print(f"Rebuilt {count} rollup documents")
+    return 0
+
+
+async def cmd_check_rollups(args):
+    mismatches = await server.check_rollups(args.user_id)
+    for mismatch in mismatches:
+        print(json.dumps(mismatch, default=str))
+    if mismatches:
+        print(f"{len(mismatches)} rollup documents are out of date; run rebuild-rollups")
+        return 1
+    print("Rollups are consistent with expenses")
+    return 0
+
+
+async def cmd_reconcile_budgets(args):
+    corrected = await server.reconcile_budgets(args.user_id)
+    print(f"Corrected current_spent on {corrected} budgets")
+    return 0
+
+
+async def cmd_backfill_expenses(args):
+    updated = await server.backfill_derived_fields()
+    print(f"Backfilled derived fields on {updated} expenses")
+    return 0
+
+
+async def cmd_backfill_merchants(args):
+    updated = await server.backfill_merchant_keys(recompute_all=args.all)
+    print(f"Updated merchant_key on {updated} expenses")
+    return 0
+
+
+async def cmd_migrate_dates(args):
+    result = await server.migrate_dates(with_rollups=True)
+    await server.db.migrations.update_one(
+        {"_id": "native_dates"}, {"$set": {"status": "done", "result": result}}, upsert=True
+    )
+    print(json.dumps(result))
+    return 0
+
+
+async def cmd_trim_llm_cache(args):
+    removed = await server.trim_llm_cache(args.max_entries)
+    print(f"Evicted {removed} LLM cache entries")
+    return 0
+
+
+async def cmd_process_recurring(args):
+    stats = await server.process_due_recurring(args.user_id)
+    stats.pop("processed")
+    print(json.dumps(stats))
+    return 0
+
+
+async def cmd_poll_prices(args):
+    try:
+        stats = await server.poll_due_prices()
+    finally:
+        await server.price_poller.aclose()
+    print(json.dumps(stats))
+    return 0
+
+
+async def cmd_rebuild_rankings(args):
+    counts = await (server.build_rankings() if args.all_periods else server.recompute_rankings())
+    for period, count in counts.items():
+        print(f"{period}: {count} users")
+    return 0
+
+
+async def cmd_rebuild_user_stats(args):
+    users = await server.rebuild_user_stats(args.user_id)
+    print(f"Rebuilt badge counters for {users} users")
+    return 0
+
+
+async def cmd_weekly_reports(args):
+    run_day = datetime.date.fromisoformat(args.run_day) if args.run_day else None
+    try:
+        stats = await server.run_weekly_reports(run_day, send_email=not args.no_email, force=args.force)
+    finally:
+        if server.mailer:
+            await server.mailer.aclose()
+    if stats is None:
+        print("That week's reports have run already; pass --force to redo them")
+        return 1
+    print(json.dumps(stats))
+    return 0
+
+
+COMMANDS = {
+    "ensure-indexes": cmd_ensure_indexes,
+    "check-indexes": cmd_check_indexes,
+    "rebuild-rollups": cmd_rebuild_rollups,
+    "check-rollups": cmd_check_rollups,
+    "reconcile-budgets": cmd_reconcile_budgets,
+    "backfill-expenses": cmd_backfill_expenses,
+    "backfill-merchants": cmd_backfill_merchants,
+    "migrate-dates": cmd_migrate_dates,
+    "trim-llm-cache": cmd_trim_llm_cache,
+    "process-recurring": cmd_process_recurring,
+    "poll-prices": cmd_poll_prices,
+    "rebuild-rankings": cmd_rebuild_rankings,
+    "rebuild-user-stats": cmd_rebuild_user_stats,
+    "weekly-reports": cmd_weekly_reports,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Finote backend maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("ensure-indexes", help="create every index in INDEX_SPECS")
+    sub.add_parser("check-indexes", help="fail if any canonical route query does a COLLSCAN")
+    sub.add_parser("backfill-expenses", help="set write-time derived fields on older expenses")
+    sub.add_parser("migrate-dates", help="add native/IST date fields, then rebuild rollups and budgets (stop writes first)")
+    sub.add_parser("poll-prices", help="fetch every price tracker url that is due now")
+    for name, help_text in (
+        ("rebuild-rollups", "recompute expense_rollups from raw expenses (stop writes first)"),
+        ("check-rollups", "report rollups that disagree with raw expenses"),
+        ("reconcile-budgets", "recompute budget current_spent from raw expenses"),
+        ("process-recurring", "write every due recurring transaction now"),
+        ("rebuild-user-stats", "recompute badge counters from raw expenses, income and badges"),
+    ):
+        command = sub.add_parser(name, help=help_text)
+        command.add_argument("--user-id", default=None, help="limit to one user")
+    merchants = sub.add_parser("backfill-merchants", help="set merchant_key from MERCHANT_KEYWORDS")
+    merchants.add_argument("--all", action="store_true", help="recompute every expense, not only missing keys")
+    rankings = sub.add_parser("rebuild-rankings", help="recompute savings rankings of the current periods")
+    rankings.add_argument("--all-periods", action="store_true", help="every week and month with data, not only the current ones")
+    reports = sub.add_parser("weekly-reports", help="build, store and email the weekly reports of the 7 days before the run day")
+    reports.add_argument("--run-day", default=None, help="IST date the batch is for; defaults to today")
+    reports.add_argument("--no-email", action="store_true", help="store the reports without sending them")
+    reports.add_argument("--force", action="store_true", help="redo a week that has run already")
+    trim = sub.add_parser("trim-llm-cache", help="evict least recently used LLM cache entries")
+    trim.add_argument("--max-entries", type=int, default=None, help="defaults to LLM_CACHE_MAX_ENTRIES")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            return await COMMANDS[args.command](args)
+        finally:
+            server.client.close()
+
+    sys.exit(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Merchant detection from free-text expense fields.
+
+MERCHANT_KEYWORDS is compiled once into a single regex. Keywords only
+match whole words, so "ola" finds "Ola cab" but not "chocolate" or
+"coca cola", and "prime" doesn't fire on "primer paint".
+"""
+
+import re
+from typing import Callable, Dict, List, Optional
+
+# Common merchants to detect, in priority order: when several match, the
+# earliest entry wins.
+MERCHANT_KEYWORDS = {
+    "Zomato": ["zomato"],
+    "Swiggy": ["swiggy"],
+    "Amazon": ["amazon", "amzn"],
+    "Flipkart": ["flipkart"],
+    "Uber": ["uber"],
+    "Ola": ["ola"],
+    "Netflix": ["netflix"],
+    "Prime Video": ["prime", "amazon video"],
+    "Spotify": ["spotify"],
+    "Starbucks": ["starbucks"],
+    "McDonald's": ["mcdonalds", "mcd", "mcdonald"],
+    "BigBasket": ["bigbasket"],
+    "Blinkit": ["blinkit", "grofers"]
+}
+
+
+def compile_keyword_matcher(keywords: Dict[str, List[str]]) -> Callable[[str], Optional[str]]:
+    """Compile a keyword table into one regex scanned once per string.
+
+    Alternatives are ordered by entry priority inside a lookahead, so every
+    position reports the best keyword starting there, overlaps included.
+    Each keyword must start and end on a word boundary.
+    """
+    names = list(keywords)
+    alternatives = [
+        rf"(?P<k{rank}_{i}>\b{re.escape(kw)}\b)"
+        for rank, name in enumerate(names)
+        for i, kw in enumerate(keywords[name])
+    ]
+    pattern = re.compile(f"(?=(?:{'|'.join(alternatives)}))", re.IGNORECASE)
+
+    def match(text: str) -> Optional[str]:
+        best = None
+        for found in pattern.finditer(text):
+            rank = int(found.lastgroup[1:].split("_")[0])
+            if best is None or rank < best:
+                best = rank
+                if best == 0:
+                    break
+        return names[best] if best is not None else None
+
+    return match
+
+
+match_merchant_keywords = compile_keyword_matcher(MERCHANT_KEYWORDS)
+
+
+def match_merchant(merchant: Optional[str], description: Optional[str]) -> str:
+    """Normalized merchant key for an expense, "Others" when nothing matches"""
+    return match_merchant_keywords(f"{merchant or ''} {description or ''}") or "Others"
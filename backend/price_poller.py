@@ -0,0 +1,322 @@
+"""
+Fetches tracked product pages and pulls the current price out of them.
+
+- One pooled, keep-alive httpx client for every fetch, with a global cap on
+  requests in flight.
+- Per-host politeness: at most `per_host` requests to one host at a time,
+  and at least `delay` seconds between the starts of two of them.
+- Conditional requests: the ETag and Last-Modified of the previous fetch go
+  back as If-None-Match / If-Modified-Since, so an unchanged page is a
+  bodiless 304.
+- Pluggable extractors: register_extractor() adds a function that turns a
+  page into a price, optionally only for some hosts. The built-in ones read
+  schema.org JSON-LD, itemprop and Open Graph product price markup.
+- A target that can't be fetched or parsed, for whatever reason, comes back
+  with status "error" rather than failing the rest of the batch.
+- Tracker URLs come from users, so only http(s) is fetched, every request
+  (redirect hops included) is refused if its host resolves to a loopback,
+  private, link-local or otherwise non-public address, and bodies are read
+  up to `max_bytes` only.
+"""
+
+import asyncio
+import ipaddress
+import json
+import re
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+USER_AGENT = "FinotePriceTracker/1.0 (+https://finote.app/bot)"
+
+Extractor = Callable[[str], Optional[float]]
+
+# (host suffix or None for any host, extractor), tried in order
+EXTRACTORS: List[Tuple[Optional[str], Extractor]] = []
+
+
+def register_extractor(host: Optional[str] = None):
+    """Decorator adding an extractor; host-specific ones are tried before generic ones"""
+    def decorator(extractor: Extractor) -> Extractor:
+        if host:
+            EXTRACTORS.insert(0, (host.lower(), extractor))
+        else:
+            EXTRACTORS.append((None, extractor))
+        return extractor
+    return decorator
+
+
+def parse_price(text: Any) -> Optional[float]:
+    """'₹1,299.00', 'Rs. 1299', 1299 -> 1299.0; None if there is no positive number"""
+    if isinstance(text, (int, float)):
+        return float(text) if text > 0 else None
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", str(text))
+    if not match:
+        return None
+    value = float(match.group().replace(",", ""))
+    return value if value > 0 else None
+
+
+JSON_LD_PATTERN = re.compile(r'<script[^>]+application/ld\+json[^>]*>(.*?)</script>', re.IGNORECASE | re.DOTALL)
+
+
+def _offer_price(node: Any) -> Optional[float]:
+    if isinstance(node, list):
+        for item in node:
+            price = _offer_price(item)
+            if price:
+                return price
+        return None
+    if not isinstance(node, dict):
+        return None
+    for key in ("price", "lowPrice"):
+        if key in node:
+            price = parse_price(node[key])
+            if price:
+                return price
+    for key in ("offers", "@graph", "priceSpecification"):
+        if key in node:
+            price = _offer_price(node[key])
+            if price:
+                return price
+    return None
+
+
+@register_extractor()
+def json_ld_price(html: str) -> Optional[float]:
+    for block in JSON_LD_PATTERN.findall(html):
+        try:
+            price = _offer_price(json.loads(block))
+        except ValueError:
+            continue
+        if price:
+            return price
+    return None
+
+
+META_PRICE_PATTERNS = [
+    re.compile(r'<meta[^>]+(?:property|name)=["\'](?:product|og):price:amount["\'][^>]*content=["\']([^"\']+)', re.IGNORECASE),
+    re.compile(r'<meta[^>]+content=["\']([^"\']+)["\'][^>]*(?:property|name)=["\'](?:product|og):price:amount', re.IGNORECASE),
+    re.compile(r'itemprop=["\']price["\'][^>]*content=["\']([^"\']+)', re.IGNORECASE),
+    re.compile(r'content=["\']([^"\']+)["\'][^>]*itemprop=["\']price["\']', re.IGNORECASE),
+]
+
+
+@register_extractor()
+def meta_price(html: str) -> Optional[float]:
+    for pattern in META_PRICE_PATTERNS:
+        match = pattern.search(html)
+        if match:
+            price = parse_price(match.group(1))
+            if price:
+                return price
+    return None
+
+
+def extract_price(url: str, html: str) -> Optional[float]:
+    host = (urlsplit(url).hostname or "").lower()
+    for suffix, extractor in EXTRACTORS:
+        if suffix and not (host == suffix or host.endswith("." + suffix)):
+            continue
+        price = extractor(html)
+        if price:
+            return price
+    return None
+
+
+class UnsafeURL(ValueError):
+    """A URL the poller won't fetch: not http(s), no host, or a non-public address"""
+
+
+def check_url(url: str) -> str:
+    """Syntactic check for a tracker URL; returns it unchanged or raises UnsafeURL"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https"):
+        raise UnsafeURL("only http and https URLs can be tracked")
+    if not parts.hostname:
+        raise UnsafeURL("URL has no host")
+    try:
+        parts.port
+    except ValueError:
+        raise UnsafeURL("URL has an invalid port")
+    try:
+        address = ipaddress.ip_address(parts.hostname)
+    except ValueError:
+        return url  # a name; checked again once resolved
+    if not is_public(address):
+        raise UnsafeURL(f"{parts.hostname} is not a public address")
+    return url
+
+
+def is_public(address) -> bool:
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.is_global and not address.is_multicast
+
+
+async def check_resolved(url: str):
+    """Resolve the URL's host and raise UnsafeURL unless every address it resolves to is public"""
+    check_url(url)
+    parts = urlsplit(url)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            parts.hostname, parts.port or (443 if parts.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except socket.gaierror as e:
+        raise UnsafeURL(f"cannot resolve {parts.hostname}: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not is_public(address):
+            raise UnsafeURL(f"{parts.hostname} resolves to non-public address {address}")
+
+
+class PageTooLarge(Exception):
+    """The response body is longer than the poller's max_bytes"""
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a minimum gap between request starts"""
+
+    def __init__(self, per_host: int, delay: float):
+        self.per_host = per_host
+        self.delay = delay
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.last_start: Dict[str, float] = {}
+
+    async def acquire(self, host: str):
+        semaphore = self.semaphores.setdefault(host, asyncio.Semaphore(self.per_host))
+        await semaphore.acquire()
+        try:
+            async with self.locks.setdefault(host, asyncio.Lock()):
+                wait = self.last_start.get(host, float("-inf")) + self.delay - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self.last_start[host] = time.monotonic()
+        except BaseException:
+            # Cancelled while waiting out the delay: give the slot back
+            semaphore.release()
+            raise
+
+    def release(self, host: str):
+        self.semaphores[host].release()
+
+
+class PricePoller:
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        per_host: int = 2,
+        delay: float = 1.0,
+        timeout: float = 15.0,
+        max_bytes: int = 2 * 1024 * 1024,
+        allow_private_hosts: bool = False,
+        on_metric: Optional[Callable[[str, float], None]] = None
+    ):
+        # The request hook runs for the first request and for every redirect hop
+        hooks = {"request": [] if allow_private_hosts else [self._check_request]}
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT, "Accept": "text/html,application/xhtml+xml"},
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=timeout,
+            follow_redirects=True,
+            max_redirects=5,
+            event_hooks=hooks
+        )
+        self.max_bytes = max_bytes
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.hosts = HostLimiter(per_host, delay)
+        self.on_metric = on_metric or (lambda name, value: None)
+
+    @staticmethod
+    async def _check_request(request: httpx.Request):
+        await check_resolved(str(request.url))
+
+    async def _read(self, url: str, headers: Dict[str, str]) -> Tuple[httpx.Response, bytes]:
+        """GET url, reading at most max_bytes of the body"""
+        async with self.client.stream("GET", url, headers=headers) as response:
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > self.max_bytes:
+                raise PageTooLarge(f"{length} bytes")
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body += chunk
+                if len(body) > self.max_bytes:
+                    raise PageTooLarge(f"over {self.max_bytes} bytes")
+        return response, bytes(body)
+
+    async def fetch(self, target: Dict[str, Any]) -> Dict[str, Any]:
+        """Fetch one target {url, etag?, last_modified?}.
+
+        Returns its status (fetched, not_modified, no_price or error) with
+        the price and the validators to send next time.
+        """
+        url = target["url"]
+        host = (urlsplit(url).hostname or "").lower()
+        headers = {}
+        if target.get("etag"):
+            headers["If-None-Match"] = target["etag"]
+        if target.get("last_modified"):
+            headers["If-Modified-Since"] = target["last_modified"]
+        result = {"url": url, "price": None, "etag": target.get("etag"), "last_modified": target.get("last_modified")}
+
+        # Host first, so requests waiting out a politeness delay don't hold global slots
+        await self.hosts.acquire(host)
+        try:
+            async with self.slots:
+                started = time.monotonic()
+                try:
+                    response, body = await self._read(url, headers)
+                except Exception as e:
+                    # Not only httpx.HTTPError: InvalidURL, UnsafeURL, PageTooLarge, ...
+                    self.on_metric("price_poll.errors", 1)
+                    return {**result, "status": "error", "error": f"{type(e).__name__}: {e}"}
+                finally:
+                    self.on_metric("price_poll.fetches", 1)
+                    self.on_metric("price_poll.fetch_seconds_total", time.monotonic() - started)
+        finally:
+            self.hosts.release(host)
+
+        if response.status_code == 304:
+            self.on_metric("price_poll.not_modified", 1)
+            return {**result, "status": "not_modified"}
+        if response.status_code != 200:
+            self.on_metric("price_poll.errors", 1)
+            return {**result, "status": "error", "error": f"HTTP {response.status_code}"}
+
+        self.on_metric("price_poll.bytes", len(body))
+        result["etag"] = response.headers.get("ETag")
+        result["last_modified"] = response.headers.get("Last-Modified")
+        try:
+            price = extract_price(str(response.url), body.decode(response.encoding or "utf-8", errors="replace"))
+        except Exception as e:
+            self.on_metric("price_poll.errors", 1)
+            return {**result, "status": "error", "error": f"extractor {type(e).__name__}: {e}"}
+        if price is None:
+            self.on_metric("price_poll.no_price", 1)
+            return {**result, "status": "no_price"}
+        self.on_metric("price_poll.prices", 1)
+        return {**result, "status": "fetched", "price": price}
+
+    async def poll(self, targets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fetch every target concurrently, within the global and per-host limits.
+
+        Always returns one result per target, in order.
+        """
+        results = await asyncio.gather(*(self.fetch(target) for target in targets), return_exceptions=True)
+        for index, result in enumerate(results):
+            if isinstance(result, BaseException):
+                self.on_metric("price_poll.errors", 1)
+                results[index] = {
+                    "url": targets[index].get("url"), "price": None, "status": "error",
+                    "etag": targets[index].get("etag"), "last_modified": targets[index].get("last_modified"),
+                    "error": f"{type(result).__name__}: {result}"
+                }
+        return results
+
+    async def aclose(self):
+        await self.client.aclose()
+
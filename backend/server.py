@@ -1,21 +1,43 @@
 
 # Railway deployment - Auto-triggered
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, APIRouter, UploadFile, File, Form, HTTPException, Body, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson import ObjectId
 import os
+import asyncio
+import calendar
+import contextlib
+import functools
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime, timezone, timedelta
+from datetime import date, datetime, timezone, timedelta
 import base64
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+import hashlib
+import html
 import io
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
 import json
+import re
+import time
+from cachetools import TTLCache
+from temporal_features import columns_from_rows, compute_features
+from categorizer import Categorizer
+from mailer import Mailer
+from price_poller import PricePoller, UnsafeURL, check_url
+from voice_parser import parse_voice
+from merchants import match_merchant, match_merchant_keywords
+from jobs import JOB_INDEXES, JobQueue
+from llm_gateway import CircuitBreaker, EmergentBackend, LLMGateway, LLMUnavailable, OpenAICompatibleBackend
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -47,6 +69,7 @@ class Expense(BaseModel):
     currency: str = "INR"
     is_regret: bool = False
     user_id: str = "default_user"
+    possible_duplicate_of: Optional[str] = None
 
 class Income(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -98,7 +121,7 @@ class CategoryBudget(BaseModel):
     current_spent: float = 0.0
     currency: str = "INR"
     user_id: str = "default_user"
-    month: str = Field(default_factory=lambda: datetime.now(timezone.utc).strftime("%Y-%m"))
+    month: str = Field(default_factory=lambda: current_local_month())
 
 class RecurringTransaction(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -147,9 +170,16 @@ class Badge(BaseModel):
 
 class VoiceExpenseRequest(BaseModel):
     voice_text: str
+    user_id: str = "default_user"
 
 class ReceiptAnalysisRequest(BaseModel):
     image_base64: str
+    user_id: str = "default_user"
+
+class PriceUpdate(BaseModel):
+    tracker_id: str
+    price: float
+    date: Optional[str] = None  # ISO; defaults to now
 
 class AITwinRequest(BaseModel):
     message: str
@@ -157,28 +187,833 @@ class AITwinRequest(BaseModel):
 
 # ============ HELPER FUNCTIONS ============
 
-async def get_ai_response(prompt: str, system_message: str = "You are a helpful financial assistant.") -> str:
-    """Get AI response using emergent integrations"""
+# Our users are in India; "local day" bucketing uses IST
+LOCAL_TZ = timezone(timedelta(hours=5, minutes=30))
+
+def parse_date(value: str) -> datetime:
+    """Parse a stored ISO date string; naive timestamps are UTC, bare dates are IST midnight"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=LOCAL_TZ if len(value) == 10 else timezone.utc)
+    return parsed
+
+def local_day(value: str) -> str:
+    return parse_date(value).astimezone(LOCAL_TZ).strftime("%Y-%m-%d")
+
+def current_local_month() -> str:
+    return datetime.now(LOCAL_TZ).strftime("%Y-%m")
+
+# Stored alongside the ISO `date` string, which stays the wire format.
+# date_at is the native BSON datetime for range queries; the local_* fields
+# are IST buckets so analytics never re-parse dates per row.
+DATE_FIELDS = ["date_at", "local_date", "local_month", "local_hour", "local_weekday"]
+
+def date_fields(value: str) -> Dict[str, Any]:
+    """Native and IST-local forms of an ISO date string; raises ValueError if unparseable"""
+    at = parse_date(value).astimezone(timezone.utc)
+    local = at.astimezone(LOCAL_TZ)
+    return {
+        "date_at": at,
+        "local_date": local.strftime("%Y-%m-%d"),
+        "local_month": local.strftime("%Y-%m"),
+        "local_hour": local.hour,
+        "local_weekday": local.weekday()
+    }
+
+def date_bound(value: str, end: bool = False) -> Dict[str, datetime]:
+    """Range operator for a start/end filter; a bare YYYY-MM-DD covers the whole IST day"""
     try:
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=str(uuid.uuid4()),
-            system_message=system_message
-        ).with_model("openai", "gpt-4o-mini")
-        
-        user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
-        return response
-    except Exception as e:
+        if len(value) == 10:
+            day = datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=LOCAL_TZ)
+            return {"$lt": day + timedelta(days=1)} if end else {"$gte": day}
+        return {"$lte" if end else "$gte": parse_date(value)}
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
+
+# ============ METRICS ============
+
+# Process-local counters (cache hits/misses and friends), read via /metrics
+metrics: Dict[str, float] = {}
+
+def incr_metric(name: str, value: float = 1):
+    metrics[name] = metrics.get(name, 0) + value
+
+# ============ LLM ============
+
+LLM_PROVIDER = "openai"
+LLM_MODEL = "gpt-4o-mini"
+# Point at any OpenAI-compatible endpoint (or a local stub) instead of Emergent
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL")
+
+def build_llm_gateway() -> LLMGateway:
+    """Every LLM call goes through this one gateway (see llm_gateway.py)"""
+    if LLM_BASE_URL:
+        backend = OpenAICompatibleBackend(LLM_BASE_URL, os.environ.get("LLM_API_KEY", ""), LLM_MODEL)
+    else:
+        backend = EmergentBackend(EMERGENT_LLM_KEY, LLM_PROVIDER, LLM_MODEL)
+    return LLMGateway(
+        backend,
+        max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "16")),
+        per_user_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY_PER_USER", "2")),
+        timeout=float(os.environ.get("LLM_TIMEOUT_SECONDS", "30")),
+        queue_timeout=float(os.environ.get("LLM_QUEUE_TIMEOUT_SECONDS", "10")),
+        breaker=CircuitBreaker(
+            failure_threshold=int(os.environ.get("LLM_BREAKER_FAILURES", "5")),
+            reset_seconds=float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30"))
+        ),
+        on_metric=incr_metric
+    )
+
+llm_gateway = build_llm_gateway()
+
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful financial assistant."
+AI_UNAVAILABLE_MESSAGE = "AI service temporarily unavailable. Please try again."
+
+async def get_ai_response(
+    prompt: str,
+    system_message: str = DEFAULT_SYSTEM_MESSAGE,
+    cacheable: bool = False,
+    cache_ttl: Optional[int] = None,
+    user_id: Optional[str] = None
+) -> str:
+    """Get AI response through the LLM gateway; cacheable calls go through db.llm_cache"""
+    key = llm_cache_key(system_message, prompt) if cacheable else None
+    if key:
+        cached = await llm_cache_get(key)
+        if cached is not None:
+            return cached
+    try:
+        response = await llm_gateway.complete(prompt, system_message, user_id=user_id)
+    except LLMUnavailable as e:
         logging.error(f"AI Error: {str(e)}")
-        return "AI service temporarily unavailable. Please try again."
+        return AI_UNAVAILABLE_MESSAGE
+    if key:
+        await llm_cache_put(key, response, cache_ttl)
+    return response
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def stream_completion(
+    request: Request,
+    prompt: str,
+    system_message: str,
+    respond,
+    user_id: Optional[str] = None,
+    cacheable: bool = False
+) -> StreamingResponse:
+    """SSE variant of get_ai_response.
+
+    Emits a `token` event per chunk as the model writes, then one `done`
+    event whose data is respond(full_text), i.e. the body the non-streaming
+    route returns. On failure the last event is `error` instead. When the
+    client goes away the upstream generation is closed with it.
+    """
+    async def events():
+        key = llm_cache_key(system_message, prompt) if cacheable else None
+        cached = await llm_cache_get(key) if key else None
+        if cached is not None:
+            yield sse_event("token", {"text": cached})
+            yield sse_event("done", respond(cached))
+            return
+        parts = []
+        try:
+            async with contextlib.aclosing(llm_gateway.stream(prompt, system_message, user_id=user_id)) as chunks:
+                async for chunk in chunks:
+                    if await request.is_disconnected():
+                        incr_metric("llm.stream_disconnects")
+                        return
+                    parts.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+        except LLMUnavailable as e:
+            logging.error(f"AI Error: {str(e)}")
+            yield sse_event("error", {"message": AI_UNAVAILABLE_MESSAGE})
+            return
+        text = "".join(parts)
+        if key:
+            await llm_cache_put(key, text)
+        yield sse_event("done", respond(text))
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============ LLM RESPONSE CACHE ============
+
+# Responses for identical (model, system message, prompt) inputs are stored
+# in db.llm_cache under a content hash, so they survive restarts and are
+# shared by every worker. Only call sites that pass cacheable=True use it;
+# free-form advice built from a user's live numbers is never cached.
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_TRIM_EVERY = 200  # inserts between size checks
+
+def normalize_prompt(prompt: str) -> str:
+    """Whitespace and case differences alone shouldn't miss the cache"""
+    return " ".join(prompt.split()).casefold()
+
+def llm_cache_key(system_message: str, prompt: str) -> str:
+    material = json.dumps([LLM_PROVIDER, LLM_MODEL, system_message, normalize_prompt(prompt)])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+async def llm_cache_get(key: str) -> Optional[str]:
+    now = datetime.now(timezone.utc)
+    try:
+        doc = await db.llm_cache.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_used_at": now}, "$inc": {"hits": 1}},
+            {"response": 1}
+        )
+    except Exception as e:
+        logging.error(f"LLM cache read failed: {str(e)}")
+        return None
+    incr_metric("llm_cache.hits" if doc else "llm_cache.misses")
+    return doc["response"] if doc else None
+
+async def llm_cache_put(key: str, response: str, ttl: Optional[int] = None):
+    now = datetime.now(timezone.utc)
+    try:
+        await db.llm_cache.replace_one(
+            {"_id": key},
+            {
+                "_id": key,
+                "model": f"{LLM_PROVIDER}/{LLM_MODEL}",
+                "response": response,
+                "created_at": now,
+                "last_used_at": now,
+                "expires_at": now + timedelta(seconds=ttl or LLM_CACHE_TTL),
+                "hits": 0
+            },
+            upsert=True
+        )
+    except Exception as e:
+        logging.error(f"LLM cache write failed: {str(e)}")
+        return
+    incr_metric("llm_cache.stores")
+    if metrics["llm_cache.stores"] % LLM_CACHE_TRIM_EVERY == 0:
+        await trim_llm_cache()
+
+async def trim_llm_cache(max_entries: Optional[int] = None) -> int:
+    """Evict least recently used entries beyond max_entries; returns the number removed"""
+    max_entries = LLM_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    excess = await db.llm_cache.estimated_document_count() - max_entries
+    if excess <= 0:
+        return 0
+    oldest = await db.llm_cache.find({}, {"_id": 1}).sort("last_used_at", ASCENDING).limit(excess).to_list(excess)
+    result = await db.llm_cache.delete_many({"_id": {"$in": [doc["_id"] for doc in oldest]}})
+    incr_metric("llm_cache.evictions", result.deleted_count)
+    return result.deleted_count
+
+# ============ ANALYTICS CACHE ============
+
+# Computed analytics responses are cached per user under a data version that
+# every write route bumps, so a write invalidates by making old keys
+# unreachable rather than by deleting them. The in-process tier is an LRU
+# with a TTL; the optional shared tier (ANALYTICS_CACHE_SHARED=1) lets
+# several workers reuse each other's results through db.analytics_cache.
+ANALYTICS_CACHE_SIZE = int(os.environ.get("ANALYTICS_CACHE_SIZE", "2048"))
+ANALYTICS_CACHE_TTL = int(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", "300"))
+ANALYTICS_CACHE_SHARED = os.environ.get("ANALYTICS_CACHE_SHARED", "").lower() in ("1", "true", "yes")
+
+analytics_cache = TTLCache(maxsize=ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL)
+
+async def user_data_version(user_id: str) -> int:
+    doc = await db.user_versions.find_one({"_id": user_id})
+    return doc["version"] if doc else 0
+
+async def bump_data_version(user_id: Optional[str]):
+    """Invalidate cached analytics for one user, or for everyone when user_id is None"""
+    if user_id is None:
+        await db.user_versions.update_many({}, {"$inc": {"version": 1}})
+    else:
+        await db.user_versions.update_one({"_id": user_id}, {"$inc": {"version": 1}}, upsert=True)
+
+async def cached_analytics(name: str, user_id: str, params: Dict[str, Any], compute) -> Any:
+    """Return the cached result for (name, user, data version, params), computing it on a miss"""
+    version = await user_data_version(user_id)
+    key = f"{name}:{user_id}:{version}:{json.dumps(params, sort_keys=True, default=str)}"
+
+    if key in analytics_cache:
+        incr_metric("analytics_cache.local_hits")
+        return analytics_cache[key]
+
+    if ANALYTICS_CACHE_SHARED:
+        shared = await db.analytics_cache.find_one({"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        if shared:
+            incr_metric("analytics_cache.shared_hits")
+            analytics_cache[key] = shared["value"]
+            return shared["value"]
+
+    incr_metric("analytics_cache.misses")
+    value = jsonable_encoder(await compute())
+    analytics_cache[key] = value
+    if ANALYTICS_CACHE_SHARED:
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=ANALYTICS_CACHE_TTL)
+        await db.analytics_cache.replace_one(
+            {"_id": key},
+            {"_id": key, "user_id": user_id, "value": value, "expires_at": expires_at},
+            upsert=True
+        )
+    return value
+
+def analytics_cached(name: str):
+    """Route decorator: serve the route's response from cached_analytics"""
+    def decorator(route):
+        @functools.wraps(route)
+        async def wrapper(**kwargs):
+            return await cached_analytics(name, kwargs["user_id"], kwargs, lambda: route(**kwargs))
+        return wrapper
+    return decorator
+
+# ============ PAGINATION ============
+
+# List routes page newest-first on (date_at, id); id breaks ties between rows
+# sharing a timestamp so no row is skipped or repeated across pages. Rows the
+# date migration hasn't reached yet have no date_at, which sorts lowest, so
+# they make up the last pages, newest id first, until the migration runs.
+KEYSET_SORT = [("date_at", DESCENDING), ("id", DESCENDING)]
+STREAM_BATCH_SIZE = 500
+
+# Write-time fields that never go back over the wire
+INTERNAL_FIELDS = ["search_words", "dup_key", "merchant_key", "category_corrected"] + DATE_FIELDS
+LIST_PROJECTION = {"_id": 0, **{field: 0 for field in INTERNAL_FIELDS}}
+# Same, but keeping date_at for callers that still need it
+KEYSET_PROJECTION = {k: v for k, v in LIST_PROJECTION.items() if k != "date_at"}
+
+def public_row(doc: Dict[str, Any]) -> Dict[str, Any]:
+    for field in INTERNAL_FIELDS:
+        doc.pop(field, None)
+    return doc
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque `after` token pointing just past doc"""
+    date_at = doc.get("date_at")
+    raw = json.dumps([date_at.isoformat() if date_at else None, doc["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        date_at, doc_id = json.loads(raw)
+        return (datetime.fromisoformat(date_at) if date_at is not None else None), doc_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def keyset_filter(after: tuple) -> Dict[str, Any]:
+    date_at, doc_id = after
+    if date_at is None:
+        # Already among the rows without date_at; null matches a missing field
+        return {"date_at": None, "id": {"$lt": doc_id}}
+    return {"$or": [
+        {"date_at": {"$lt": date_at}},
+        {"date_at": date_at, "id": {"$lt": doc_id}},
+        {"date_at": None}
+    ]}
+
+def with_keyset(query: Dict[str, Any], after: Optional[str]) -> Dict[str, Any]:
+    if not after:
+        return query
+    keyset = keyset_filter(decode_cursor(after))
+    if query.keys() & keyset.keys():
+        return {"$and": [query, keyset]}
+    return {**query, **keyset}
+
+async def paginate(collection, query: Dict[str, Any], after: Optional[str], limit: int) -> Dict[str, Any]:
+    """Fetch one keyset page; reads limit + 1 rows to know whether more exist"""
+    docs = await collection.find(with_keyset(query, after), KEYSET_PROJECTION).sort(KEYSET_SORT).limit(limit + 1).to_list(limit + 1)
+    has_more = len(docs) > limit
+    items = docs[:limit]
+    next_cursor = encode_cursor(items[-1]) if has_more else None
+    return {
+        "items": [public_row(doc) for doc in items],
+        "count": len(items),
+        "has_more": has_more,
+        "next_cursor": next_cursor
+    }
+
+def stream_ndjson(collection, query: Dict[str, Any]) -> StreamingResponse:
+    """Stream every matching row as NDJSON straight off the Motor cursor"""
+    async def rows():
+        cursor = collection.find(query, LIST_PROJECTION).sort(KEYSET_SORT).batch_size(STREAM_BATCH_SIZE)
+        try:
+            async for doc in cursor:
+                yield json.dumps(doc, default=str) + "\n"
+        finally:
+            await cursor.close()
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+# ============ INDEXES ============
+
+def _id_index() -> IndexModel:
+    return IndexModel([("id", ASCENDING)], name="id_unique", unique=True)
+
+# One spec list per collection. Applied idempotently on startup; changing an
+# index means giving it a new name so create_indexes doesn't conflict.
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "expenses": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING), ("date_at", DESCENDING), ("id", DESCENDING)], name="user_date_at_id"),
+        IndexModel([("user_id", ASCENDING), ("category", ASCENDING), ("date_at", DESCENDING)], name="user_category_date_at"),
+        IndexModel([("user_id", ASCENDING), ("local_month", ASCENDING)], name="user_local_month"),
+        IndexModel([("user_id", ASCENDING), ("dup_key", ASCENDING)], name="user_dup_key"),
+        IndexModel([("user_id", ASCENDING), ("merchant_key", ASCENDING)], name="user_merchant_key"),
+        IndexModel([("user_id", ASCENDING), ("search_words", ASCENDING)], name="user_search_words"),
+        IndexModel([("date_at", ASCENDING)], name="date_at"),
+    ],
+    "income": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING), ("date_at", DESCENDING), ("id", DESCENDING)], name="user_date_at_id"),
+        IndexModel([("date_at", ASCENDING)], name="date_at"),
+    ],
+    "subscriptions": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING), ("is_active", ASCENDING)], name="user_active"),
+    ],
+    "price_trackers": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING)], name="user"),
+        IndexModel([("next_poll_at", ASCENDING)], name="next_poll_at", sparse=True),
+    ],
+    "savings_rankings": [
+        IndexModel(
+            [("granularity", ASCENDING), ("period", ASCENDING), ("user_id", ASCENDING)],
+            name="granularity_period_user_unique",
+            unique=True
+        ),
+        IndexModel(
+            [("granularity", ASCENDING), ("period", ASCENDING), ("savings_percentage", DESCENDING), ("user_id", ASCENDING)],
+            name="granularity_period_savings"
+        ),
+    ],
+    "price_alerts": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created_at"),
+    ],
+    "price_points": [
+        IndexModel([("tracker_id", ASCENDING), ("bucket_at", ASCENDING)], name="tracker_bucket_unique", unique=True),
+    ],
+    "goals": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING)], name="user"),
+    ],
+    "budgets": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING), ("month", ASCENDING), ("category", ASCENDING)], name="user_month_category", unique=True),
+    ],
+    "recurring_transactions": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING), ("is_active", ASCENDING)], name="user_active"),
+        IndexModel([("is_active", ASCENDING), ("next_due_at", ASCENDING)], name="active_next_due"),
+    ],
+    "debts": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING)], name="user"),
+    ],
+    "badges": [
+        _id_index(),
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING)], name="user_name_unique", unique=True),
+    ],
+    "user_stats": [
+        IndexModel([("user_id", ASCENDING)], name="user_unique", unique=True),
+    ],
+    "preferences": [
+        IndexModel([("user_id", ASCENDING)], name="user_unique", unique=True),
+    ],
+    "jobs": JOB_INDEXES,
+    "receipt_scans": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "analytics_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "llm_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("last_used_at", ASCENDING)], name="last_used_at"),
+    ],
+    "expense_rollups": [
+        IndexModel(
+            [("user_id", ASCENDING), ("granularity", ASCENDING), ("period", ASCENDING), ("category", ASCENDING)],
+            name="user_granularity_period_category",
+            unique=True
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("granularity", ASCENDING), ("category", ASCENDING), ("period", ASCENDING)],
+            name="user_granularity_category_period"
+        ),
+        IndexModel([("granularity", ASCENDING), ("period", ASCENDING)], name="granularity_period"),
+    ],
+    "categorizer_models": [
+        IndexModel([("version", ASCENDING)], name="version"),
+    ],
+    "weekly_reports": [
+        IndexModel([("user_id", ASCENDING), ("week_end", ASCENDING)], name="user_week_end_unique", unique=True),
+        IndexModel([("week_end", ASCENDING), ("emailed_at", ASCENDING)], name="week_end_emailed_at"),
+    ],
+}
+
+# Canonical query of each route: (collection, filter, sort). Every one of these
+# must be served by an index; verify_indexes() fails on any COLLSCAN.
+CANONICAL_QUERIES: List[tuple] = [
+    ("expenses", {"user_id": "default_user"}, None),
+    ("expenses", {"user_id": "default_user", **keyset_filter((datetime(2024, 1, 1), "x"))}, KEYSET_SORT),
+    ("expenses", {"id": "x"}, None),
+    ("expenses", {"user_id": "default_user", "date_at": {"$gte": datetime(2024, 1, 1)}}, [("amount", -1)]),
+    ("expenses", {"user_id": "default_user", "category": "Food", "date_at": {"$gte": datetime(2024, 1, 1)}}, None),
+    ("expenses", {"user_id": "default_user", "local_month": "2024-01"}, None),
+    ("expenses", {"user_id": "default_user", "category": "Food"}, None),
+    ("expenses", {"user_id": "default_user", "dup_key": "12.00|Food|2024-01-01", "id": {"$ne": "x"}}, None),
+    ("expenses", {"user_id": "default_user", "$and": [{"search_words": {"$regex": "^chai"}}]}, None),
+    ("income", {"user_id": "default_user"}, None),
+    ("income", {"user_id": "default_user", **keyset_filter((datetime(2024, 1, 1), "x"))}, KEYSET_SORT),
+    ("income", {"user_id": "default_user", "date_at": {"$gte": datetime(2024, 1, 1)}}, None),
+    ("subscriptions", {"user_id": "default_user", "is_active": True}, None),
+    ("subscriptions", {"id": "x"}, None),
+    ("price_trackers", {"user_id": "default_user"}, None),
+    ("price_trackers", {"id": "x"}, None),
+    ("price_trackers", {"id": {"$in": ["x", "y"]}}, None),
+    ("price_trackers", {"next_poll_at": {"$lte": datetime(2024, 1, 1)}}, [("next_poll_at", 1)]),
+    ("savings_rankings", {"granularity": "month", "period": "2024-01", "savings_percentage": {"$type": "number"}}, [("savings_percentage", -1), ("user_id", 1)]),
+    ("savings_rankings", {"granularity": "month", "period": "2024-01", "user_id": "default_user"}, None),
+    ("price_alerts", {"user_id": "default_user"}, [("created_at", -1)]),
+    ("price_points", {"tracker_id": "x", "bucket_at": {"$gte": datetime(2024, 1, 1)}}, None),
+    ("goals", {"user_id": "default_user"}, None),
+    ("goals", {"id": "x"}, None),
+    ("budgets", {"user_id": "default_user", "month": "2024-01"}, None),
+    ("budgets", {"user_id": "default_user", "category": "Food", "month": "2024-01"}, None),
+    ("budgets", {"user_id": "default_user", "month": {"$lt": "2024-01"}}, [("month", -1)]),
+    ("recurring_transactions", {"user_id": "default_user", "is_active": True}, None),
+    ("recurring_transactions", {"id": "x"}, None),
+    ("recurring_transactions", {"is_active": True, "next_due_at": {"$lte": datetime(2024, 1, 1)}}, [("next_due_at", 1)]),
+    ("debts", {"user_id": "default_user"}, None),
+    ("debts", {"id": "x"}, None),
+    ("badges", {"user_id": "default_user"}, None),
+    ("user_stats", {"user_id": "default_user"}, None),
+    ("weekly_reports", {"user_id": "default_user", "generated_at": {"$gte": datetime(2024, 1, 1)}}, [("week_end", -1)]),
+    ("weekly_reports", {"week_end": "2024-01-07", "emailed_at": None, "user_id": {"$in": ["x"]}}, None),
+    ("expense_rollups", {"granularity": "day", "period": {"$gte": "2024-01-01", "$lte": "2024-01-07"}}, None),
+    ("expenses", {"date_at": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 1, 8)}}, None),
+    ("income", {"date_at": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2024, 1, 8)}}, None),
+    ("preferences", {"user_id": "default_user"}, None),
+    ("expense_rollups", {"user_id": "default_user", "granularity": "month"}, None),
+    ("expense_rollups", {"user_id": "default_user", "granularity": "day", "period": {"$gte": "2024-01-01", "$lte": "2024-01-31"}}, None),
+    ("expense_rollups", {"user_id": "default_user", "granularity": "month", "category": "Food"}, None),
+]
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """Create every index in INDEX_SPECS; safe to run repeatedly"""
+    created = {}
+    for collection, specs in INDEX_SPECS.items():
+        try:
+            created[collection] = await db[collection].create_indexes(specs)
+        except Exception as e:
+            logging.error(f"Index creation failed for {collection}: {str(e)}")
+    return created
+
+def _plan_stages(plan: Any) -> List[str]:
+    """Flatten every stage name in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+async def verify_indexes() -> List[Dict[str, Any]]:
+    """Explain each canonical query and return the ones that still do a COLLSCAN"""
+    failures = []
+    for collection, query, sort in CANONICAL_QUERIES:
+        cursor = db[collection].find(query, {"_id": 0})
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        if "COLLSCAN" in stages:
+            failures.append({"collection": collection, "query": query, "stages": stages})
+    return failures
+
+# ============ ROLLUPS ============
+
+# expense_rollups holds one document per (user_id, granularity, period,
+# category) with running totals, kept current with $inc on every expense
+# write. Periods are the IST local_date / local_month of each expense.
+ROLLUP_GRANULARITIES = {"day": "local_date", "month": "local_month"}
+
+def rollup_updates(doc: Dict[str, Any], sign: int) -> List[UpdateOne]:
+    amount = doc["amount"] * sign
+    is_regret = doc.get("is_regret", False)
+    inc = {
+        "total": amount,
+        "count": sign,
+        "regret_total": amount if is_regret else 0,
+        "regret_count": sign if is_regret else 0
+    }
+    return [
+        UpdateOne(
+            {
+                "user_id": doc["user_id"],
+                "granularity": granularity,
+                "period": doc[field],
+                "category": doc["category"]
+            },
+            {"$inc": inc},
+            upsert=True
+        )
+        for granularity, field in ROLLUP_GRANULARITIES.items()
+    ]
+
+async def apply_expense_rollup(doc: Dict[str, Any], sign: int = 1):
+    """Add (sign=1) or remove (sign=-1) one expense from the rollups"""
+    await db.expense_rollups.bulk_write(rollup_updates(doc, sign), ordered=False)
+
+def rollup_pipeline(granularity: str, match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Recompute rollup documents for one granularity straight from db.expenses"""
+    regret_flag = {"$eq": ["$is_regret", True]}
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "period": f"${ROLLUP_GRANULARITIES[granularity]}",
+                "category": "$category"
+            },
+            "total": {"$sum": "$amount"},
+            "count": {"$sum": 1},
+            "regret_total": {"$sum": {"$cond": [regret_flag, "$amount", 0]}},
+            "regret_count": {"$sum": {"$cond": [regret_flag, 1, 0]}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "granularity": granularity,
+            "period": "$_id.period",
+            "category": "$_id.category",
+            "total": 1,
+            "count": 1,
+            "regret_total": 1,
+            "regret_count": 1
+        }}
+    ]
+
+async def rebuild_rollups(user_id: Optional[str] = None) -> int:
+    """Recompute rollups for one user (or everyone) from raw expenses.
+
+    Documents are replaced in place and only keys the rebuild didn't produce
+    are removed afterwards, so readers never see empty rollups. Not safe
+    while expenses are being written: an $inc landing between a
+    granularity's aggregate and its $merge is overwritten. Run it from
+    maintenance.py rebuild-rollups with writes stopped.
+    """
+    match = {"user_id": user_id} if user_id else {}
+    started = datetime.now(timezone.utc)
+    for granularity in ROLLUP_GRANULARITIES:
+        pipeline = rollup_pipeline(granularity, match) + [
+            {"$set": {"rebuilt_at": {"$literal": started}}},
+            {"$merge": {
+                "into": "expense_rollups",
+                "on": ["user_id", "granularity", "period", "category"],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ]
+        await db.expenses.aggregate(pipeline).to_list(None)
+    # Periods and categories no expense maps to any more
+    await db.expense_rollups.delete_many({**match, "rebuilt_at": {"$ne": started}})
+    await bump_data_version(user_id)
+    return await db.expense_rollups.count_documents(match)
+
+async def check_rollups(user_id: Optional[str] = None, tolerance: float = 0.01) -> List[Dict[str, Any]]:
+    """Compare stored rollups with a fresh recompute and return every mismatch"""
+    match = {"user_id": user_id} if user_id else {}
+    key_fields = ("user_id", "granularity", "period", "category")
+    value_fields = ("total", "count", "regret_total", "regret_count")
+    
+    expected = {}
+    for granularity in ROLLUP_GRANULARITIES:
+        async for row in db.expenses.aggregate(rollup_pipeline(granularity, match)):
+            expected[tuple(row[k] for k in key_fields)] = row
+    
+    mismatches = []
+    async for row in db.expense_rollups.find({**match, "count": {"$ne": 0}}, {"_id": 0}):
+        key = tuple(row[k] for k in key_fields)
+        want = expected.pop(key, None)
+        if want is None or any(abs(row.get(f, 0) - want[f]) > tolerance for f in value_fields):
+            mismatches.append({"key": dict(zip(key_fields, key)), "stored": row, "expected": want})
+    for key, want in expected.items():
+        mismatches.append({"key": dict(zip(key_fields, key)), "stored": None, "expected": want})
+    return mismatches
+
+async def apply_expense_write(doc: Dict[str, Any], sign: int = 1, streak: bool = True):
+    """Apply one expense to every write-time counter (rollups, budgets, rankings, badges, data version, categorizer)"""
+    if "local_date" not in doc:
+        # Written before the date migration reached it
+        doc.update(date_fields(doc["date"]))
+    await asyncio.gather(
+        apply_expense_rollup(doc, sign),
+        apply_budget_spend(doc, sign),
+        db.savings_rankings.bulk_write(ranking_updates(doc, "expenses", sign)),
+        update_user_stats(doc["user_id"], expense_stats_change([doc], sign, streak)),
+        bump_data_version(doc["user_id"])
+    )
+    learn_expense_category(doc, sign)
+
+def group_by_user(docs: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in docs:
+        groups.setdefault(doc["user_id"], []).append(doc)
+    return groups
+
+async def apply_expense_writes(docs: List[Dict[str, Any]]):
+    """apply_expense_write for a batch of new expenses, one bulk write per collection"""
+    if not docs:
+        return
+    await asyncio.gather(
+        db.expense_rollups.bulk_write([u for doc in docs for u in rollup_updates(doc, 1)], ordered=False),
+        db.budgets.bulk_write([budget_spend_update(doc) for doc in docs], ordered=False),
+        db.savings_rankings.bulk_write([u for doc in docs for u in ranking_updates(doc, "expenses")], ordered=False),
+        *(update_user_stats(user_id, expense_stats_change(user_docs)) for user_id, user_docs in group_by_user(docs).items()),
+        *(bump_data_version(user_id) for user_id in {doc["user_id"] for doc in docs})
+    )
+    for doc in docs:
+        learn_expense_category(doc, 1)
+
+async def apply_income_writes(docs: List[Dict[str, Any]]):
+    """Apply new income to the savings rankings and data versions"""
+    if not docs:
+        return
+    await asyncio.gather(
+        db.savings_rankings.bulk_write([u for doc in docs for u in ranking_updates(doc, "income")], ordered=False),
+        *(update_user_stats(user_id, income_stats_change(user_docs)) for user_id, user_docs in group_by_user(docs).items()),
+        *(bump_data_version(user_id) for user_id in {doc["user_id"] for doc in docs})
+    )
+
+async def insert_new(collection, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """insert_many that skips documents whose id already exists; returns the ones inserted"""
+    if not docs:
+        return []
+    try:
+        await collection.insert_many(docs, ordered=False)
+        return docs
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error["code"] != 11000 for error in errors):
+            raise
+        existing = {error["index"] for error in errors}
+        return [doc for index, doc in enumerate(docs) if index not in existing]
+
+DERIVED_FIELDS = DATE_FIELDS + ["dup_key", "merchant_key", "search_words"]
+
+def with_derived_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the fields computed at write time so reads can use them from an index"""
+    doc.update(date_fields(doc["date"]))
+    doc["dup_key"] = duplicate_key(doc)
+    doc["merchant_key"] = match_merchant(doc.get("merchant"), doc.get("description"))
+    doc["search_words"] = sorted(set(tokenize(f"{doc.get('merchant') or ''} {doc.get('description') or ''}")))
+    return doc
+
+async def backfill_derived_fields(batch_size: int = 1000) -> int:
+    """Set DERIVED_FIELDS on expenses written before those fields existed"""
+    missing = {"$or": [{field: {"$exists": False}} for field in DERIVED_FIELDS]}
+    updated = 0
+    batch = []
+    async for doc in db.expenses.find(missing, {"_id": 1, "id": 1, "amount": 1, "category": 1, "date": 1, "merchant": 1, "description": 1}):
+        try:
+            derived = with_derived_fields(dict(doc))
+        except ValueError:
+            logging.error(f"Skipping expense {doc.get('id')} with unparseable date {doc.get('date')!r}")
+            continue
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {f: derived[f] for f in DERIVED_FIELDS}}))
+        if len(batch) >= batch_size:
+            updated += (await db.expenses.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.expenses.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+async def backfill_income_dates(batch_size: int = 1000) -> int:
+    """Set DATE_FIELDS on income written before those fields existed"""
+    updated = 0
+    batch = []
+    async for doc in db.income.find({"date_at": {"$exists": False}}, {"_id": 1, "id": 1, "date": 1}):
+        try:
+            fields = date_fields(doc["date"])
+        except ValueError:
+            logging.error(f"Skipping income {doc.get('id')} with unparseable date {doc.get('date')!r}")
+            continue
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields}))
+        if len(batch) >= batch_size:
+            updated += (await db.income.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.income.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+async def migrate_dates(with_rollups: bool = False) -> Dict[str, int]:
+    """Migration to native/local date fields, then budget counters on IST periods.
+
+    The backfills are safe to run while serving: new writes already carry
+    the fields and the backfills only touch documents missing them.
+    Rebuilding the rollups on IST periods is not (see rebuild_rollups), so
+    the startup migration leaves them to maintenance.py migrate-dates, which
+    passes with_rollups=True and is run with writes stopped.
+    """
+    expenses = await backfill_derived_fields()
+    income = await backfill_income_dates()
+    result = {"expenses": expenses, "income": income}
+    if with_rollups:
+        result["rollups"] = await rebuild_rollups()
+    else:
+        logging.info("Date migration done; rollups on old periods need maintenance.py rebuild-rollups with writes stopped")
+    result["budgets_corrected"] = await reconcile_budgets()
+    return result
+
+# Online migrations run once per database, in the background at startup.
+# db.migrations holds a marker per migration so only one worker runs it.
+MIGRATIONS = {"native_dates": migrate_dates}
+
+async def run_migrations():
+    for name, migration in MIGRATIONS.items():
+        try:
+            await db.migrations.insert_one({"_id": name, "status": "running", "started_at": datetime.now(timezone.utc)})
+        except DuplicateKeyError:
+            continue  # finished already, or another worker has it
+        try:
+            result = await migration()
+            await db.migrations.update_one(
+                {"_id": name},
+                {"$set": {"status": "done", "result": result, "finished_at": datetime.now(timezone.utc)}}
+            )
+            logging.info(f"Migration {name} finished: {result}")
+        except Exception as e:
+            logging.error(f"Migration {name} failed: {str(e)}")
+            # Drop the marker so the next startup retries
+            await db.migrations.delete_one({"_id": name})
+
+def expense_document(expense: Expense) -> Dict[str, Any]:
+    try:
+        return with_derived_fields(expense.model_dump())
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid expense date: {expense.date}")
+
+async def insert_expense(expense: Expense) -> Dict[str, Any]:
+    """Insert an expense and keep every derived counter in step"""
+    doc = expense_document(expense)
+    await db.expenses.insert_one(doc)
+    await apply_expense_write(doc, 1)
+    return doc
 
 # ============ EXPENSE ROUTES ============
 
 @api_router.post("/expenses", response_model=Expense)
-async def create_expense(expense: Expense):
-    doc = expense.model_dump()
-    await db.expenses.insert_one(doc)
+async def create_expense(expense: Expense, check_duplicate: bool = True):
+    if check_duplicate:
+        duplicate = await find_duplicate(expense_document(expense))
+        if duplicate:
+            expense.possible_duplicate_of = duplicate["id"]
+    await insert_expense(expense)
     return expense
 
 @api_router.get("/expenses", response_model=List[Expense])
@@ -186,27 +1021,57 @@ async def get_expenses(user_id: str = "default_user"):
     expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
     return expenses
 
+@api_router.get("/expenses/page")
+async def get_expenses_page(
+    user_id: str = "default_user",
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    return await paginate(db.expenses, {"user_id": user_id}, after, limit)
+
+@api_router.get("/expenses/stream")
+async def stream_expenses(user_id: str = "default_user"):
+    return stream_ndjson(db.expenses, {"user_id": user_id})
+
 @api_router.delete("/expenses/{expense_id}")
 async def delete_expense(expense_id: str):
-    result = await db.expenses.delete_one({"id": expense_id})
-    if result.deleted_count == 0:
+    deleted = await db.expenses.find_one_and_delete({"id": expense_id}, {"_id": 0})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Expense not found")
+    await apply_expense_write(deleted, -1)
     return {"message": "Expense deleted successfully"}
 
 @api_router.put("/expenses/{expense_id}", response_model=Expense)
 async def update_expense(expense_id: str, expense: Expense):
-    doc = expense.model_dump()
-    result = await db.expenses.replace_one({"id": expense_id}, doc)
-    if result.matched_count == 0:
+    doc = expense_document(expense)
+    previous = await db.expenses.find_one_and_replace(
+        {"id": expense_id}, doc, {"_id": 0}, return_document=ReturnDocument.BEFORE
+    )
+    if not previous:
         raise HTTPException(status_code=404, detail="Expense not found")
+    if previous.get("category_corrected") or previous["category"] != doc["category"]:
+        # A hand-fixed category is a stronger training label than a recorded one
+        doc["category_corrected"] = True
+        await db.expenses.update_one({"id": doc["id"]}, {"$set": {"category_corrected": True}})
+    await apply_expense_write(previous, -1, streak=False)
+    await apply_expense_write(doc, 1, streak=False)
     return expense
 
 # ============ INCOME ROUTES ============
 
-@api_router.post("/income", response_model=Income)
-async def create_income(income: Income):
+async def insert_income(income: Income) -> Dict[str, Any]:
     doc = income.model_dump()
+    try:
+        doc.update(date_fields(doc["date"]))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid income date: {income.date}")
     await db.income.insert_one(doc)
+    await apply_income_writes([doc])
+    return doc
+
+@api_router.post("/income", response_model=Income)
+async def create_income(income: Income):
+    await insert_income(income)
     return income
 
 @api_router.get("/income", response_model=List[Income])
@@ -214,12 +1079,25 @@ async def get_income(user_id: str = "default_user"):
     income = await db.income.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
     return income
 
+@api_router.get("/income/page")
+async def get_income_page(
+    user_id: str = "default_user",
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    return await paginate(db.income, {"user_id": user_id}, after, limit)
+
+@api_router.get("/income/stream")
+async def stream_income(user_id: str = "default_user"):
+    return stream_ndjson(db.income, {"user_id": user_id})
+
 # ============ SUBSCRIPTION ROUTES ============
 
 @api_router.post("/subscriptions", response_model=Subscription)
 async def create_subscription(subscription: Subscription):
     doc = subscription.model_dump()
     await db.subscriptions.insert_one(doc)
+    await bump_data_version(subscription.user_id)
     return subscription
 
 @api_router.get("/subscriptions", response_model=List[Subscription])
@@ -229,9 +1107,10 @@ async def get_subscriptions(user_id: str = "default_user"):
 
 @api_router.delete("/subscriptions/{subscription_id}")
 async def delete_subscription(subscription_id: str):
-    result = await db.subscriptions.delete_one({"id": subscription_id})
-    if result.deleted_count == 0:
+    deleted = await db.subscriptions.find_one_and_delete({"id": subscription_id}, {"_id": 0, "user_id": 1})
+    if not deleted:
         raise HTTPException(status_code=404, detail="Subscription not found")
+    await bump_data_version(deleted["user_id"])
     return {"message": "Subscription deleted successfully"}
 
 @api_router.get("/subscriptions/total")
@@ -245,11 +1124,206 @@ async def get_total_subscription_cost(user_id: str = "default_user"):
 
 # ============ PRICE TRACKER ROUTES ============
 
+# Price points live in db.price_points, one bucket document per tracker per
+# IST day, appended to with an upserted $push so concurrent updates never
+# lose a point and a write costs the same however long the history is.
+# The tracker keeps current_price and a short embedded tail (price_history,
+# capped with $slice) for existing clients; charts read the buckets.
+PRICE_HISTORY_RECENT = 30
+PRICE_BULK_MAX = 5000
+ALERT_FIELDS = {"_id": 0, "id": 1, "user_id": 1, "product_name": 1, "current_price": 1, "target_price": 1, "price_updated_at": 1}
+
+def price_bucket_at(at: datetime) -> datetime:
+    """UTC instant of the IST midnight starting the day that holds `at`"""
+    local = at.astimezone(LOCAL_TZ)
+    return datetime(local.year, local.month, local.day, tzinfo=LOCAL_TZ).astimezone(timezone.utc)
+
+def price_point_update(tracker_id: str, price: float, at: datetime) -> UpdateOne:
+    return UpdateOne(
+        {"tracker_id": tracker_id, "bucket_at": price_bucket_at(at)},
+        {
+            "$push": {"points": {"at": at, "price": price}},
+            "$min": {"min": price, "first_at": at},
+            "$max": {"max": price, "last_at": at},
+            "$inc": {"count": 1}
+        },
+        upsert=True
+    )
+
+async def write_price_points(updates: List[UpdateOne]):
+    """Upsert bucket appends; an upsert that raced another one onto the same new bucket is retried"""
+    try:
+        await db.price_points.bulk_write(updates, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error["code"] != 11000 for error in errors):
+            raise
+        # The bucket exists now, so the retry is a plain append
+        await db.price_points.bulk_write([updates[error["index"]] for error in errors], ordered=False)
+
+def price_history_push(price: float, at: datetime) -> Dict[str, Any]:
+    """$push of one point into the embedded tail, kept in date order and capped"""
+    return {"price_history": {
+        "$each": [{"price": price, "date": at.astimezone(timezone.utc).isoformat()}],
+        "$sort": {"date": 1},
+        "$slice": -PRICE_HISTORY_RECENT
+    }}
+
+def tracker_price_change(price: float, at: datetime) -> Dict[str, Any]:
+    """Update for a point known to be the newest, e.g. one recorded now"""
+    return {"$set": {"current_price": price, "price_updated_at": at}, "$push": price_history_push(price, at)}
+
+def tracker_price_updates(tracker_id: str, price: float, at: datetime) -> List[UpdateOne]:
+    """Updates for a point of any age: it joins the tail in order, and only moves
+    current_price if it is newer than the price the tracker holds"""
+    return [
+        UpdateOne({"id": tracker_id}, {"$push": price_history_push(price, at)}),
+        UpdateOne(
+            {"id": tracker_id, "$or": [{"price_updated_at": {"$lt": at}}, {"price_updated_at": None}]},
+            {"$set": {"current_price": price, "price_updated_at": at}}
+        )
+    ]
+
+def newer_than_current(tracker: Dict[str, Any], at: datetime) -> bool:
+    updated = tracker.get("price_updated_at")
+    return updated is None or at > as_utc(updated)
+
+def target_price_alerts(trackers: Dict[str, Dict[str, Any]], points: List[tuple]) -> List[Dict[str, Any]]:
+    """One alert per point that takes a tracker from above its target_price to at or below it.
+
+    points are oldest first. Only points newer than the tracker's stored
+    current price count; backfilled history never raises an alert.
+    """
+    previous = {tracker_id: tracker.get("current_price") for tracker_id, tracker in trackers.items()}
+    alerts = []
+    for tracker_id, price, at in points:
+        tracker = trackers[tracker_id]
+        if not newer_than_current(tracker, at):
+            continue
+        target = tracker.get("target_price")
+        before = previous[tracker_id]
+        if target is not None and price <= target and (before is None or before > target):
+            alerts.append({
+                "id": str(uuid.uuid4()),
+                "tracker_id": tracker_id,
+                "user_id": tracker["user_id"],
+                "product_name": tracker["product_name"],
+                "price": price,
+                "previous_price": before,
+                "target_price": target,
+                "created_at": at
+            })
+        previous[tracker_id] = price
+    return alerts
+
+async def fire_price_alerts(alerts: List[Dict[str, Any]]):
+    if not alerts:
+        return
+    await db.price_alerts.insert_many(alerts)
+    incr_metric("price_alerts.fired", len(alerts))
+    for alert in alerts:
+        logging.info(f"Price alert for {alert['user_id']}: {alert['product_name']} at {alert['price']} (target {alert['target_price']})")
+
+async def record_prices(updates: List[PriceUpdate]) -> Dict[str, Any]:
+    """Append many price points at once; unknown tracker ids are reported, not written"""
+    ids = list({update.tracker_id for update in updates})
+    trackers = {doc["id"]: doc for doc in await db.price_trackers.find({"id": {"$in": ids}}, ALERT_FIELDS).to_list(None)}
+    known = trackers.keys()
+    points = []
+    for update in updates:
+        if update.tracker_id not in known:
+            continue
+        try:
+            at = parse_date(update.date).astimezone(timezone.utc) if update.date else datetime.now(timezone.utc)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid price date: {update.date}")
+        points.append((update.tracker_id, update.price, at))
+    # Oldest first, so each tracker's current_price ends on its newest point;
+    # points older than the tracker's current price only join the history
+    points.sort(key=lambda point: point[2])
+    if points:
+        await write_price_points([price_point_update(*point) for point in points])
+        await db.price_trackers.bulk_write([
+            update for point in points for update in tracker_price_updates(*point)
+        ])
+    alerts = target_price_alerts(trackers, points)
+    await fire_price_alerts(alerts)
+    return {"updated": len(points), "alerts": len(alerts), "unknown_trackers": sorted(set(ids) - known)}
+
+async def price_series(tracker_id: str, interval: str, point_range: Dict[str, datetime]) -> List[Dict[str, Any]]:
+    """min/max/last price per interval (IST calendar), oldest first; point_range holds date_bound operators"""
+    bucket_match: Dict[str, Any] = {"tracker_id": tracker_id}
+    if point_range:
+        # A bucket starts at or before its points, so the upper bound carries over
+        # as is and the lower bound moves back to the start of its day
+        bucket_range = {op: value for op, value in point_range.items() if op != "$gte"}
+        if "$gte" in point_range:
+            bucket_range["$gte"] = price_bucket_at(point_range["$gte"])
+        bucket_match["bucket_at"] = bucket_range
+    pipeline: List[Dict[str, Any]] = [
+        {"$match": bucket_match},
+        {"$unwind": "$points"},
+    ]
+    if point_range:
+        pipeline.append({"$match": {"points.at": point_range}})
+    pipeline += [
+        {"$sort": {"points.at": 1}},
+        {"$group": {
+            "_id": {"$dateTrunc": {"date": "$points.at", "unit": interval, "timezone": "+05:30", "startOfWeek": "monday"}},
+            "min": {"$min": "$points.price"},
+            "max": {"$max": "$points.price"},
+            "last": {"$last": "$points.price"},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"_id": 1}}
+    ]
+    rows = await db.price_points.aggregate(pipeline).to_list(None)
+    return [
+        {"date": as_utc(row["_id"]).isoformat(), "min": row["min"], "max": row["max"], "last": row["last"], "count": row["count"]}
+        for row in rows
+    ]
+
+async def migrate_price_history(batch_size: int = 500) -> int:
+    """Copy embedded price_history into db.price_points and cap the embedded list"""
+    # Points recorded after this started were written to the buckets already
+    cutoff = datetime.now(timezone.utc)
+    migrated = 0
+    async for tracker in db.price_trackers.find({"history_bucketed": {"$exists": False}}, {"_id": 0, "id": 1, "price_history": 1}):
+        points = []
+        for entry in tracker.get("price_history") or []:
+            try:
+                at = parse_date(entry["date"]).astimezone(timezone.utc)
+                if at < cutoff:
+                    points.append(price_point_update(tracker["id"], entry["price"], at))
+            except (KeyError, TypeError, ValueError):
+                logging.error(f"Skipping price point {entry!r} of tracker {tracker['id']}")
+        for i in range(0, len(points), batch_size):
+            await write_price_points(points[i:i + batch_size])
+        await db.price_trackers.update_one(
+            {"id": tracker["id"]},
+            {"$set": {"history_bucketed": True}, "$push": {"price_history": {"$each": [], "$slice": -PRICE_HISTORY_RECENT}}}
+        )
+        migrated += 1
+    return migrated
+
+MIGRATIONS["price_history_buckets"] = migrate_price_history
+
 @api_router.post("/price-tracker", response_model=PriceTracker)
 async def create_price_tracker(tracker: PriceTracker):
-    tracker.price_history = [{"price": tracker.current_price, "date": datetime.now(timezone.utc).isoformat()}]
+    if tracker.url:
+        try:
+            check_url(tracker.url)
+        except UnsafeURL as e:
+            raise HTTPException(status_code=400, detail=f"Invalid tracker url: {str(e)}")
+    now = datetime.now(timezone.utc)
+    tracker.price_history = [{"price": tracker.current_price, "date": now.isoformat()}]
     doc = tracker.model_dump()
+    doc["price_updated_at"] = now
+    doc["history_bucketed"] = True
+    if tracker.url:
+        doc["next_poll_at"] = now
     await db.price_trackers.insert_one(doc)
+    await write_price_points([price_point_update(tracker.id, tracker.current_price, now)])
     return tracker
 
 @api_router.get("/price-tracker", response_model=List[PriceTracker])
@@ -259,17 +1333,153 @@ async def get_price_trackers(user_id: str = "default_user"):
 
 @api_router.put("/price-tracker/{tracker_id}/update-price")
 async def update_price(tracker_id: str, new_price: float = Body(..., embed=True)):
-    tracker = await db.price_trackers.find_one({"id": tracker_id}, {"_id": 0})
-    if not tracker:
+    now = datetime.now(timezone.utc)
+    previous = await db.price_trackers.find_one_and_update(
+        {"id": tracker_id}, tracker_price_change(new_price, now), {"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not previous:
         raise HTTPException(status_code=404, detail="Tracker not found")
-    
-    price_entry = {"price": new_price, "date": datetime.now(timezone.utc).isoformat()}
-    tracker["price_history"].append(price_entry)
+    await write_price_points([price_point_update(tracker_id, new_price, now)])
+    await fire_price_alerts(target_price_alerts({tracker_id: previous}, [(tracker_id, new_price, now)]))
+    tracker = PriceTracker(**previous).model_dump()
     tracker["current_price"] = new_price
-    
-    await db.price_trackers.replace_one({"id": tracker_id}, tracker)
+    tracker["price_history"] = (tracker["price_history"] + [{"price": new_price, "date": now.isoformat()}])[-PRICE_HISTORY_RECENT:]
     return {"message": "Price updated", "tracker": tracker}
 
+@api_router.post("/price-tracker/bulk-update-price")
+async def bulk_update_prices(updates: List[PriceUpdate]):
+    """Record prices for many trackers in two bulk writes"""
+    if len(updates) > PRICE_BULK_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {PRICE_BULK_MAX} price updates per request")
+    return await record_prices(updates)
+
+@api_router.get("/price-tracker/{tracker_id}/history")
+async def get_price_history(
+    tracker_id: str,
+    interval: str = Query("day", pattern="^(hour|day|week|month)$"),
+    start: Optional[str] = None,
+    end: Optional[str] = None
+):
+    """Downsampled price series for charting: min, max and last price per interval"""
+    tracker = await db.price_trackers.find_one({"id": tracker_id}, {"_id": 0, "id": 1, "product_name": 1, "current_price": 1, "target_price": 1})
+    if not tracker:
+        raise HTTPException(status_code=404, detail="Tracker not found")
+    point_range = {}
+    if start:
+        point_range.update(date_bound(start))
+    if end:
+        point_range.update(date_bound(end, end=True))
+    series = await price_series(tracker_id, interval, point_range)
+    return {**tracker, "interval": interval, "series": series}
+
+@api_router.get("/price-tracker/alerts")
+async def get_price_alerts(user_id: str = "default_user", limit: int = Query(50, ge=1, le=500)):
+    alerts = await db.price_alerts.find({"user_id": user_id}, {"_id": 0}).sort("created_at", DESCENDING).limit(limit).to_list(None)
+    return {"alerts": alerts}
+
+# ============ PRICE POLLING ============
+
+# Trackers with a url carry next_poll_at. Each sweep claims a batch of due
+# trackers by pushing next_poll_at out by a lease and tagging them, so two
+# server processes never fetch the same page; the fetch outcome then sets
+# the real next_poll_at (backing off on repeated failures).
+PRICE_POLL_SECONDS = int(os.environ.get("PRICE_POLL_SECONDS", "300"))
+PRICE_POLL_INTERVAL = int(os.environ.get("PRICE_POLL_INTERVAL_SECONDS", str(6 * 3600)))
+PRICE_POLL_BATCH = int(os.environ.get("PRICE_POLL_BATCH", "100"))
+PRICE_POLL_LEASE = 600
+PRICE_POLL_MAX_BACKOFF = 8  # multiples of PRICE_POLL_INTERVAL
+
+price_poller = PricePoller(
+    max_concurrency=int(os.environ.get("PRICE_POLL_CONCURRENCY", "16")),
+    per_host=int(os.environ.get("PRICE_POLL_PER_HOST", "2")),
+    delay=float(os.environ.get("PRICE_POLL_DELAY_SECONDS", "2.0")),
+    max_bytes=int(os.environ.get("PRICE_POLL_MAX_BYTES", str(2 * 1024 * 1024))),
+    on_metric=incr_metric
+)
+
+async def claim_price_polls(now: datetime) -> tuple:
+    """(lease, trackers) for up to PRICE_POLL_BATCH trackers due at `now`"""
+    due = await db.price_trackers.find(
+        {"next_poll_at": {"$lte": now}}, {"_id": 0, "id": 1}
+    ).sort("next_poll_at", ASCENDING).limit(PRICE_POLL_BATCH).to_list(None)
+    if not due:
+        return None, []
+    lease = str(uuid.uuid4())
+    ids = [doc["id"] for doc in due]
+    # Only the trackers still due are tagged; another process may have taken some
+    await db.price_trackers.update_many(
+        {"id": {"$in": ids}, "next_poll_at": {"$lte": now}},
+        {"$set": {"next_poll_at": now + timedelta(seconds=PRICE_POLL_LEASE), "poll_lease": lease}}
+    )
+    trackers = await db.price_trackers.find(
+        {"id": {"$in": ids}, "poll_lease": lease},
+        {"_id": 0, "id": 1, "url": 1, "etag": 1, "last_modified": 1, "current_price": 1, "poll_failures": 1}
+    ).to_list(None)
+    return lease, trackers
+
+async def poll_price_batch(lease: str, trackers: List[Dict[str, Any]], stats: Dict[str, Any]):
+    results = await price_poller.poll(trackers)
+    now = datetime.now(timezone.utc)
+    prices = []
+    schedule = []
+    for tracker, result in zip(trackers, results):
+        stats[result["status"]] += 1
+        change: Dict[str, Any] = {"etag": result["etag"], "last_modified": result["last_modified"], "last_polled_at": now, "poll_status": result["status"]}
+        if result["status"] == "error":
+            failures = tracker.get("poll_failures", 0) + 1
+            change.update(poll_failures=failures, poll_error=result["error"])
+            wait = PRICE_POLL_INTERVAL * min(2 ** (failures - 1), PRICE_POLL_MAX_BACKOFF)
+        else:
+            change.update(poll_failures=0, poll_error=None)
+            wait = PRICE_POLL_INTERVAL
+            if result["price"] is not None and result["price"] != tracker.get("current_price"):
+                prices.append(PriceUpdate(tracker_id=tracker["id"], price=result["price"], date=now.isoformat()))
+        change["next_poll_at"] = now + timedelta(seconds=wait)
+        schedule.append(UpdateOne({"id": tracker["id"], "poll_lease": lease}, {"$set": change, "$unset": {"poll_lease": ""}}))
+    if prices:
+        recorded = await record_prices(prices)
+        stats["price_changes"] += recorded["updated"]
+        stats["alerts"] += recorded["alerts"]
+    await db.price_trackers.bulk_write(schedule, ordered=False)
+
+async def poll_due_prices() -> Dict[str, Any]:
+    """Fetch every tracker whose next_poll_at has passed, a batch at a time"""
+    started = time.perf_counter()
+    stats = {"trackers": 0, "fetched": 0, "not_modified": 0, "no_price": 0, "error": 0, "price_changes": 0, "alerts": 0}
+    while True:
+        lease, trackers = await claim_price_polls(datetime.now(timezone.utc))
+        if not trackers:
+            break
+        stats["trackers"] += len(trackers)
+        await poll_price_batch(lease, trackers, stats)
+    elapsed = time.perf_counter() - started
+    stats["duration_ms"] = round(elapsed * 1000, 1)
+    stats["trackers_per_second"] = round(stats["trackers"] / elapsed, 1) if elapsed else 0.0
+    incr_metric("price_poll.runs")
+    incr_metric("price_poll.trackers", stats["trackers"])
+    return stats
+
+async def price_poll_loop():
+    while True:
+        try:
+            stats = await poll_due_prices()
+            if stats["trackers"]:
+                logging.info(f"Price poll: {stats}")
+        except Exception as e:
+            logging.error(f"Price poll failed: {str(e)}")
+        await asyncio.sleep(PRICE_POLL_SECONDS)
+
+async def schedule_price_polls() -> int:
+    """Give trackers created before polling existed a next_poll_at"""
+    result = await db.price_trackers.update_many(
+        {"url": {"$nin": [None, ""]}, "next_poll_at": {"$exists": False}},
+        {"$set": {"next_poll_at": datetime.now(timezone.utc)}}
+    )
+    return result.modified_count
+
+MIGRATIONS["price_poll_schedule"] = schedule_price_polls
+
 # ============ GOAL ROUTES ============
 
 @api_router.post("/goals", response_model=Goal)
@@ -320,31 +1530,56 @@ async def get_goal_calculations(goal_id: str):
 # ============ ANALYTICS ROUTES ============
 
 @api_router.get("/analytics/dashboard")
+@analytics_cached("dashboard")
 async def get_dashboard_analytics(user_id: str = "default_user"):
-    # Get all data
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    income = await db.income.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    subscriptions = await db.subscriptions.find({"user_id": user_id, "is_active": True}, {"_id": 0}).to_list(1000)
+    # Aggregate server-side so only the computed numbers cross the wire.
+    # Expense totals come from the monthly rollups rather than raw rows.
+    expense_pipeline = [
+        {"$match": {"user_id": user_id, "granularity": "month"}},
+        {"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "total": {"$sum": "$total"},
+                "regret_total": {"$sum": "$regret_total"},
+                "regret_count": {"$sum": "$regret_count"}
+            }}],
+            "by_category": [
+                {"$group": {"_id": "$category", "amount": {"$sum": "$total"}, "count": {"$sum": "$count"}}},
+                {"$match": {"count": {"$gt": 0}}}
+            ]
+        }}
+    ]
+    income_pipeline = [
+        {"$match": {"user_id": user_id}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+    ]
+    subscription_pipeline = [
+        {"$match": {"user_id": user_id, "is_active": True}},
+        {"$group": {"_id": None, "monthly": {"$sum": {"$cond": [
+            {"$eq": ["$billing_cycle", "monthly"]},
+            "$amount",
+            {"$divide": ["$amount", 12]}
+        ]}}}}
+    ]
     
-    total_expenses = sum(e["amount"] for e in expenses)
-    total_income = sum(i["amount"] for i in income)
+    expense_result, income_result, subscription_result = await asyncio.gather(
+        db.expense_rollups.aggregate(expense_pipeline).to_list(1),
+        db.income.aggregate(income_pipeline).to_list(1),
+        db.subscriptions.aggregate(subscription_pipeline).to_list(1)
+    )
+    
+    expense_facets = expense_result[0] if expense_result else {"totals": [], "by_category": []}
+    expense_totals = expense_facets["totals"][0] if expense_facets["totals"] else {}
+    
+    total_expenses = expense_totals.get("total", 0)
+    total_income = income_result[0]["total"] if income_result else 0
     total_savings = total_income - total_expenses
     
     # Category-wise breakdown
-    category_breakdown = {}
-    for expense in expenses:
-        cat = expense["category"]
-        category_breakdown[cat] = category_breakdown.get(cat, 0) + expense["amount"]
+    category_breakdown = {row["_id"]: row["amount"] for row in expense_facets["by_category"]}
     
     # Monthly subscription cost
-    monthly_subs = sum(
-        sub["amount"] if sub["billing_cycle"] == "monthly" else sub["amount"] / 12
-        for sub in subscriptions
-    )
-    
-    # Regret purchases
-    regret_expenses = [e for e in expenses if e.get("is_regret", False)]
-    total_regret = sum(e["amount"] for e in regret_expenses)
+    monthly_subs = subscription_result[0]["monthly"] if subscription_result else 0
     
     return {
         "total_expenses": total_expenses,
@@ -353,35 +1588,129 @@ async def get_dashboard_analytics(user_id: str = "default_user"):
         "savings_percentage": (total_savings / total_income * 100) if total_income > 0 else 0,
         "category_breakdown": category_breakdown,
         "monthly_subscription_cost": monthly_subs,
-        "total_regret_amount": total_regret,
-        "regret_count": len(regret_expenses)
+        "total_regret_amount": expense_totals.get("regret_total", 0),
+        "regret_count": expense_totals.get("regret_count", 0)
     }
 
+TREND_RESOLUTIONS = ("day", "week", "month")
+
+def trend_bucket(day: datetime, resolution: str) -> datetime:
+    """Start of the bucket holding day; weeks start on Monday like $dateTrunc below"""
+    if resolution == "week":
+        return day - timedelta(days=day.weekday())
+    if resolution == "month":
+        return day.replace(day=1)
+    return day
+
+def next_trend_bucket(bucket: datetime, resolution: str) -> datetime:
+    if resolution == "week":
+        return bucket + timedelta(days=7)
+    if resolution == "month":
+        return (bucket.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return bucket + timedelta(days=1)
+
 @api_router.get("/analytics/trends")
-async def get_spending_trends(user_id: str = "default_user", days: int = 30):
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    
-    # Group by date
-    daily_spending = {}
-    for expense in expenses:
-        date_str = expense["date"][:10]  # Get YYYY-MM-DD
-        daily_spending[date_str] = daily_spending.get(date_str, 0) + expense["amount"]
-    
-    # Sort by date
-    sorted_data = sorted(daily_spending.items(), key=lambda x: x[0])
-    
-    return {
-        "daily_spending": [{
-            "date": date,
-            "amount": amount
-        } for date, amount in sorted_data[-days:]]
+async def get_spending_trends(
+    user_id: str = "default_user",
+    days: int = Query(30, ge=1, le=3660),
+    resolution: str = Query("day", pattern="^(day|week|month)$"),
+    by_category: bool = False
+):
+    """Spending over the last `days` IST days, bucketed by day/week/month with empty buckets filled.
+
+    The window starts at the beginning of the bucket holding its first day,
+    so the first week or month is whole rather than cut off mid-bucket.
+    """
+    today = datetime.strptime(datetime.now(LOCAL_TZ).strftime("%Y-%m-%d"), "%Y-%m-%d")
+    window_start = trend_bucket(today - timedelta(days=days - 1), resolution)
+    
+    # The window is pushed into the match on the daily rollups, so the work
+    # scales with the window rather than with the user's whole history
+    group_id = {"bucket": {"$dateTrunc": {
+        "date": {"$dateFromString": {"dateString": "$period", "format": "%Y-%m-%d"}},
+        "unit": resolution,
+        "startOfWeek": "monday"
+    }}}
+    if by_category:
+        group_id["category"] = "$category"
+    rows = await db.expense_rollups.aggregate([
+        {"$match": {
+            "user_id": user_id,
+            "granularity": "day",
+            "period": {"$gte": window_start.strftime("%Y-%m-%d"), "$lte": today.strftime("%Y-%m-%d")}
+        }},
+        {"$group": {"_id": group_id, "amount": {"$sum": "$total"}, "count": {"$sum": "$count"}}},
+        {"$match": {"count": {"$gt": 0}}}
+    ]).to_list(None)
+    
+    totals = {}
+    categories = {}
+    for row in rows:
+        key = row["_id"]["bucket"].strftime("%Y-%m-%d")
+        totals[key] = totals.get(key, 0) + row["amount"]
+        if by_category:
+            categories.setdefault(key, {})[row["_id"]["category"]] = row["amount"]
+    
+    # Fill every bucket in the window, including ones with no spending
+    series = []
+    bucket = window_start
+    while bucket <= today:
+        key = bucket.strftime("%Y-%m-%d")
+        point = {"date": key, "amount": totals.get(key, 0)}
+        if by_category:
+            point["categories"] = categories.get(key, {})
+        series.append(point)
+        bucket = next_trend_bucket(bucket, resolution)
+    
+    result = {
+        "resolution": resolution,
+        "start": window_start.strftime("%Y-%m-%d"),
+        "end": today.strftime("%Y-%m-%d"),
+        "series": series
     }
+    if resolution == "day":
+        result["daily_spending"] = series  # Name kept for existing clients
+    return result
 
 # ============ VOICE EXPENSE TRACKING ============
 
+# Utterances are parsed in-process by voice_parser (numerals and number
+# words in every supported language, units, merchant/category dictionaries).
+# When the dictionaries don't name a category the learned categorizer gets a
+# say; only an utterance still below VOICE_MIN_CONFIDENCE goes to the LLM.
+VOICE_MIN_CONFIDENCE = float(os.environ.get("VOICE_MIN_CONFIDENCE", "0.75"))
+
+def parse_voice_locally(voice_text: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """Expense fields plus confidence for an utterance resolved without the LLM, else None"""
+    parsed = parse_voice(voice_text, match_merchant_keywords)
+    if parsed["amount"] is None:
+        return None
+    category, confidence = parsed["category"], parsed["confidence"]
+    if category is None and parsed["description"]:
+        category, learned = predict_category(parsed["description"], parsed["merchant"], user_id)
+        confidence = parsed["amount_confidence"] * learned
+    if not category or confidence < VOICE_MIN_CONFIDENCE:
+        return None
+    return {
+        "amount": parsed["amount"],
+        "category": category,
+        "description": parsed["description"] or parsed["merchant"] or category,
+        "merchant": parsed["merchant"],
+        "confidence": confidence
+    }
+
 @api_router.post("/expenses/voice")
 async def create_expense_from_voice(request: VoiceExpenseRequest):
     """Parse voice text and create expense"""
+    local = parse_voice_locally(request.voice_text, request.user_id)
+    if local:
+        incr_metric("voice.local")
+        confidence = local.pop("confidence")
+        expense = Expense(**local, user_id=request.user_id)
+        await insert_expense(expense)
+        return {"success": True, "expense": expense, "parser": "local", "confidence": confidence}
+    incr_metric("voice.llm")
+    
     prompt = f'''Extract expense information from this voice input: "{request.voice_text}"
     
     Return ONLY a valid JSON object with these fields:
@@ -396,7 +1725,7 @@ async def create_expense_from_voice(request: VoiceExpenseRequest):
     Example output: {{"amount": 12, "category": "Food", "description": "Chai", "merchant": null}}
     '''
     
-    ai_response = await get_ai_response(prompt, "You are a JSON extraction assistant. Always return valid JSON only.")
+    ai_response = await get_ai_response(prompt, "You are a JSON extraction assistant. Always return valid JSON only.", cacheable=True, user_id=request.user_id)
     
     try:
         # Clean the response
@@ -415,24 +1744,36 @@ async def create_expense_from_voice(request: VoiceExpenseRequest):
             amount=expense_data["amount"],
             category=expense_data["category"],
             description=expense_data["description"],
-            merchant=expense_data.get("merchant")
+            merchant=expense_data.get("merchant"),
+            user_id=request.user_id
         )
         
-        doc = expense.model_dump()
-        await db.expenses.insert_one(doc)
+        await insert_expense(expense)
         
-        return {"success": True, "expense": expense}
+        return {"success": True, "expense": expense, "parser": "llm"}
     except Exception as e:
         logging.error(f"Voice parsing error: {str(e)}")
         raise HTTPException(status_code=400, detail="Could not parse voice input")
 
 # ============ RECEIPT SCANNING ============
 
-@api_router.post("/expenses/scan-receipt")
-async def scan_receipt(request: ReceiptAnalysisRequest):
-    """Analyze receipt using AI vision"""
-    try:
-        prompt = '''Analyze this receipt image and extract:
+# Receipts are preprocessed before the vision model sees them: EXIF
+# orientation applied, long edge capped, grayscale, recompressed. Pillow
+# work runs in a small thread pool so it never blocks the event loop.
+# Extractions are cached by the SHA-256 of the original bytes, so scanning
+# the same receipt again doesn't call the model.
+RECEIPT_MAX_BYTES = int(os.environ.get("RECEIPT_MAX_BYTES", str(15 * 1024 * 1024)))
+RECEIPT_LONG_EDGE = int(os.environ.get("RECEIPT_LONG_EDGE", "1600"))
+RECEIPT_FORMAT = os.environ.get("RECEIPT_FORMAT", "JPEG").upper()  # JPEG or WEBP
+RECEIPT_QUALITY = int(os.environ.get("RECEIPT_QUALITY", "80"))
+RECEIPT_CACHE_TTL = int(os.environ.get("RECEIPT_CACHE_TTL_SECONDS", str(90 * 24 * 3600)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+receipt_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RECEIPT_WORKERS", "2")), thread_name_prefix="receipt"
+)
+
+RECEIPT_PROMPT = '''Analyze this receipt image and extract:
         1. Items purchased (name and price)
         2. Total amount
         3. Merchant/Store name
@@ -448,56 +1789,120 @@ async def scan_receipt(request: ReceiptAnalysisRequest):
             "items": [{"name": "item", "price": price}]
         }
         '''
-        
-        from emergentintegrations.llm.chat import ImageContent
-        
-        chat = LlmChat(
-            api_key=EMERGENT_LLM_KEY,
-            session_id=str(uuid.uuid4()),
-            system_message="You are a receipt analysis assistant. Return valid JSON only."
-        ).with_model("openai", "gpt-4o-mini")
-        
-        image_content = ImageContent(image_base64=request.image_base64)
-        user_message = UserMessage(
-            text=prompt,
-            file_contents=[image_content]
-        )
-        
-        response = await chat.send_message(user_message)
-        
-        # Clean response
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response[7:]
-        if response.startswith("```"):
-            response = response[3:]
-        if response.endswith("```"):
-            response = response[:-3]
-        response = response.strip()
-        
-        receipt_data = json.loads(response)
-        
-        # Create expense from receipt
-        expense = Expense(
-            amount=receipt_data["total"],
-            category=receipt_data["category"],
-            description=f"Receipt from {receipt_data['merchant']}",
-            merchant=receipt_data["merchant"]
-        )
-        
-        doc = expense.model_dump()
-        await db.expenses.insert_one(doc)
-        
-        return {"success": True, "receipt_data": receipt_data, "expense": expense}
+
+def preprocess_receipt(source) -> bytes:
+    """Orient, downscale, grayscale and recompress a receipt image (runs in receipt_executor)"""
+    with Image.open(source) as image:
+        # JPEG can decode straight at a reduced scale, skipping most of the pixels
+        image.draft("L", (RECEIPT_LONG_EDGE, RECEIPT_LONG_EDGE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((RECEIPT_LONG_EDGE, RECEIPT_LONG_EDGE), Image.LANCZOS)
+        image = image.convert("L")
+        out = io.BytesIO()
+        image.save(out, format=RECEIPT_FORMAT, quality=RECEIPT_QUALITY, optimize=True)
+        return out.getvalue()
+
+async def extract_receipt(digest: str, source, user_id: str) -> tuple:
+    """(receipt_data, cached) for an image; source is bytes or a readable file object"""
+    cached = await db.receipt_scans.find_one({"_id": digest}, {"receipt_data": 1})
+    if cached:
+        incr_metric("receipt_cache.hits")
+        return cached["receipt_data"], True
+    incr_metric("receipt_cache.misses")
+    
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    loop = asyncio.get_running_loop()
+    try:
+        image = await loop.run_in_executor(receipt_executor, preprocess_receipt, source)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable receipt image: {str(e)}")
+    incr_metric("receipt.processed_bytes", len(image))
+    
+    response = await llm_gateway.complete(
+        RECEIPT_PROMPT,
+        "You are a receipt analysis assistant. Return valid JSON only.",
+        user_id=user_id,
+        images=[base64.b64encode(image).decode()]
+    )
+    
+    # Clean response
+    response = response.strip()
+    if response.startswith("```json"):
+        response = response[7:]
+    if response.startswith("```"):
+        response = response[3:]
+    if response.endswith("```"):
+        response = response[:-3]
+    response = response.strip()
+    
+    receipt_data = json.loads(response)
+    now = datetime.now(timezone.utc)
+    await db.receipt_scans.replace_one(
+        {"_id": digest},
+        {"_id": digest, "receipt_data": receipt_data, "created_at": now, "expires_at": now + timedelta(seconds=RECEIPT_CACHE_TTL)},
+        upsert=True
+    )
+    return receipt_data, False
+
+async def expense_from_receipt(receipt_data: Dict[str, Any], user_id: str, cached: bool) -> Dict[str, Any]:
+    # Create expense from receipt; a rescan of the same receipt is flagged via possible_duplicate_of
+    expense = Expense(
+        amount=receipt_data["total"],
+        category=receipt_data["category"],
+        description=f"Receipt from {receipt_data['merchant']}",
+        merchant=receipt_data["merchant"],
+        user_id=user_id
+    )
+    await create_expense(expense)
+    return {"success": True, "receipt_data": receipt_data, "expense": expense, "cached": cached}
+
+@api_router.post("/expenses/scan-receipt")
+async def scan_receipt(request: ReceiptAnalysisRequest):
+    """Analyze receipt using AI vision"""
+    try:
+        try:
+            raw = base64.b64decode(request.image_base64.split(",")[-1], validate=True)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="image_base64 is not valid base64")
+        if len(raw) > RECEIPT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Receipt image too large")
+        receipt_data, cached = await extract_receipt(hashlib.sha256(raw).hexdigest(), raw, request.user_id)
+        return await expense_from_receipt(receipt_data, request.user_id, cached)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Receipt scan error: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Receipt analysis failed: {str(e)}")
 
+@api_router.post("/expenses/scan-receipt/upload")
+async def scan_receipt_upload(file: UploadFile = File(...), user_id: str = Form("default_user")):
+    """Multipart variant of scan-receipt; the upload is hashed in chunks and decoded from its spool file"""
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > RECEIPT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail="Receipt image too large")
+            digest.update(chunk)
+        await file.seek(0)
+        receipt_data, cached = await extract_receipt(digest.hexdigest(), file.file, user_id)
+        return await expense_from_receipt(receipt_data, user_id, cached)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Receipt scan error: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Receipt analysis failed: {str(e)}")
+    finally:
+        await file.close()
+
 # ============ AI TWIN ============
 
-@api_router.post("/ai-twin/chat")
-async def ai_twin_chat(request: AITwinRequest):
-    """AI financial advisor with multi-language support"""
+AI_TWIN_SYSTEM_MESSAGE = "You are a friendly, knowledgeable financial advisor."
+
+async def ai_twin_prompt(request: AITwinRequest) -> tuple:
+    """(user_id, prompt) for an AI twin question, built from the user's data and language"""
     # Get user's financial data and preferences
     user_id = request.context.get("user_id", "default_user") if request.context else "default_user"
     
@@ -538,16 +1943,29 @@ async def ai_twin_chat(request: AITwinRequest):
     
     Provide helpful, personalized financial advice based on this data.
     '''
-    
-    response = await get_ai_response(context_prompt, "You are a friendly, knowledgeable financial advisor.")
+    return user_id, context_prompt
+
+@api_router.post("/ai-twin/chat")
+async def ai_twin_chat(request: AITwinRequest):
+    """AI financial advisor with multi-language support"""
+    user_id, prompt = await ai_twin_prompt(request)
+    response = await get_ai_response(prompt, AI_TWIN_SYSTEM_MESSAGE, user_id=user_id)
     
     return {"response": response}
 
+@api_router.post("/ai-twin/chat/stream")
+async def ai_twin_chat_stream(request: AITwinRequest, http_request: Request):
+    """SSE variant of /ai-twin/chat"""
+    user_id, prompt = await ai_twin_prompt(request)
+    return stream_completion(
+        http_request, prompt, AI_TWIN_SYSTEM_MESSAGE,
+        lambda text: {"response": text}, user_id=user_id
+    )
+
 # ============ BILL NEGOTIATOR ============
 
-@api_router.post("/bill-negotiator/generate-script")
-async def generate_negotiation_script(bill_type: str = Body(...), current_amount: float = Body(...)):
-    prompt = f'''Generate a negotiation script for a {bill_type} bill that costs ₹{current_amount} per month.
+def negotiation_prompt(bill_type: str, current_amount: float) -> str:
+    return f'''Generate a negotiation script for a {bill_type} bill that costs ₹{current_amount} per month.
     
     Include:
     1. Opening statement
@@ -558,50 +1976,166 @@ async def generate_negotiation_script(bill_type: str = Body(...), current_amount
     
     Make it polite but firm.
     '''
-    
-    script = await get_ai_response(prompt)
+
+@api_router.post("/bill-negotiator/generate-script")
+async def generate_negotiation_script(bill_type: str = Body(...), current_amount: float = Body(...)):
+    script = await get_ai_response(negotiation_prompt(bill_type, current_amount), cacheable=True)
     
     return {"script": script, "bill_type": bill_type}
 
+@api_router.post("/bill-negotiator/generate-script/stream")
+async def generate_negotiation_script_stream(http_request: Request, bill_type: str = Body(...), current_amount: float = Body(...)):
+    """SSE variant of /bill-negotiator/generate-script"""
+    return stream_completion(
+        http_request, negotiation_prompt(bill_type, current_amount), DEFAULT_SYSTEM_MESSAGE,
+        lambda text: {"script": text, "bill_type": bill_type}, cacheable=True
+    )
+
 # ============ CATEGORY BUDGETS ============
 
+# Each budget document carries current_spent for its month, kept current
+# with $inc as expenses land. A new month's documents are rolled over from
+# the latest earlier month the first time that month is read.
+
+def budget_spend_update(doc: Dict[str, Any], sign: int = 1) -> UpdateOne:
+    return UpdateOne(
+        {"user_id": doc["user_id"], "category": doc["category"], "month": doc["local_month"]},
+        {"$inc": {"current_spent": doc["amount"] * sign}}
+    )
+
+async def apply_budget_spend(doc: Dict[str, Any], sign: int = 1):
+    await db.budgets.bulk_write([budget_spend_update(doc, sign)])
+
+async def month_spend_by_category(user_id: str, month: str) -> Dict[str, float]:
+    rollups = await db.expense_rollups.find(
+        {"user_id": user_id, "granularity": "month", "period": month},
+        {"_id": 0, "category": 1, "total": 1}
+    ).to_list(None)
+    return {r["category"]: r["total"] for r in rollups}
+
+async def rollover_budgets(user_id: str, month: str) -> int:
+    """Copy the latest earlier month's budgets into month, seeded from rollups; returns how many month now has"""
+    latest = await db.budgets.find_one(
+        {"user_id": user_id, "month": {"$lt": month}}, {"_id": 0, "month": 1}, sort=[("month", -1)]
+    )
+    if not latest:
+        return 0
+    previous = await db.budgets.find({"user_id": user_id, "month": latest["month"]}, {"_id": 0}).to_list(None)
+    spent = await month_spend_by_category(user_id, month)
+    
+    # Upsert on (user, month, category), which is unique, so concurrent rollovers converge
+    updates = []
+    for budget in previous:
+        rolled = CategoryBudget(
+            category=budget["category"],
+            monthly_limit=budget["monthly_limit"],
+            current_spent=spent.get(budget["category"], 0),
+            currency=budget.get("currency", "INR"),
+            user_id=user_id,
+            month=month
+        ).model_dump()
+        updates.append(UpdateOne(
+            {"user_id": user_id, "month": month, "category": budget["category"]},
+            {"$setOnInsert": rolled},
+            upsert=True
+        ))
+    try:
+        await db.budgets.bulk_write(updates, ordered=False)
+    except BulkWriteError as e:
+        # Losing an upsert race to another rollover leaves the same budget in place
+        if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+    return len(updates)
+
+async def reconcile_budgets(user_id: Optional[str] = None) -> int:
+    """Recompute current_spent for every budget from raw expenses; returns the number corrected"""
+    match = {"user_id": user_id} if user_id else {}
+    corrected = 0
+    groups = await db.budgets.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"user_id": "$user_id", "month": "$month"}}}
+    ]).to_list(None)
+    for group in groups:
+        owner, month = group["_id"]["user_id"], group["_id"]["month"]
+        totals = await db.expenses.aggregate([
+            {"$match": {"user_id": owner, "local_month": month}},
+            {"$group": {"_id": "$category", "total": {"$sum": "$amount"}}}
+        ]).to_list(None)
+        actual = {t["_id"]: t["total"] for t in totals}
+        async for budget in db.budgets.find({"user_id": owner, "month": month}, {"_id": 0}):
+            expected = actual.get(budget["category"], 0)
+            if abs(budget.get("current_spent", 0) - expected) > 0.01:
+                await db.budgets.update_one({"id": budget["id"]}, {"$set": {"current_spent": expected}})
+                await bump_data_version(owner)
+                corrected += 1
+    return corrected
+
+async def dedupe_budgets() -> Dict[str, int]:
+    """Merge budgets duplicated on (user, month, category) and build the unique index over them"""
+    groups = await db.budgets.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "month": "$month", "category": "$category"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True).to_list(None)
+    removed = 0
+    for group in groups:
+        # Keep the oldest; its counter only saw some of the month's expenses, so reconcile below
+        removed += (await db.budgets.delete_many({"_id": {"$in": group["ids"][1:]}})).deleted_count
+    corrected = 0
+    for owner in {group["_id"]["user_id"] for group in groups}:
+        corrected += await reconcile_budgets(owner)
+    existing = await db.budgets.index_information()
+    if "user_month_category" in existing and not existing["user_month_category"].get("unique"):
+        await db.budgets.drop_index("user_month_category")
+    await db.budgets.create_indexes(INDEX_SPECS["budgets"])
+    return {"duplicates_removed": removed, "budgets_corrected": corrected}
+
+MIGRATIONS["budget_unique_month_category"] = dedupe_budgets
+
 @api_router.post("/budgets", response_model=CategoryBudget)
 async def create_budget(budget: CategoryBudget):
+    """Create a category budget, or change the limit of the one the month already has"""
+    spent = await month_spend_by_category(budget.user_id, budget.month)
+    budget.current_spent = spent.get(budget.category, 0)
     doc = budget.model_dump()
-    await db.budgets.insert_one(doc)
-    return budget
+    limit = {"monthly_limit": doc.pop("monthly_limit"), "currency": doc.pop("currency")}
+    saved = await db.budgets.find_one_and_update(
+        {"user_id": budget.user_id, "month": budget.month, "category": budget.category},
+        {"$set": limit, "$setOnInsert": doc},
+        {"_id": 0},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    await bump_data_version(budget.user_id)
+    return saved
 
 @api_router.get("/budgets", response_model=List[CategoryBudget])
 async def get_budgets(user_id: str = "default_user"):
-    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
+    current_month = current_local_month()
     budgets = await db.budgets.find({"user_id": user_id, "month": current_month}, {"_id": 0}).to_list(1000)
     
-    # Calculate current spent for each budget
-    for budget in budgets:
-        expenses = await db.expenses.find({
-            "user_id": user_id,
-            "category": budget["category"],
-            "date": {"$regex": f"^{current_month}"}
-        }, {"_id": 0}).to_list(1000)
-        budget["current_spent"] = sum(e["amount"] for e in expenses)
+    if not budgets and await rollover_budgets(user_id, current_month):
+        budgets = await db.budgets.find({"user_id": user_id, "month": current_month}, {"_id": 0}).to_list(1000)
     
     return budgets
 
 @api_router.get("/budgets/status/{category}")
 async def get_budget_status(category: str, user_id: str = "default_user"):
-    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
-    budget = await db.budgets.find_one({"user_id": user_id, "category": category, "month": current_month}, {"_id": 0})
+    current_month = current_local_month()
+    query = {"user_id": user_id, "category": category, "month": current_month}
+    budget = await db.budgets.find_one(query, {"_id": 0})
+    
+    if not budget and await rollover_budgets(user_id, current_month):
+        budget = await db.budgets.find_one(query, {"_id": 0})
     
     if not budget:
         return {"status": "no_limit", "message": "No budget set for this category"}
     
-    expenses = await db.expenses.find({
-        "user_id": user_id,
-        "category": category,
-        "date": {"$regex": f"^{current_month}"}
-    }, {"_id": 0}).to_list(1000)
-    
-    current_spent = sum(e["amount"] for e in expenses)
+    current_spent = budget["current_spent"]
     percentage = (current_spent / budget["monthly_limit"]) * 100
     
     if percentage >= 100:
@@ -625,9 +2159,164 @@ async def get_budget_status(category: str, user_id: str = "default_user"):
 
 # ============ RECURRING TRANSACTIONS ============
 
+# Each active transaction carries next_due_at, the IST midnight of its next
+# due date, indexed with is_active. The scheduler sweeps everything due in
+# batches, creates one occurrence per missed period (up to a cap), and
+# advances next_due_at with a conditional write so concurrent sweeps skip it.
+# Occurrence ids are derived from (transaction, due date), so a sweep that is
+# retried after a crash inserts nothing twice.
+RECURRING_SWEEP_SECONDS = int(os.environ.get("RECURRING_SWEEP_SECONDS", "900"))
+RECURRING_BATCH_SIZE = 500
+RECURRING_MAX_CATCH_UP = 12  # most periods filled in for one transaction
+RECURRING_NAMESPACE = uuid.UUID("17d79565-e896-48c7-945b-2c6dc64e211b")
+
+def recurring_due_date(day: int, year: int, month: int) -> date:
+    """The day-of-month in that month, clamped to its last day (31 -> Feb 28)"""
+    return date(year, month, max(1, min(day, calendar.monthrange(year, month)[1])))
+
+def following_due_date(day: int, due: date) -> date:
+    year, month = (due.year + 1, 1) if due.month == 12 else (due.year, due.month + 1)
+    return recurring_due_date(day, year, month)
+
+def first_due_date(day: int, today: date) -> date:
+    due = recurring_due_date(day, today.year, today.month)
+    return due if due >= today else following_due_date(day, due)
+
+def due_at(due: date) -> datetime:
+    return datetime(due.year, due.month, due.day, tzinfo=LOCAL_TZ).astimezone(timezone.utc)
+
+def as_utc(value: datetime) -> datetime:
+    """Motor hands back naive datetimes that are UTC"""
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def recurring_occurrence(trans: Dict[str, Any], due: date) -> Dict[str, Any]:
+    """The expense or income document for one period of a recurring transaction"""
+    occurrence_id = str(uuid.uuid5(RECURRING_NAMESPACE, f"{trans['id']}:{due.isoformat()}"))
+    if trans["transaction_type"] == "expense":
+        return with_derived_fields(Expense(
+            id=occurrence_id,
+            amount=trans["amount"],
+            category=trans["category"],
+            description=f"{trans['name']} (Auto-added)",
+            date=due.isoformat(),
+            currency=trans["currency"],
+            user_id=trans["user_id"]
+        ).model_dump())
+    doc = Income(
+        id=occurrence_id,
+        amount=trans["amount"],
+        source=trans["name"],
+        date=due.isoformat(),
+        currency=trans["currency"],
+        user_id=trans["user_id"]
+    ).model_dump()
+    doc.update(date_fields(doc["date"]))
+    return doc
+
+async def process_recurring_batch(batch: List[Dict[str, Any]], now: datetime, stats: Dict[str, Any]) -> List[str]:
+    """Write every missed occurrence of a batch of due transactions; returns the names processed"""
+    today = now.astimezone(LOCAL_TZ).date()
+    expenses, income, advances, names = [], [], [], []
+    for trans in batch:
+        due = as_utc(trans["next_due_at"]).astimezone(LOCAL_TZ).date()
+        periods = []
+        while due <= today:
+            periods.append(due)
+            due = following_due_date(trans["recurring_date"], due)
+        if len(periods) > RECURRING_MAX_CATCH_UP:
+            stats["periods_dropped"] += len(periods) - RECURRING_MAX_CATCH_UP
+            periods = periods[-RECURRING_MAX_CATCH_UP:]
+        target = expenses if trans["transaction_type"] == "expense" else income
+        target.extend(recurring_occurrence(trans, period) for period in periods)
+        advances.append(UpdateOne(
+            {"id": trans["id"], "next_due_at": trans["next_due_at"]},
+            {"$set": {"next_due_at": due_at(due), "last_processed": now.isoformat()}}
+        ))
+        names.append(trans["name"])
+
+    new_expenses = await insert_new(db.expenses, expenses)
+    new_income = await insert_new(db.income, income)
+    await apply_expense_writes(new_expenses)
+    await apply_income_writes(new_income)
+    # Only after the occurrences exist, so a crash in between is redone, not lost
+    await db.recurring_transactions.bulk_write(advances, ordered=False)
+
+    stats["transactions"] += len(batch)
+    stats["expenses"] += len(new_expenses)
+    stats["income"] += len(new_income)
+    stats["already_written"] += len(expenses) + len(income) - len(new_expenses) - len(new_income)
+    stats["batches"] += 1
+    return names
+
+async def process_due_recurring(user_id: Optional[str] = None, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Sweep every due recurring transaction (one user's, or everyone's) in batches"""
+    now = now or datetime.now(timezone.utc)
+    started = time.perf_counter()
+    stats = {"transactions": 0, "expenses": 0, "income": 0, "already_written": 0, "periods_dropped": 0, "batches": 0}
+    query = {"is_active": True, "next_due_at": {"$lte": now}}
+    if user_id:
+        query["user_id"] = user_id
+    names = []
+    batch = []
+    # Advanced transactions move past `now`, out of the range this cursor walks
+    async for trans in db.recurring_transactions.find(query, {"_id": 0}).sort("next_due_at", ASCENDING).batch_size(RECURRING_BATCH_SIZE):
+        batch.append(trans)
+        if len(batch) >= RECURRING_BATCH_SIZE:
+            names += await process_recurring_batch(batch, now, stats)
+            batch = []
+    if batch:
+        names += await process_recurring_batch(batch, now, stats)
+
+    stats["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    stats["processed"] = names
+    incr_metric("recurring.runs")
+    incr_metric("recurring.transactions", stats["transactions"])
+    incr_metric("recurring.occurrences", stats["expenses"] + stats["income"])
+    incr_metric("recurring.run_seconds_total", stats["duration_ms"] / 1000)
+    metrics["recurring.last_run_ms"] = stats["duration_ms"]
+    return stats
+
+async def recurring_scheduler_loop():
+    while True:
+        try:
+            stats = await process_due_recurring()
+            if stats["transactions"]:
+                logging.info(
+                    f"Recurring sweep: {stats['transactions']} transactions, "
+                    f"{stats['expenses']} expenses, {stats['income']} income in {stats['duration_ms']}ms"
+                )
+        except Exception as e:
+            logging.error(f"Recurring sweep failed: {str(e)}")
+        await asyncio.sleep(RECURRING_SWEEP_SECONDS)
+
+async def backfill_next_due(batch_size: int = 1000) -> int:
+    """Set next_due_at on recurring transactions created before it existed"""
+    today = datetime.now(LOCAL_TZ).date()
+    updated = 0
+    batch = []
+    async for trans in db.recurring_transactions.find({"next_due_at": {"$exists": False}}, {"_id": 1, "recurring_date": 1, "last_processed": 1}):
+        due = first_due_date(trans["recurring_date"], today)
+        if trans.get("last_processed"):
+            try:
+                last = parse_date(trans["last_processed"]).astimezone(LOCAL_TZ).date()
+                # The old processor ran on the due day itself, so resume the month after
+                due = following_due_date(trans["recurring_date"], last)
+            except ValueError:
+                pass
+        batch.append(UpdateOne({"_id": trans["_id"]}, {"$set": {"next_due_at": due_at(due)}}))
+        if len(batch) >= batch_size:
+            updated += (await db.recurring_transactions.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.recurring_transactions.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+MIGRATIONS["recurring_next_due"] = backfill_next_due
+
 @api_router.post("/recurring-transactions", response_model=RecurringTransaction)
 async def create_recurring_transaction(transaction: RecurringTransaction):
     doc = transaction.model_dump()
+    doc["next_due_at"] = due_at(first_due_date(transaction.recurring_date, datetime.now(LOCAL_TZ).date()))
     await db.recurring_transactions.insert_one(doc)
     return transaction
 
@@ -638,70 +2327,49 @@ async def get_recurring_transactions(user_id: str = "default_user"):
 
 @api_router.post("/recurring-transactions/process")
 async def process_recurring_transactions(user_id: str = "default_user"):
-    """Process due recurring transactions"""
-    current_date = datetime.now(timezone.utc)
-    current_day = current_date.day
-    current_month = current_date.strftime("%Y-%m")
-    
-    recurring = await db.recurring_transactions.find({
-        "user_id": user_id,
-        "is_active": True
-    }, {"_id": 0}).to_list(1000)
-    
-    processed = []
-    
-    for trans in recurring:
-        # Check if it's due and not processed this month
-        if trans["recurring_date"] == current_day:
-            last_processed = trans.get("last_processed")
-            if not last_processed or not last_processed.startswith(current_month):
-                # Create the transaction
-                if trans["transaction_type"] == "expense":
-                    expense = Expense(
-                        amount=trans["amount"],
-                        category=trans["category"],
-                        description=f"{trans['name']} (Auto-added)",
-                        currency=trans["currency"],
-                        user_id=user_id
-                    )
-                    await db.expenses.insert_one(expense.model_dump())
-                else:
-                    income = Income(
-                        amount=trans["amount"],
-                        source=trans["name"],
-                        currency=trans["currency"],
-                        user_id=user_id
-                    )
-                    await db.income.insert_one(income.model_dump())
-                
-                # Update last processed
-                await db.recurring_transactions.update_one(
-                    {"id": trans["id"]},
-                    {"$set": {"last_processed": current_date.isoformat()}}
-                )
-                processed.append(trans["name"])
-    
-    return {"processed": processed, "count": len(processed)}
+    """Process due recurring transactions now instead of waiting for the scheduler"""
+    stats = await process_due_recurring(user_id)
+    processed = stats.pop("processed")
+    return {"processed": processed, "count": len(processed), "stats": stats}
 
 # ============ EXPENSE SEARCH & FILTERS ============
 
-@api_router.get("/expenses/search")
-async def search_expenses(
-    query: Optional[str] = None,
-    category: Optional[str] = None,
-    min_amount: Optional[float] = None,
-    max_amount: Optional[float] = None,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
-    user_id: str = "default_user"
-):
+# Search runs on search_words: the lowercased words of merchant and
+# description, stored at write time under a multikey index. Each query
+# term must prefix-match a word, as an anchored and escaped regex, so
+# the lookup is an index range scan and user input is never a pattern.
+MAX_SEARCH_TERMS = 8
+MAX_TERM_LENGTH = 32
+# \w plus the Indic blocks, so vowel signs don't split Hindi/Tamil/Telugu/Kannada words
+WORD_PATTERN = re.compile(r"[\w\u0900-\u0DFF]+")
+
+def tokenize(text: str) -> List[str]:
+    return [w[:MAX_TERM_LENGTH] for w in WORD_PATTERN.findall(text.lower())]
+
+def search_terms(query: Optional[str]) -> List[str]:
+    terms = []
+    for term in tokenize(query or ""):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_SEARCH_TERMS]
+
+def prefix_match(term: str) -> Dict[str, Any]:
+    return {"$regex": f"^{re.escape(term)}"}
+
+def build_search_filter(
+    user_id: str,
+    query: Optional[str],
+    category: Optional[str],
+    min_amount: Optional[float],
+    max_amount: Optional[float],
+    start_date: Optional[str],
+    end_date: Optional[str]
+) -> Dict[str, Any]:
     filter_query = {"user_id": user_id}
     
-    if query:
-        filter_query["$or"] = [
-            {"description": {"$regex": query, "$options": "i"}},
-            {"merchant": {"$regex": query, "$options": "i"}}
-        ]
+    terms = search_terms(query)
+    if terms:
+        filter_query["$and"] = [{"search_words": prefix_match(t)} for t in terms]
     
     if category:
         filter_query["category"] = category
@@ -714,74 +2382,218 @@ async def search_expenses(
             filter_query["amount"]["$lte"] = max_amount
     
     if start_date or end_date:
-        filter_query["date"] = {}
+        filter_query["date_at"] = {}
         if start_date:
-            filter_query["date"]["$gte"] = start_date
+            filter_query["date_at"].update(date_bound(start_date))
         if end_date:
-            filter_query["date"]["$lte"] = end_date
-    
-    expenses = await db.expenses.find(filter_query, {"_id": 0}).to_list(1000)
-    return {"results": expenses, "count": len(expenses)}
+            filter_query["date_at"].update(date_bound(end_date, end=True))
+    
+    return filter_query
+
+async def ranked_search(filter_query: Dict[str, Any], terms: List[str], limit: int) -> Dict[str, Any]:
+    """Top matches by relevance: whole-word hits first, then newest"""
+    docs = await db.expenses.aggregate([
+        {"$match": filter_query},
+        {"$addFields": {"relevance": {"$size": {"$setIntersection": [{"$ifNull": ["$search_words", []]}, terms]}}}},
+        {"$sort": {"relevance": -1, "date_at": -1, "id": -1}},
+        {"$limit": limit + 1},
+        {"$project": LIST_PROJECTION}
+    ]).to_list(limit + 1)
+    return {
+        "items": docs[:limit],
+        "count": min(len(docs), limit),
+        "has_more": len(docs) > limit,
+        "next_cursor": None
+    }
+
+@api_router.get("/expenses/search")
+async def search_expenses(
+    query: Optional[str] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: str = "default_user",
+    after: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=1000),
+    sort: str = Query("date", pattern="^(date|relevance)$")
+):
+    filter_query = build_search_filter(user_id, query, category, min_amount, max_amount, start_date, end_date)
+    terms = search_terms(query)
+    if sort == "relevance" and terms:
+        # Ranked results are a single top-N page; keyset paging is date order only
+        page = await ranked_search(filter_query, terms, limit)
+    else:
+        page = await paginate(db.expenses, filter_query, after, limit)
+    return {
+        "results": page["items"],
+        "count": page["count"],
+        "has_more": page["has_more"],
+        "next_cursor": page["next_cursor"]
+    }
+
+@api_router.get("/expenses/search/suggest")
+async def suggest_search_terms(
+    prefix: str,
+    user_id: str = "default_user",
+    limit: int = Query(10, ge=1, le=50)
+):
+    """Prefix autocomplete over the words in a user's merchants and descriptions"""
+    terms = tokenize(prefix)
+    if not terms:
+        return {"suggestions": []}
+    match = prefix_match(terms[-1])
+    suggestions = await db.expenses.aggregate([
+        {"$match": {"user_id": user_id, "search_words": match}},
+        {"$project": {"_id": 0, "search_words": 1}},
+        {"$unwind": "$search_words"},
+        {"$match": {"search_words": match}},
+        {"$group": {"_id": "$search_words", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": limit}
+    ]).to_list(limit)
+    return {"suggestions": [{"term": s["_id"], "count": s["count"]} for s in suggestions]}
+
+@api_router.get("/expenses/search/stream")
+async def stream_search_expenses(
+    query: Optional[str] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: str = "default_user"
+):
+    filter_query = build_search_filter(user_id, query, category, min_amount, max_amount, start_date, end_date)
+    return stream_ndjson(db.expenses, filter_query)
 
 # ============ DUPLICATE DETECTION ============
 
+def expense_time(doc: Dict[str, Any]) -> Optional[datetime]:
+    """date_at, or the parsed date string for rows the date migration hasn't reached; None if unparseable"""
+    if doc.get("date_at"):
+        return as_utc(doc["date_at"])
+    try:
+        return parse_date(doc["date"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def duplicate_key(doc: Dict[str, Any]) -> str:
+    """Bucket key shared by exact duplicates: amount, category and local day"""
+    day = doc.get("local_date") or local_day(doc["date"])
+    return f"{doc['amount']:.2f}|{doc['category']}|{day}"
+
+async def find_duplicate(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Single indexed lookup for an existing expense in the same bucket"""
+    return await db.expenses.find_one(
+        {"user_id": doc["user_id"], "dup_key": duplicate_key(doc), "id": {"$ne": doc["id"]}},
+        {"_id": 0, "id": 1}
+    )
+
+def exact_duplicate_groups(expenses: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    buckets = {}
+    for expense in expenses:
+        buckets.setdefault(duplicate_key(expense), []).append(expense)
+    return [group for group in buckets.values() if len(group) > 1]
+
+def fuzzy_duplicate_groups(
+    expenses: List[Dict[str, Any]],
+    amount_tolerance: float,
+    window: timedelta
+) -> List[List[Dict[str, Any]]]:
+    """Group same-category expenses with near-equal amounts inside a time window.
+
+    Sorted sweep: rows are ordered by (category, time) and each row is only
+    compared with the earlier rows still inside its window.
+    """
+    rows = sorted(
+        ((e["category"], when, e) for e in expenses if (when := expense_time(e)) is not None),
+        key=lambda row: (row[0], row[1])
+    )
+    parent = list(range(len(rows)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    start = 0
+    for i, (category, when, expense) in enumerate(rows):
+        while rows[start][0] != category or when - rows[start][1] > window:
+            start += 1
+        for j in range(start, i):
+            other = rows[j][2]
+            limit = amount_tolerance * max(abs(expense["amount"]), abs(other["amount"]))
+            if abs(expense["amount"] - other["amount"]) <= limit:
+                parent[find(i)] = find(j)
+    
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(find(i), []).append(row[2])
+    return [group for group in groups.values() if len(group) > 1]
+
 @api_router.get("/expenses/duplicates")
-async def detect_duplicates(user_id: str = "default_user"):
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+async def detect_duplicates(
+    user_id: str = "default_user",
+    mode: str = Query("exact", pattern="^(exact|fuzzy)$"),
+    amount_tolerance: float = Query(0.02, ge=0, le=1),
+    window_minutes: int = Query(120, ge=1),
+    days: Optional[int] = Query(None, ge=1, le=3660)
+):
+    """Duplicate groups among all of a user's expenses, or only those of the last `days` days"""
+    filter_query: Dict[str, Any] = {"user_id": user_id}
+    since = None
+    if days is not None:
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        filter_query["$or"] = [{"date_at": {"$gte": since}}, {"date_at": {"$exists": False}}]
+    # Rows the date migration hasn't reached yet are placed by their date string;
+    # rows whose date can't be parsed at all are left out
+    cursor = db.expenses.find(filter_query, KEYSET_PROJECTION).batch_size(STREAM_BATCH_SIZE)
+    expenses = [
+        e async for e in cursor
+        if (when := expense_time(e)) is not None and (since is None or when >= since)
+    ]
     
-    duplicates = []
-    checked = set()
+    if mode == "fuzzy":
+        groups = fuzzy_duplicate_groups(expenses, amount_tolerance, timedelta(minutes=window_minutes))
+    else:
+        groups = exact_duplicate_groups(expenses)
     
-    for i, exp1 in enumerate(expenses):
-        if exp1["id"] in checked:
-            continue
-        
-        potential_dupes = []
-        for j, exp2 in enumerate(expenses):
-            if i != j and exp2["id"] not in checked:
-                # Check if similar
-                if (exp1["amount"] == exp2["amount"] and
-                    exp1["category"] == exp2["category"] and
-                    exp1["date"][:10] == exp2["date"][:10]):
-                    potential_dupes.append(exp2)
-        
-        if potential_dupes:
-            duplicates.append({
-                "original": exp1,
-                "duplicates": potential_dupes
-            })
-            checked.add(exp1["id"])
-            for d in potential_dupes:
-                checked.add(d["id"])
+    duplicates = []
+    for group in groups:
+        group.sort(key=expense_time)
+        group = [public_row(e) for e in group]
+        duplicates.append({
+            "original": group[0],
+            "duplicates": group[1:]
+        })
     
     return {"duplicates": duplicates, "count": len(duplicates)}
 
 # ============ BEHAVIOUR ANALYTICS ============
 
+TEMPORAL_PROJECTION = {"_id": 0, "amount": 1, "category": 1, "local_hour": 1, "local_weekday": 1}
+
+async def user_temporal_features(user_id: str) -> Dict[str, Any]:
+    """Load a user's expenses into columns in one pass and compute every temporal feature"""
+    cursor = db.expenses.find(
+        {"user_id": user_id, "local_hour": {"$exists": True}}, TEMPORAL_PROJECTION
+    ).batch_size(STREAM_BATCH_SIZE)
+    columns = columns_from_rows([row async for row in cursor])
+    return compute_features(columns)
+
 @api_router.get("/analytics/behaviour")
+@analytics_cached("behaviour")
 async def get_behaviour_analytics(user_id: str = "default_user"):
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    features = await user_temporal_features(user_id)
     
-    if not expenses:
+    if not features["transaction_count"]:
         return {"patterns": [], "alerts": []}
     
-    # Analyze patterns
-    weekday_spending = {}
-    late_night_orders = 0
-    weekend_overspending = 0
-    
-    for expense in expenses:
-        date = datetime.fromisoformat(expense["date"].replace("Z", "+00:00"))
-        weekday = date.strftime("%A")
-        hour = date.hour
-        
-        weekday_spending[weekday] = weekday_spending.get(weekday, 0) + expense["amount"]
-        
-        if hour >= 22 or hour <= 4:  # Late night
-            late_night_orders += 1
-        
-        if weekday in ["Saturday", "Sunday"]:
-            weekend_overspending += expense["amount"]
+    weekday_spending = features["weekday_spending"]
+    late_night_orders = features["late_night_count"]
     
     # Generate alerts
     alerts = []
@@ -806,7 +2618,7 @@ async def get_behaviour_analytics(user_id: str = "default_user"):
         "patterns": {
             "weekday_spending": weekday_spending,
             "late_night_orders": late_night_orders,
-            "weekend_spending": weekend_overspending
+            "weekend_spending": features["weekend_amount"]
         },
         "alerts": alerts
     }
@@ -832,8 +2644,156 @@ async def get_preferences(user_id: str = "default_user"):
 
 # ============ AI AUTO-CATEGORIZATION ============
 
+# Every expense write teaches the local categorizer (see apply_expense_write),
+# and a fixed category is unlearned and relearned with CORRECTION_WEIGHT.
+# Other workers' writes arrive through a shared snapshot: once every
+# CATEGORIZER_RETRAIN_SECONDS one worker, holding a lease, rebuilds the model
+# from db.expenses and stores it in db.categorizer_models; the rest load the
+# new version within CATEGORIZER_SYNC_SECONDS instead of scanning themselves.
+CATEGORIZER_MIN_CONFIDENCE = float(os.environ.get("CATEGORIZER_MIN_CONFIDENCE", "0.8"))
+CATEGORIZER_RETRAIN_SECONDS = int(os.environ.get("CATEGORIZER_RETRAIN_SECONDS", "3600"))
+CATEGORIZER_SYNC_SECONDS = int(os.environ.get("CATEGORIZER_SYNC_SECONDS", "60"))
+CORRECTION_WEIGHT = 3.0
+
+categorizer = Categorizer()
+categorizer_version: Optional[str] = None
+# Learns made while a replacement model is being built, replayed onto it before the swap
+categorizer_pending: Optional[List[tuple]] = None
+
+def category_features(doc: Dict[str, Any]) -> List[str]:
+    """Words of merchant and description plus the merchant key; amounts are noise"""
+    if "search_words" in doc and "merchant_key" in doc:
+        words, merchant_key = doc["search_words"], doc["merchant_key"]
+    else:
+        words = tokenize(f"{doc.get('merchant') or ''} {doc.get('description') or ''}")
+        merchant_key = match_merchant(doc.get("merchant"), doc.get("description"))
+    features = [w for w in words if not w.isdigit()]
+    if merchant_key != "Others":
+        features.append(f"merchant:{merchant_key}")
+    return features
+
+def learn_expense_category(doc: Dict[str, Any], sign: int = 1):
+    weight = CORRECTION_WEIGHT if doc.get("category_corrected") else 1.0
+    learned = (doc["user_id"], category_features(doc), doc["category"], sign * weight)
+    categorizer.learn(*learned)
+    if categorizer_pending is not None:
+        categorizer_pending.append(learned)
+
+def predict_category(description: str, merchant: Optional[str], user_id: str) -> tuple:
+    """(category, confidence) from the local model; category is None when nothing is known"""
+    return categorizer.predict(category_features({"description": description, "merchant": merchant}), user_id)
+
+async def swap_categorizer(build) -> Categorizer:
+    """Swap in the model `build` returns, plus every learn made while it ran"""
+    global categorizer, categorizer_pending
+    categorizer_pending = []
+    try:
+        fresh = await build()
+        for learned in categorizer_pending:
+            fresh.learn(*learned)
+        categorizer = fresh
+    finally:
+        categorizer_pending = None
+    return fresh
+
+async def scan_categorizer() -> Categorizer:
+    """A model over every expense stored before the scan started.
+
+    Later inserts are left out because swap_categorizer replays them; an edit
+    landing on a row the scan hasn't reached yet is counted twice until the
+    next retrain.
+    """
+    fresh = Categorizer()
+    started = ObjectId.from_datetime(datetime.now(timezone.utc))
+    projection = {"_id": 0, "user_id": 1, "category": 1, "description": 1, "merchant": 1,
+                  "search_words": 1, "merchant_key": 1, "category_corrected": 1}
+    async for doc in db.expenses.find({"_id": {"$lt": started}}, projection).batch_size(STREAM_BATCH_SIZE):
+        weight = CORRECTION_WEIGHT if doc.get("category_corrected") else 1.0
+        fresh.learn(doc["user_id"], category_features(doc), doc["category"], weight)
+    return fresh
+
+async def claim_categorizer_retrain(now: datetime) -> bool:
+    """Take the fleet-wide retrain lease if it has run out; it is never released early"""
+    try:
+        await db.categorizer_state.find_one_and_update(
+            {"_id": "retrain", "lease_until": {"$lte": now}},
+            {"$set": {"lease_until": now + timedelta(seconds=CATEGORIZER_RETRAIN_SECONDS)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False  # another worker trained within the last interval
+
+async def train_categorizer() -> Dict[str, int]:
+    """Rebuild the local categorizer from every stored expense, swap it in and store it for the other workers"""
+    global categorizer_version
+    fresh = await swap_categorizer(scan_categorizer)
+    version = str(uuid.uuid4())
+    await db.categorizer_models.insert_many([{"version": version, **doc} for doc in fresh.to_documents()])
+    previous = await db.categorizer_state.find_one_and_update(
+        {"_id": "model"},
+        {"$set": {"version": version, "trained_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    # Keep the version before this one for workers still loading it
+    keep = [version] + ([previous["version"]] if previous else [])
+    await db.categorizer_models.delete_many({"version": {"$nin": keep}})
+    categorizer_version = version
+    return fresh.stats()
+
+async def load_categorizer(version: str) -> Dict[str, int]:
+    """Swap in the stored model `version`"""
+    global categorizer_version
+
+    async def build():
+        fresh = Categorizer()
+        async for doc in db.categorizer_models.find({"version": version}, {"_id": 0, "version": 0}):
+            fresh.load(doc)
+        return fresh
+
+    fresh = await swap_categorizer(build)
+    categorizer_version = version
+    return fresh.stats()
+
+async def sync_categorizer() -> Optional[Dict[str, int]]:
+    """Retrain if this worker holds the lease, else load a newer stored model; None when nothing changed"""
+    if await claim_categorizer_retrain(datetime.now(timezone.utc)):
+        return await train_categorizer()
+    current = await db.categorizer_state.find_one({"_id": "model"})
+    if current and current["version"] != categorizer_version:
+        return await load_categorizer(current["version"])
+    return None
+
+async def categorizer_sync_loop():
+    while True:
+        try:
+            stats = await sync_categorizer()
+            if stats:
+                logging.info(f"Categorizer {categorizer_version} in use: {stats}")
+        except Exception as e:
+            logging.error(f"Categorizer sync failed: {str(e)}")
+        await asyncio.sleep(CATEGORIZER_SYNC_SECONDS)
+
 @api_router.post("/expenses/auto-categorize")
-async def auto_categorize_expense(description: str = Body(...), amount: float = Body(...)):
+async def auto_categorize_expense(
+    description: str = Body(...),
+    amount: float = Body(...),
+    merchant: Optional[str] = Body(None),
+    user_id: str = Body("default_user")
+):
+    category, confidence = predict_category(description, merchant, user_id)
+    merchant_key = match_merchant(merchant, description)
+    guess = {
+        "category": category or "Other",
+        "merchant": merchant or (None if merchant_key == "Others" else merchant_key),
+        "notes": "",
+        "confidence": confidence
+    }
+    if category and confidence >= CATEGORIZER_MIN_CONFIDENCE:
+        incr_metric("categorizer.local")
+        return {**guess, "source": "local"}
+    incr_metric("categorizer.llm")
+    
     prompt = f'''Categorize this expense:
     Description: "{description}"
     Amount: {amount}
@@ -846,7 +2806,7 @@ async def auto_categorize_expense(description: str = Body(...), amount: float =
     }}
     '''
     
-    ai_response = await get_ai_response(prompt, "You are an expense categorization assistant. Return only valid JSON.")
+    ai_response = await get_ai_response(prompt, "You are an expense categorization assistant. Return only valid JSON.", cacheable=True, user_id=user_id)
     
     try:
         # Clean response
@@ -860,46 +2820,180 @@ async def auto_categorize_expense(description: str = Body(...), amount: float =
         ai_response = ai_response.strip()
         
         result = json.loads(ai_response)
-        return result
+        return {**result, "source": "llm"}
     except:
-        return {"category": "Other", "merchant": None, "notes": ""}
+        # Low-confidence local guess beats a blanket "Other"
+        return {**guess, "source": "local"}
 
 # ============ LEADERBOARD ============
 
-@api_router.get("/leaderboard")
-async def get_leaderboard():
-    # Mock data for demo - in real app, aggregate from all users
-    users_data = [
-        {"user_id": "default_user", "savings_percentage": 0}
+# db.savings_rankings holds one document per (granularity, period, user):
+# income and expense totals plus the savings percentage, for the IST week
+# ("2024-W05"), month ("2024-01") and all time ("all"). Every income and
+# expense write adjusts its three documents with a pipeline update, so the
+# board is an indexed sorted read. A periodic recompute from the rollups and
+# raw income repairs any drift and stores each user's rank, so looking up
+# one user's position never counts the users ahead of them.
+RANKING_GRANULARITIES = ("week", "month", "all")
+RANKING_RECOMPUTE_SECONDS = int(os.environ.get("RANKING_RECOMPUTE_SECONDS", "3600"))
+
+# Null when there is no income, which keeps the user off the board
+SAVINGS_PERCENTAGE = {"$cond": [
+    {"$gt": ["$income", 0]},
+    {"$multiply": [{"$divide": [{"$subtract": ["$income", "$expenses"]}, "$income"]}, 100]},
+    None
+]}
+
+def ranking_period(granularity: str, local_date: str) -> str:
+    if granularity == "week":
+        return datetime.strptime(local_date, "%Y-%m-%d").strftime("%G-W%V")
+    if granularity == "month":
+        return local_date[:7]
+    return "all"
+
+def ranking_updates(doc: Dict[str, Any], field: str, sign: int = 1) -> List[UpdateOne]:
+    """Pipeline upserts adding one income/expense document to its week, month and all-time rankings"""
+    amount = doc["amount"] * sign
+    return [
+        UpdateOne(
+            {"granularity": granularity, "period": ranking_period(granularity, doc["local_date"]), "user_id": doc["user_id"]},
+            [
+                {"$set": {
+                    "income": {"$ifNull": ["$income", 0]},
+                    "expenses": {"$ifNull": ["$expenses", 0]},
+                }},
+                {"$set": {field: {"$add": [f"${field}", amount]}, "updated_at": "$$NOW"}},
+                {"$set": {"savings_percentage": SAVINGS_PERCENTAGE}},
+            ],
+            upsert=True
+        )
+        for granularity in RANKING_GRANULARITIES
     ]
-    
-    # Calculate savings for default user
+
+def current_ranking_periods() -> Dict[str, str]:
+    today = datetime.now(LOCAL_TZ).strftime("%Y-%m-%d")
+    return {granularity: ranking_period(granularity, today) for granularity in RANKING_GRANULARITIES}
+
+def ranking_sources(granularity: str, period: str) -> tuple:
+    """($match on expense_rollups, $match on income) covering one ranking period"""
+    if granularity == "week":
+        monday = datetime.strptime(period + "-1", "%G-W%V-%u").replace(tzinfo=LOCAL_TZ)
+        days = {"$gte": monday.strftime("%Y-%m-%d"), "$lte": (monday + timedelta(days=6)).strftime("%Y-%m-%d")}
+        return (
+            {"granularity": "day", "period": days},
+            {"date_at": {"$gte": monday, "$lt": monday + timedelta(days=7)}}
+        )
+    if granularity == "month":
+        return {"granularity": "month", "period": period}, {"local_month": period}
+    return {"granularity": "month"}, {}
+
+async def recompute_ranking(granularity: str, period: str) -> int:
+    """Rebuild one period's rankings from the expense rollups and raw income"""
+    started = datetime.now(timezone.utc)
+    rollup_match, income_match = ranking_sources(granularity, period)
+    pipeline = [
+        {"$match": rollup_match},
+        {"$group": {"_id": "$user_id", "expenses": {"$sum": "$total"}, "income": {"$sum": 0}}},
+        {"$unionWith": {"coll": "income", "pipeline": [
+            {"$match": income_match},
+            {"$group": {"_id": "$user_id", "expenses": {"$sum": 0}, "income": {"$sum": "$amount"}}}
+        ]}},
+        {"$group": {"_id": "$_id", "expenses": {"$sum": "$expenses"}, "income": {"$sum": "$income"}}},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id",
+            "granularity": {"$literal": granularity},
+            "period": {"$literal": period},
+            "income": 1,
+            "expenses": 1,
+            "savings_percentage": SAVINGS_PERCENTAGE,
+            "updated_at": {"$literal": started}
+        }},
+        {"$merge": {
+            "into": "savings_rankings",
+            "on": ["granularity", "period", "user_id"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+    await db.expense_rollups.aggregate(pipeline).to_list(None)
+    # Users left with no income or expenses in the period
+    await db.savings_rankings.delete_many({"granularity": granularity, "period": period, "updated_at": {"$lt": started}})
+    await rank_period(granularity, period)
+    return await db.savings_rankings.count_documents({"granularity": granularity, "period": period})
+
+async def rank_period(granularity: str, period: str):
+    """Store every ranked user's position on one period's board; users without a savings percentage get none"""
+    await db.savings_rankings.aggregate([
+        {"$match": {"granularity": granularity, "period": period, "savings_percentage": {"$type": "number"}}},
+        {"$setWindowFields": {
+            "sortBy": {"savings_percentage": -1, "user_id": 1},
+            "output": {"rank": {"$documentNumber": {}}}
+        }},
+        {"$project": {"_id": 1, "rank": 1}},
+        {"$merge": {"into": "savings_rankings", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ]).to_list(None)
+
+async def recompute_rankings() -> Dict[str, int]:
+    """Recompute the current week, month and all-time rankings"""
+    return {
+        f"{granularity}:{period}": await recompute_ranking(granularity, period)
+        for granularity, period in current_ranking_periods().items()
+    }
+
+async def ranking_recompute_loop():
+    while True:
+        await asyncio.sleep(RANKING_RECOMPUTE_SECONDS)
         try:
-    expenses = await db.expenses.find({"user_id": "default_user"}, {"_id": 0}).to_list(1000)
-    income = await db.income.find({"user_id": "default_user"}, {"_id": 0}).to_list(1000)
-    
-    total_expenses = sum(e["amount"] for e in expenses)
-    total_income = sum(i["amount"] for i in income)
-    savings_pct = ((total_income - total_expenses) / total_income * 100) if total_income > 0 else 0
-    
-    users_data[0]["savings_percentage"] = savings_pct
-    
-    # Add mock competitors
-    import random
-    for i in range(1, 10):
-        users_data.append({
-            "user_id": f"user_{i}",
-            "savings_percentage": random.uniform(10, 50)
-        })
-    
-    # Sort by savings
-    leaderboard = sorted(users_data, key=lambda x: x["savings_percentage"], reverse=True)
-    
-    # Add ranks
-    for idx, user in enumerate(leaderboard, 1):
-        user["rank"] = idx
-    
-    return {"leaderboard": leaderboard[:10]}
+            started = time.perf_counter()
+            counts = await recompute_rankings()
+            logging.info(f"Rankings recomputed in {time.perf_counter() - started:.1f}s: {counts}")
+        except Exception as e:
+            logging.error(f"Ranking recompute failed: {str(e)}")
+
+async def build_rankings() -> Dict[str, int]:
+    """First fill of db.savings_rankings: every month and week with data, then all time"""
+    counts = {}
+    months = await db.expense_rollups.distinct("period", {"granularity": "month"})
+    months = sorted(set(months) | set(await db.income.distinct("local_month")))
+    for month in months:
+        counts[f"month:{month}"] = await recompute_ranking("month", month)
+    weeks = set()
+    for day in await db.expense_rollups.distinct("period", {"granularity": "day"}) + await db.income.distinct("local_date"):
+        weeks.add(ranking_period("week", day))
+    for week in sorted(weeks):
+        counts[f"week:{week}"] = await recompute_ranking("week", week)
+    counts["all:all"] = await recompute_ranking("all", "all")
+    return counts
+
+MIGRATIONS["savings_rankings"] = build_rankings
+
+@api_router.get("/leaderboard")
+async def get_leaderboard(
+    user_id: str = "default_user",
+    period: str = Query("all", pattern="^(week|month|all)$"),
+    limit: int = Query(10, ge=1, le=100)
+):
+    """Top savers of the current week, month or all time, plus the caller's own rank.
+
+    Users without income in the period have no savings percentage: they are
+    left off the board and get a null rank. The caller's rank is the one
+    stored by the last recompute (at most RANKING_RECOMPUTE_SECONDS old).
+    """
+    key = {"granularity": period, "period": current_ranking_periods()[period]}
+    projection = {"_id": 0, "user_id": 1, "savings_percentage": 1}
+    top = await db.savings_rankings.find(
+        {**key, "savings_percentage": {"$type": "number"}}, projection
+    ).sort([("savings_percentage", DESCENDING), ("user_id", ASCENDING)]).limit(limit).to_list(None)
+    for rank, row in enumerate(top, 1):
+        row["rank"] = rank
+
+    me = await db.savings_rankings.find_one({**key, "user_id": user_id}, {**projection, "rank": 1})
+    if me is None:
+        me = {"user_id": user_id, "savings_percentage": None}
+    # Not ranked yet (first write since the last recompute), or no longer rankable
+    me["rank"] = me.get("rank") if me.get("savings_percentage") is not None else None
+    return {"period": key["period"], "leaderboard": top, "me": me}
 
 # ============ DEBT MANAGEMENT ============
 
@@ -944,68 +3038,222 @@ async def delete_debt(debt_id: str):
 
 # ============ MERCHANT INSIGHTS ============
 
+# MERCHANT_KEYWORDS and the matcher live in merchants.py
+
+async def backfill_merchant_keys(recompute_all: bool = False, batch_size: int = 1000) -> int:
+    """Set merchant_key on expenses missing it, or on all of them after MERCHANT_KEYWORDS changes"""
+    query = {} if recompute_all else {"merchant_key": {"$exists": False}}
+    updated = 0
+    batch = []
+    async for doc in db.expenses.find(query, {"_id": 1, "merchant": 1, "description": 1, "merchant_key": 1}):
+        key = match_merchant(doc.get("merchant"), doc.get("description"))
+        if doc.get("merchant_key") != key:
+            batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"merchant_key": key}}))
+        if len(batch) >= batch_size:
+            updated += (await db.expenses.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.expenses.bulk_write(batch, ordered=False)).modified_count
+    return updated
+
+async def recompute_merchant_keys() -> int:
+    """Keys stored before keywords matched whole words only ("chocolate" was Ola); recompute them all"""
+    return await backfill_merchant_keys(recompute_all=True)
+
+MIGRATIONS["merchant_keys_whole_words"] = recompute_merchant_keys
+
 @api_router.get("/analytics/merchants")
+@analytics_cached("merchants")
 async def get_merchant_insights(user_id: str = "default_user"):
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    
-    # Common merchants to detect
-    merchant_keywords = {
-        "Zomato": ["zomato"],
-        "Swiggy": ["swiggy"],
-        "Amazon": ["amazon", "amzn"],
-        "Flipkart": ["flipkart"],
-        "Uber": ["uber"],
-        "Ola": ["ola"],
-        "Netflix": ["netflix"],
-        "Prime Video": ["prime", "amazon video"],
-        "Spotify": ["spotify"],
-        "Starbucks": ["starbucks"],
-        "McDonald's": ["mcdonalds", "mcd", "mcdonald"],
-        "BigBasket": ["bigbasket"],
-        "Blinkit": ["blinkit", "grofers"]
-    }
-    
-    merchant_data = {}
-    
-    for expense in expenses:
-        merchant = expense.get("merchant", "").lower()
-        description = expense.get("description", "").lower()
-        text = f"{merchant} {description}"
-        
-        matched_merchant = "Others"
-        for merchant_name, keywords in merchant_keywords.items():
-            if any(kw in text for kw in keywords):
-                matched_merchant = merchant_name
-                break
-        
-        if matched_merchant not in merchant_data:
-            merchant_data[matched_merchant] = {
-                "merchant": matched_merchant,
-                "total_spent": 0,
-                "transaction_count": 0,
-                "transactions": []
-            }
-        
-        merchant_data[matched_merchant]["total_spent"] += expense["amount"]
-        merchant_data[matched_merchant]["transaction_count"] += 1
-        merchant_data[matched_merchant]["transactions"].append({
-            "amount": expense["amount"],
-            "date": expense["date"],
-            "description": expense["description"]
-        })
-    
-    # Calculate averages
-    for merchant in merchant_data.values():
-        merchant["average_transaction"] = merchant["total_spent"] / merchant["transaction_count"]
-        merchant["transactions"] = merchant["transactions"][-10:]  # Last 10 transactions
-    
-    # Sort by total spent
-    sorted_merchants = sorted(merchant_data.values(), key=lambda x: x["total_spent"], reverse=True)
-    
-    return {"merchants": sorted_merchants}
+    # merchant_key is normalized at write time, so this is a plain $group
+    merchants = await db.expenses.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"date_at": 1}},
+        {"$group": {
+            "_id": {"$ifNull": ["$merchant_key", "Others"]},
+            "total_spent": {"$sum": "$amount"},
+            "transaction_count": {"$sum": 1},
+            "transactions": {"$push": {"amount": "$amount", "date": "$date", "description": "$description"}}
+        }},
+        {"$project": {
+            "_id": 0,
+            "merchant": "$_id",
+            "total_spent": 1,
+            "transaction_count": 1,
+            "average_transaction": {"$divide": ["$total_spent", "$transaction_count"]},
+            "transactions": {"$slice": ["$transactions", -10]}  # Last 10 transactions
+        }},
+        {"$sort": {"total_spent": -1}}
+    ]).to_list(None)
+    
+    return {"merchants": merchants}
 
 # ============ BADGES & MILESTONES ============
 
+# Badges are rules over a handful of per-user counters in db.user_stats
+# (expense count and total, income total, non-regret streak). Every write
+# updates the counters with find_one_and_update and evaluates the rules on
+# the document it gets back, so an award costs nothing beyond the write
+# that earned it. The unique (user_id, name) index on db.badges makes every
+# award at-most-once; user_stats.badges caches the names already earned.
+BADGE_METRICS = {
+    "expense_count": lambda s: s.get("expense_count", 0),
+    "no_regret_streak": lambda s: s.get("no_regret_streak", 0),
+    "savings": lambda s: s.get("income_total", 0) - s.get("expense_total", 0),
+    "savings_rate": lambda s: (
+        (s.get("income_total", 0) - s.get("expense_total", 0)) / s["income_total"] * 100
+        if s.get("income_total", 0) > 0 else None
+    ),
+}
+
+# A new rule is backfilled for every user at the next startup
+BADGE_RULES = [
+    {"name": "First Step", "description": "Added your first expense!", "icon": "🎯", "metric": "expense_count", "at_least": 1},
+    {"name": "₹10K Saver", "description": "Saved ₹10,000!", "icon": "💰", "metric": "savings", "at_least": 10000},
+    {"name": "Smart Spender", "description": "5 days without regret purchases!", "icon": "🧠", "metric": "no_regret_streak", "at_least": 5},
+    {"name": "Consistency King", "description": "Tracked 30+ expenses!", "icon": "👑", "metric": "expense_count", "at_least": 30},
+    {"name": "Super Saver", "description": "Achieved 30%+ savings rate!", "icon": "⭐", "metric": "savings_rate", "at_least": 30},
+]
+
+def earned_badges(stats: Dict[str, Any], rules: List[Dict[str, Any]] = BADGE_RULES) -> List[Dict[str, Any]]:
+    """Rules the counters satisfy that haven't been awarded yet"""
+    awarded = set(stats.get("badges", []))
+    earned = []
+    for rule in rules:
+        if rule["name"] in awarded:
+            continue
+        value = BADGE_METRICS[rule["metric"]](stats)
+        if value is not None and value >= rule["at_least"]:
+            earned.append(rule)
+    return earned
+
+async def award_badges(stats: Dict[str, Any], rules: List[Dict[str, Any]] = BADGE_RULES) -> List[Badge]:
+    user_id = stats["user_id"]
+    earned = earned_badges(stats, rules)
+    new_badges = []
+    for rule in earned:
+        badge = Badge(name=rule["name"], description=rule["description"], icon=rule["icon"], user_id=user_id)
+        try:
+            await db.badges.insert_one(badge.model_dump())
+            new_badges.append(badge)
+        except DuplicateKeyError:
+            pass  # awarded by a concurrent write
+    if earned:
+        names = [rule["name"] for rule in earned]
+        await db.user_stats.update_one({"user_id": user_id}, {"$addToSet": {"badges": {"$each": names}}})
+    if new_badges:
+        incr_metric("badges.awarded", len(new_badges))
+        await bump_data_version(user_id)
+    return new_badges
+
+def expense_stats_change(docs: List[Dict[str, Any]], sign: int = 1, streak: bool = True) -> List[Dict[str, Any]]:
+    """Pipeline update applying expenses, in write order, to a user's counters"""
+    change = {
+        "expense_count": {"$add": [{"$ifNull": ["$expense_count", 0]}, sign * len(docs)]},
+        "expense_total": {"$add": [{"$ifNull": ["$expense_total", 0]}, sign * sum(doc["amount"] for doc in docs)]},
+    }
+    # Deletes and edits don't rewrite the streak; the rebuild does
+    if streak and sign > 0:
+        regrets = [i for i, doc in enumerate(docs) if doc.get("is_regret")]
+        if regrets:
+            change["no_regret_streak"] = len(docs) - 1 - regrets[-1]
+        else:
+            change["no_regret_streak"] = {"$add": [{"$ifNull": ["$no_regret_streak", 0]}, len(docs)]}
+    return [{"$set": change}]
+
+def income_stats_change(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"$set": {"income_total": {"$add": [{"$ifNull": ["$income_total", 0]}, sum(doc["amount"] for doc in docs)]}}}]
+
+# Until the badge_engine migration has built the counters from history,
+# a user's counters only cover recent writes and must not award anything
+badge_counters_ready = False
+
+async def badge_engine_ready() -> bool:
+    global badge_counters_ready
+    if not badge_counters_ready:
+        badge_counters_ready = bool(await db.migrations.find_one({"_id": "badge_engine", "status": "done"}))
+    return badge_counters_ready
+
+async def update_user_stats(user_id: str, change: List[Dict[str, Any]]) -> List[Badge]:
+    """Apply a counter change and award whatever it earned"""
+    stats = await db.user_stats.find_one_and_update(
+        {"user_id": user_id}, change, {"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    if not await badge_engine_ready():
+        return []
+    return await award_badges(stats)
+
+async def rebuild_user_stats(user_id: Optional[str] = None) -> int:
+    """Recompute every counter (and the awarded-names cache) from raw data"""
+    match = {"user_id": user_id} if user_id else {}
+    stats: Dict[str, Dict[str, Any]] = {}
+
+    def entry(uid: str) -> Dict[str, Any]:
+        return stats.setdefault(uid, {"expense_count": 0, "expense_total": 0.0, "no_regret_streak": 0, "income_total": 0.0, "badges": []})
+
+    # One streaming pass in date order, which is the order the streak is about
+    projection = {"_id": 0, "user_id": 1, "amount": 1, "is_regret": 1}
+    async for doc in db.expenses.find(match, projection).sort([("user_id", ASCENDING), ("date_at", ASCENDING)]).batch_size(STREAM_BATCH_SIZE):
+        row = entry(doc["user_id"])
+        row["expense_count"] += 1
+        row["expense_total"] += doc["amount"]
+        row["no_regret_streak"] = 0 if doc.get("is_regret") else row["no_regret_streak"] + 1
+    async for row in db.income.aggregate([{"$match": match}, {"$group": {"_id": "$user_id", "total": {"$sum": "$amount"}}}]):
+        entry(row["_id"])["income_total"] = row["total"]
+    async for row in db.badges.aggregate([{"$match": match}, {"$group": {"_id": "$user_id", "names": {"$addToSet": "$name"}}}]):
+        entry(row["_id"])["badges"] = row["names"]
+
+    updates = [UpdateOne({"user_id": uid}, {"$set": row}, upsert=True) for uid, row in stats.items()]
+    for i in range(0, len(updates), 1000):
+        await db.user_stats.bulk_write(updates[i:i + 1000], ordered=False)
+    return len(updates)
+
+async def award_all_badges(rules: List[Dict[str, Any]] = BADGE_RULES) -> int:
+    """Evaluate rules against every user's counters"""
+    awarded = 0
+    async for stats in db.user_stats.find({}, {"_id": 0}).batch_size(STREAM_BATCH_SIZE):
+        awarded += len(await award_badges(stats, rules))
+    return awarded
+
+async def migrate_badges() -> Dict[str, int]:
+    """Move to the counter-based engine: dedupe awards, make them unique, build counters, award"""
+    duplicates = await db.badges.aggregate([
+        {"$sort": {"earned_date": 1}},
+        {"$group": {"_id": {"user_id": "$user_id", "name": "$name"}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]).to_list(None)
+    extra = [oid for group in duplicates for oid in group["ids"][1:]]
+    if extra:
+        await db.badges.delete_many({"_id": {"$in": extra}})
+    if "user_name" in await db.badges.index_information():
+        await db.badges.drop_index("user_name")
+    await db.badges.create_indexes(INDEX_SPECS["badges"])
+    users = await rebuild_user_stats()
+    awarded = await award_all_badges()
+    await mark_badge_rules(BADGE_RULES)
+    return {"duplicates_removed": len(extra), "users": users, "awarded": awarded}
+
+MIGRATIONS["badge_engine"] = migrate_badges
+
+async def mark_badge_rules(rules: List[Dict[str, Any]]):
+    await db.badge_rules.bulk_write([
+        UpdateOne({"_id": rule["name"]}, {"$setOnInsert": {"added_at": datetime.now(timezone.utc)}}, upsert=True)
+        for rule in rules
+    ])
+
+async def backfill_badge_rules() -> int:
+    """Award rules added since the last startup to every user who already qualifies"""
+    if not await badge_engine_ready():
+        return 0  # the migration evaluates every rule when it finishes
+    known = set(await db.badge_rules.distinct("_id"))
+    new_rules = [rule for rule in BADGE_RULES if rule["name"] not in known]
+    if not new_rules:
+        return 0
+    awarded = await award_all_badges(new_rules)
+    await mark_badge_rules(new_rules)
+    logging.info(f"Backfilled badge rules {[rule['name'] for rule in new_rules]}: {awarded} awarded")
+    return awarded
+
 @api_router.get("/badges")
 async def get_badges(user_id: str = "default_user"):
     badges = await db.badges.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
@@ -1013,94 +3261,54 @@ async def get_badges(user_id: str = "default_user"):
 
 @api_router.post("/badges/check")
 async def check_and_award_badges(user_id: str = "default_user"):
-    """Check if user qualifies for new badges"""
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    income = await db.income.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    existing_badges = await db.badges.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    
-    existing_badge_names = {b["name"] for b in existing_badges}
-    new_badges = []
-    
-    total_expenses = sum(e["amount"] for e in expenses)
-    total_income = sum(i["amount"] for i in income)
-    savings = total_income - total_expenses
-    
-    # Badge criteria
-    badges_to_check = []
-    
-    # First expense tracked
-    if len(expenses) >= 1 and "First Step" not in existing_badge_names:
-        badges_to_check.append({
-            "name": "First Step",
-            "description": "Added your first expense!",
-            "icon": "🎯"
-        })
-    
-    # 10k saved
-    if savings >= 10000 and "₹10K Saver" not in existing_badge_names:
-        badges_to_check.append({
-            "name": "₹10K Saver",
-            "description": "Saved ₹10,000!",
-            "icon": "💰"
-        })
-    
-    # 5 days no regret purchases
-    recent_expenses = [e for e in expenses if not e.get("is_regret", False)][-5:]
-    if len(recent_expenses) >= 5 and "Smart Spender" not in existing_badge_names:
-        badges_to_check.append({
-            "name": "Smart Spender",
-            "description": "5 days without regret purchases!",
-            "icon": "🧠"
-        })
-    
-    # Tracked 30+ expenses
-    if len(expenses) >= 30 and "Consistency King" not in existing_badge_names:
-        badges_to_check.append({
-            "name": "Consistency King",
-            "description": "Tracked 30+ expenses!",
-            "icon": "👑"
-        })
-    
-    # Savings rate > 30%
-    if total_income > 0:
-        savings_rate = (savings / total_income) * 100
-        if savings_rate >= 30 and "Super Saver" not in existing_badge_names:
-            badges_to_check.append({
-                "name": "Super Saver",
-                "description": "Achieved 30%+ savings rate!",
-                "icon": "⭐"
-            })
-    
-    # Award new badges
-    for badge_info in badges_to_check:
-        badge = Badge(**badge_info, user_id=user_id)
-        await db.badges.insert_one(badge.model_dump())
-        new_badges.append(badge)
-    
-    return {"new_badges": new_badges, "total_badges": len(existing_badges) + len(new_badges)}
+    """Award any badge the user's counters qualify for (writes award them already)"""
+    stats = await db.user_stats.find_one({"user_id": user_id}, {"_id": 0}) or {"user_id": user_id}
+    new_badges = await award_badges(stats) if await badge_engine_ready() else []
+    total = len(set(stats.get("badges", [])) | {badge.name for badge in new_badges})
+    return {"new_badges": new_badges, "total_badges": total}
 
 # ============ LIFESTYLE RECOMMENDATIONS ============
 
+FOOD_DELIVERY_PATTERN = re.compile("zomato|swiggy|food|delivery", re.IGNORECASE)
+# The "per month" figures in the recommendations cover this many days
+RECOMMENDATION_WINDOW_DAYS = 30
+
 @api_router.get("/recommendations")
+@analytics_cached("recommendations")
 async def get_lifestyle_recommendations(user_id: str = "default_user"):
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    since = datetime.now(timezone.utc) - timedelta(days=RECOMMENDATION_WINDOW_DAYS)
+    # One row per (merchant, category, food delivery or not) over the window, not one per expense
+    groups = await db.expenses.aggregate([
+        {"$match": {"user_id": user_id, "date_at": {"$gte": since}}},
+        {"$group": {
+            "_id": {
+                "merchant": {"$ifNull": ["$merchant_key", "Others"]},
+                "category": "$category",
+                "delivery": {"$regexMatch": {
+                    "input": {"$concat": [{"$ifNull": ["$merchant", ""]}, " ", {"$ifNull": ["$description", ""]}]},
+                    "regex": FOOD_DELIVERY_PATTERN.pattern,
+                    "options": "i"
+                }}
+            },
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1}
+        }}
+    ]).to_list(None)
     subscriptions = await db.subscriptions.find({"user_id": user_id, "is_active": True}, {"_id": 0}).to_list(1000)
     
     recommendations = []
     
     # Analyze food delivery spending
-    food_delivery_expenses = [e for e in expenses if any(
-        kw in e.get("merchant", "").lower() + e.get("description", "").lower()
-        for kw in ["zomato", "swiggy", "food", "delivery"]
-    )]
+    food_delivery = [g for g in groups if g["_id"]["delivery"]]
+    food_delivery_count = sum(g["count"] for g in food_delivery)
     
-    if len(food_delivery_expenses) > 4:
-        monthly_food_delivery = sum(e["amount"] for e in food_delivery_expenses)
+    if food_delivery_count > 4:
+        monthly_food_delivery = sum(g["amount"] for g in food_delivery)
         savings_potential = monthly_food_delivery * 0.5  # Assume 50% reduction
         
         recommendations.append({
             "title": "Reduce Food Delivery",
-            "description": f"You've ordered food {len(food_delivery_expenses)} times. Cooking at home just once a week could save you!",
+            "description": f"You've ordered food {food_delivery_count} times this month. Cooking at home just once a week could save you!",
             "potential_savings": round(savings_potential, 2),
             "category": "Food",
             "priority": "high"
@@ -1122,9 +3330,9 @@ async def get_lifestyle_recommendations(user_id: str = "default_user"):
         })
     
     # Analyze transport spending
-    transport_expenses = [e for e in expenses if e["category"] == "Transport"]
-    if len(transport_expenses) > 10:
-        monthly_transport = sum(e["amount"] for e in transport_expenses)
+    transport = [g for g in groups if g["_id"]["category"] == "Transport"]
+    if sum(g["count"] for g in transport) > 10:
+        monthly_transport = sum(g["amount"] for g in transport)
         if monthly_transport > 3000:
             recommendations.append({
                 "title": "Consider Public Transport",
@@ -1140,20 +3348,23 @@ async def get_lifestyle_recommendations(user_id: str = "default_user"):
 
 @api_router.get("/analytics/category/{category}")
 async def get_category_insights(category: str, user_id: str = "default_user"):
-    expenses = await db.expenses.find({"user_id": user_id, "category": category}, {"_id": 0}).to_list(1000)
+    rollups = await db.expense_rollups.find({
+        "user_id": user_id,
+        "granularity": "month",
+        "category": category,
+        "count": {"$gt": 0}
+    }, {"_id": 0}).to_list(None)
     
-    if not expenses:
+    if not rollups:
         return {"message": "No data for this category"}
     
-    # Group by month
-    monthly_data = {}
-    for expense in expenses:
-        month = expense["date"][:7]  # YYYY-MM
-        monthly_data[month] = monthly_data.get(month, 0) + expense["amount"]
+    # One rollup per month
+    monthly_data = {r["period"]: r["total"] for r in rollups}
     
     sorted_months = sorted(monthly_data.items())
     
-    total_spent = sum(e["amount"] for e in expenses)
+    total_spent = sum(r["total"] for r in rollups)
+    total_transactions = sum(r["count"] for r in rollups)
     avg_per_month = total_spent / len(monthly_data) if monthly_data else 0
     
     best_month = min(monthly_data.items(), key=lambda x: x[1]) if monthly_data else ("", 0)
@@ -1162,9 +3373,9 @@ async def get_category_insights(category: str, user_id: str = "default_user"):
     return {
         "category": category,
         "total_spent": total_spent,
-        "total_transactions": len(expenses),
+        "total_transactions": total_transactions,
         "average_per_month": avg_per_month,
-        "average_per_transaction": total_spent / len(expenses),
+        "average_per_transaction": total_spent / total_transactions,
         "best_month": {"month": best_month[0], "amount": best_month[1]},
         "worst_month": {"month": worst_month[0], "amount": worst_month[1]},
         "monthly_trend": [{"month": m, "amount": a} for m, a in sorted_months],
@@ -1173,73 +3384,298 @@ async def get_category_insights(category: str, user_id: str = "default_user"):
 
 # ============ WEEKLY REPORTS ============
 
-@api_router.get("/reports/weekly")
-async def generate_weekly_report(user_id: str = "default_user"):
-    # Get last 7 days data
-    week_ago = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
-    
-    expenses = await db.expenses.find({
-        "user_id": user_id,
-        "date": {"$gte": week_ago}
-    }, {"_id": 0}).to_list(1000)
-    
-    income = await db.income.find({
-        "user_id": user_id,
-        "date": {"$gte": week_ago}
-    }, {"_id": 0}).to_list(1000)
-    
-    total_expenses = sum(e["amount"] for e in expenses)
-    total_income = sum(i["amount"] for i in income)
-    savings = total_income - total_expenses
-    
-    # Category breakdown
+# Once a week (WEEKLY_REPORT_WEEKDAY at WEEKLY_REPORT_HOUR, IST) a batch
+# builds the report of the 7 IST days before that day for every user with
+# activity, from three grouped aggregations over all users rather than
+# queries per user. Reports are rendered once and stored in
+# db.weekly_reports, where GET /reports/weekly serves them, then emailed
+# through the pooled mailer to users with an email in their preferences.
+# db.report_runs holds one marker per week, so one process runs each batch.
+WEEKLY_REPORT_WEEKDAY = int(os.environ.get("WEEKLY_REPORT_WEEKDAY", "0"))  # Monday
+WEEKLY_REPORT_HOUR = int(os.environ.get("WEEKLY_REPORT_HOUR", "8"))
+WEEKLY_REPORT_MAX_AGE = timedelta(days=7)
+REPORT_EMAIL_CONCURRENCY = 32
+
+def build_mailer() -> Optional[Mailer]:
+    """SMTP from the environment; None (sending disabled) without SMTP_HOST.
+
+    For a local sink: SMTP_HOST=localhost SMTP_PORT=1025 SMTP_START_TLS=false
+    """
+    host = os.environ.get("SMTP_HOST")
+    if not host:
+        return None
+    start_tls = os.environ.get("SMTP_START_TLS", "").lower()
+    return Mailer(
+        host,
+        int(os.environ.get("SMTP_PORT", "587")),
+        sender=os.environ.get("SMTP_FROM", "Finote <reports@finote.app>"),
+        username=os.environ.get("SMTP_USERNAME") or None,
+        password=os.environ.get("SMTP_PASSWORD") or None,
+        use_tls=os.environ.get("SMTP_USE_TLS", "").lower() in ("1", "true", "yes"),
+        start_tls=None if not start_tls else start_tls in ("1", "true", "yes"),
+        pool_size=int(os.environ.get("SMTP_POOL_SIZE", "4")),
+        rate_per_second=float(os.environ.get("SMTP_RATE_PER_SECOND", "10")),
+        max_attempts=int(os.environ.get("SMTP_MAX_ATTEMPTS", "3")),
+        on_metric=incr_metric
+    )
+
+mailer = build_mailer()
+
+def weekly_report(
+    week_start: str,
+    week_end: str,
+    categories: List[Dict[str, Any]],
+    total_income: float,
+    biggest_purchase: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """The report from per-category {category, total, count} rows of the week"""
+    total_expenses = sum(row["total"] for row in categories)
     category_breakdown = {}
-    for expense in expenses:
-        cat = expense["category"]
-        category_breakdown[cat] = category_breakdown.get(cat, 0) + expense["amount"]
-    
+    for row in categories:
+        if row["count"] > 0:
+            category_breakdown[row["category"]] = category_breakdown.get(row["category"], 0) + row["total"]
     top_category = max(category_breakdown.items(), key=lambda x: x[1]) if category_breakdown else ("None", 0)
-    
-    # Biggest purchase
-    biggest_purchase = max(expenses, key=lambda x: x["amount"]) if expenses else None
-    
-    # Next week target (20% less than this week)
-    next_week_target = total_expenses * 0.8
-    
-    report = {
-        "week_start": week_ago[:10],
-        "week_end": datetime.now(timezone.utc).isoformat()[:10],
+    return {
+        "week_start": week_start,
+        "week_end": week_end,
         "total_spending": total_expenses,
         "total_income": total_income,
-        "savings": savings,
+        "savings": total_income - total_expenses,
         "top_category": {"name": top_category[0], "amount": top_category[1]},
         "biggest_purchase": biggest_purchase,
-        "transaction_count": len(expenses),
-        "next_week_target": next_week_target,
+        "transaction_count": sum(row["count"] for row in categories),
+        # Next week target (20% less than this week)
+        "next_week_target": total_expenses * 0.8,
         "category_breakdown": category_breakdown
     }
+
+def render_weekly_report(report: Dict[str, Any]) -> Dict[str, str]:
+    """Email subject, plain text and HTML for a report"""
+    subject = f"Your Finote week: {report['week_start']} to {report['week_end']}"
+    lines = [
+        f"Spent: ₹{report['total_spending']:,.2f} across {report['transaction_count']} transactions",
+        f"Income: ₹{report['total_income']:,.2f}",
+        f"Saved: ₹{report['savings']:,.2f}",
+        f"Top category: {report['top_category']['name']} (₹{report['top_category']['amount']:,.2f})",
+    ]
+    biggest = report.get("biggest_purchase")
+    if biggest:
+        lines.append(f"Biggest purchase: {biggest.get('description') or biggest['category']} (₹{biggest['amount']:,.2f})")
+    lines.append(f"Target for next week: spend under ₹{report['next_week_target']:,.2f}")
+    rows = "".join(
+        f"<tr><td>{html.escape(category)}</td><td align=\"right\">₹{amount:,.2f}</td></tr>"
+        for category, amount in sorted(report["category_breakdown"].items(), key=lambda x: -x[1])
+    )
+    body = "".join(f"<p>{html.escape(line)}</p>" for line in lines)
+    return {
+        "subject": subject,
+        "text": "\n".join(lines) + "\n",
+        "html": f"<h2>{html.escape(subject)}</h2>{body}<table>{rows}</table>"
+    }
+
+def report_week(run_day: date) -> tuple:
+    """(week_start, week_end) IST dates of the 7 days before run_day"""
+    return (run_day - timedelta(days=7)).isoformat(), (run_day - timedelta(days=1)).isoformat()
+
+async def build_weekly_reports(week_start: str, week_end: str) -> Dict[str, Dict[str, Any]]:
+    """Every active user's report for the week, from three grouped aggregations"""
+    start_at = datetime.strptime(week_start, "%Y-%m-%d").replace(tzinfo=LOCAL_TZ)
+    end_at = datetime.strptime(week_end, "%Y-%m-%d").replace(tzinfo=LOCAL_TZ) + timedelta(days=1)
+    spending, income, biggest = await asyncio.gather(
+        db.expense_rollups.aggregate([
+            {"$match": {"granularity": "day", "period": {"$gte": week_start, "$lte": week_end}}},
+            {"$group": {"_id": {"user_id": "$user_id", "category": "$category"}, "total": {"$sum": "$total"}, "count": {"$sum": "$count"}}}
+        ]).to_list(None),
+        db.income.aggregate([
+            {"$match": {"date_at": {"$gte": start_at, "$lt": end_at}}},
+            {"$group": {"_id": "$user_id", "total": {"$sum": "$amount"}}}
+        ]).to_list(None),
+        db.expenses.aggregate([
+            {"$match": {"date_at": {"$gte": start_at, "$lt": end_at}}},
+            {"$sort": {"amount": -1}},
+            {"$group": {"_id": "$user_id", "expense": {"$first": "$$ROOT"}}},
+            {"$project": {"expense": LIST_PROJECTION}}
+        ], allowDiskUse=True).to_list(None)
+    )
+    categories: Dict[str, List[Dict[str, Any]]] = {}
+    for row in spending:
+        categories.setdefault(row["_id"]["user_id"], []).append({"category": row["_id"]["category"], "total": row["total"], "count": row["count"]})
+    income_totals = {row["_id"]: row["total"] for row in income}
+    biggest_purchases = {row["_id"]: row["expense"] for row in biggest}
+    return {
+        user_id: weekly_report(week_start, week_end, categories.get(user_id, []), income_totals.get(user_id, 0), biggest_purchases.get(user_id))
+        for user_id in set(categories) | set(income_totals)
+    }
+
+async def email_weekly_reports(week_end: str) -> Dict[str, int]:
+    """Send the week's stored reports that haven't gone out yet"""
+    emails = {
+        doc["user_id"]: doc["email"]
+        async for doc in db.preferences.find({"email": {"$nin": [None, ""]}}, {"_id": 0, "user_id": 1, "email": 1})
+    }
+    pending = await db.weekly_reports.find(
+        {"week_end": week_end, "emailed_at": None, "user_id": {"$in": list(emails)}},
+        {"_id": 0, "user_id": 1, "rendered": 1}
+    ).to_list(None)
+    slots = asyncio.Semaphore(REPORT_EMAIL_CONCURRENCY)
+    sent: List[str] = []
+    failed = 0
+
+    async def send(doc: Dict[str, Any]):
+        nonlocal failed
+        rendered = doc["rendered"]
+        async with slots:
+            try:
+                await mailer.send(mailer.message(emails[doc["user_id"]], rendered["subject"], rendered["text"], rendered["html"]))
+                sent.append(doc["user_id"])
+            except Exception as e:
+                failed += 1
+                logging.error(f"Weekly report email to {doc['user_id']} failed: {str(e)}")
+
+    await asyncio.gather(*(send(doc) for doc in pending))
+    if sent:
+        await db.weekly_reports.update_many(
+            {"week_end": week_end, "user_id": {"$in": sent}}, {"$set": {"emailed_at": datetime.now(timezone.utc)}}
+        )
+    return {"emails_sent": len(sent), "email_failures": failed}
+
+async def run_weekly_reports(run_day: Optional[date] = None, send_email: bool = True, force: bool = False) -> Optional[Dict[str, Any]]:
+    """Build, store and email one week's reports; None if that week has run already"""
+    run_day = run_day or datetime.now(LOCAL_TZ).date()
+    week_start, week_end = report_week(run_day)
+    if force:
+        await db.report_runs.delete_one({"_id": week_end})
+    try:
+        await db.report_runs.insert_one({"_id": week_end, "status": "running", "started_at": datetime.now(timezone.utc)})
+    except DuplicateKeyError:
+        return None
+
+    started = time.perf_counter()
+    try:
+        reports = await build_weekly_reports(week_start, week_end)
+        now = datetime.now(timezone.utc)
+        updates = [
+            UpdateOne(
+                {"user_id": user_id, "week_end": week_end},
+                {
+                    "$set": {"week_start": week_start, "report": report, "rendered": render_weekly_report(report), "generated_at": now},
+                    "$setOnInsert": {"emailed_at": None}
+                },
+                upsert=True
+            )
+            for user_id, report in reports.items()
+        ]
+        for i in range(0, len(updates), 1000):
+            await db.weekly_reports.bulk_write(updates[i:i + 1000], ordered=False)
+        built = time.perf_counter() - started
+
+        stats: Dict[str, Any] = {"week_start": week_start, "week_end": week_end, "users": len(reports), "emails_sent": 0, "email_failures": 0}
+        if send_email and mailer:
+            stats.update(await email_weekly_reports(week_end))
+        elapsed = time.perf_counter() - started
+        stats["build_seconds"] = round(built, 3)
+        stats["total_seconds"] = round(elapsed, 3)
+        stats["users_per_second"] = round(len(reports) / built, 1) if built else 0.0
+        stats["emails_per_second"] = round(stats["emails_sent"] / (elapsed - built), 1) if elapsed > built else 0.0
+    except Exception:
+        # Drop the marker so the next attempt redoes the week
+        await db.report_runs.delete_one({"_id": week_end})
+        raise
+
+    await db.report_runs.update_one({"_id": week_end}, {"$set": {"status": "done", "stats": stats, "finished_at": datetime.now(timezone.utc)}})
+    incr_metric("weekly_reports.runs")
+    incr_metric("weekly_reports.users", stats["users"])
+    metrics["weekly_reports.last_users_per_second"] = stats["users_per_second"]
+    return stats
+
+def latest_report_slot(now: datetime) -> datetime:
+    """The most recent scheduled run time at or before now"""
+    local = now.astimezone(LOCAL_TZ)
+    slot = local.replace(hour=WEEKLY_REPORT_HOUR, minute=0, second=0, microsecond=0)
+    slot -= timedelta(days=(local.weekday() - WEEKLY_REPORT_WEEKDAY) % 7)
+    return slot if slot <= local else slot - timedelta(days=7)
+
+async def weekly_report_loop():
+    while True:
+        slot = latest_report_slot(datetime.now(timezone.utc))
+        try:
+            # Also catches up on a slot missed while no server was running
+            stats = await run_weekly_reports(slot.date())
+            if stats:
+                logging.info(f"Weekly reports: {stats}")
+        except Exception as e:
+            logging.error(f"Weekly report run failed: {str(e)}")
+            await asyncio.sleep(600)
+            continue
+        next_slot = slot + timedelta(days=7)
+        await asyncio.sleep(max(60, (next_slot - datetime.now(LOCAL_TZ)).total_seconds()))
+
+async def live_weekly_report(user_id: str) -> Dict[str, Any]:
+    """The last 7 days up to now, computed on request"""
+    now = datetime.now(timezone.utc)
+    week_ago = now - timedelta(days=7)
+    week_start = week_ago.astimezone(LOCAL_TZ).strftime("%Y-%m-%d")
     
-    return report
+    rollups = await db.expense_rollups.find({
+        "user_id": user_id,
+        "granularity": "day",
+        "period": {"$gte": week_start}
+    }, {"_id": 0}).to_list(None)
+    
+    income = await db.income.aggregate([
+        {"$match": {"user_id": user_id, "date_at": {"$gte": week_ago}}},
+        {"$group": {"_id": None, "total": {"$sum": "$amount"}}}
+    ]).to_list(1)
+    
+    biggest = await db.expenses.find(
+        {"user_id": user_id, "date_at": {"$gte": week_ago}}, LIST_PROJECTION
+    ).sort("amount", -1).limit(1).to_list(1)
+    
+    return weekly_report(
+        week_start,
+        now.astimezone(LOCAL_TZ).strftime("%Y-%m-%d"),
+        rollups,
+        income[0]["total"] if income else 0,
+        biggest[0] if biggest else None
+    )
+
+@api_router.get("/reports/weekly")
+async def generate_weekly_report(user_id: str = "default_user", live: bool = False):
+    """The stored report of the last batch if it's under a week old; otherwise (or with live=true) computed now"""
+    if not live:
+        stored = await db.weekly_reports.find_one(
+            {"user_id": user_id, "generated_at": {"$gte": datetime.now(timezone.utc) - WEEKLY_REPORT_MAX_AGE}},
+            {"_id": 0, "report": 1, "generated_at": 1},
+            sort=[("week_end", DESCENDING)]
+        )
+        if stored:
+            return {**stored["report"], "generated_at": stored["generated_at"]}
+    return await live_weekly_report(user_id)
 
 @api_router.post("/reports/weekly/email")
 async def email_weekly_report(user_id: str = "default_user", email: str = Body(..., embed=True)):
     """Send weekly report via email"""
+    if not mailer:
+        raise HTTPException(status_code=503, detail="Email sending is not configured (set SMTP_HOST)")
     report = await generate_weekly_report(user_id)
-    
-    # For now, just return the report (email integration can be added)
-    # In production, use aiosmtplib to send email
+    rendered = render_weekly_report(report)
+    try:
+        await mailer.send(mailer.message(email, rendered["subject"], rendered["text"], rendered["html"]))
+    except Exception as e:
+        logging.error(f"Weekly report email to {email} failed: {str(e)}")
+        raise HTTPException(status_code=502, detail="Could not send the email, please try again later")
     
     return {
-        "message": "Weekly report generated (email sending not configured yet)",
+        "message": "Weekly report sent",
         "report": report,
         "recipient": email
     }
 
 # ============ ADVANCED AI FEATURES ============
 
-@api_router.post("/ai/financial-story")
-async def generate_financial_story(user_id: str = "default_user"):
-    """Generate a creative financial story/summary"""
+STORY_SYSTEM_MESSAGE = "You are a creative financial storyteller who makes finance fun and engaging."
+
+async def financial_story_prompt(user_id: str) -> str:
     expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(100)
     income = await db.income.find({"user_id": user_id}, {"_id": 0}).to_list(100)
     
@@ -1270,41 +3706,35 @@ Write it as:
 5. End with actionable advice
 
 Style: Friendly, witty, encouraging'''
-    
-    story = await get_ai_response(prompt, "You are a creative financial storyteller who makes finance fun and engaging.")
+    return prompt
+
+@api_router.post("/ai/financial-story")
+async def generate_financial_story(user_id: str = "default_user"):
+    """Generate a creative financial story/summary"""
+    story = await get_ai_response(await financial_story_prompt(user_id), STORY_SYSTEM_MESSAGE, user_id=user_id)
     
     return {"story": story}
 
-@api_router.post("/ai/habit-correction")
-async def habit_correction_analysis(user_id: str = "default_user"):
-    """Neural habit correction engine - identify and suggest habit changes"""
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    
-    # Analyze patterns
-    late_night_purchases = []
-    weekend_purchases = []
-    impulsive_purchases = []
-    
-    for expense in expenses:
-        date = datetime.fromisoformat(expense["date"].replace("Z", "+00:00"))
-        hour = date.hour
-        weekday = date.strftime("%A")
-        
-        if hour >= 22 or hour <= 4:
-            late_night_purchases.append(expense)
-        
-        if weekday in ["Saturday", "Sunday"]:
-            weekend_purchases.append(expense)
-        
-        # Impulsive = high amount + food/shopping
-        if expense["amount"] > 500 and expense["category"] in ["Food", "Shopping"]:
-            impulsive_purchases.append(expense)
+@api_router.post("/ai/financial-story/stream")
+async def generate_financial_story_stream(http_request: Request, user_id: str = "default_user"):
+    """SSE variant of /ai/financial-story"""
+    return stream_completion(
+        http_request, await financial_story_prompt(user_id), STORY_SYSTEM_MESSAGE,
+        lambda text: {"story": text}, user_id=user_id
+    )
+
+HABIT_SYSTEM_MESSAGE = "You are a behavioral psychologist specializing in financial habits."
+
+async def habit_correction_prompt(user_id: str) -> tuple:
+    """(prompt, patterns) for the habit correction engine"""
+    # Late night = 22:00-04:59 IST; impulsive = over ₹500 on Food/Shopping
+    features = await user_temporal_features(user_id)
     
     prompt = f'''Analyze these spending habits and provide habit correction recommendations:
 
-Late Night Purchases: {len(late_night_purchases)} transactions, ₹{sum(e["amount"] for e in late_night_purchases)}
-Weekend Purchases: {len(weekend_purchases)} transactions, ₹{sum(e["amount"] for e in weekend_purchases)}
-Potentially Impulsive: {len(impulsive_purchases)} transactions, ₹{sum(e["amount"] for e in impulsive_purchases)}
+Late Night Purchases: {features["late_night_count"]} transactions, ₹{features["late_night_amount"]}
+Weekend Purchases: {features["weekend_count"]} transactions, ₹{features["weekend_amount"]}
+Potentially Impulsive: {features["impulsive_count"]} transactions, ₹{features["impulsive_amount"]}
 
 Provide:
 1. Top 3 habits to break
@@ -1314,29 +3744,37 @@ Provide:
 5. Expected savings if habits are corrected
 
 Format as actionable JSON with clear recommendations.'''
-    
-    analysis = await get_ai_response(prompt, "You are a behavioral psychologist specializing in financial habits.")
-    
-    return {
-        "analysis": analysis,
-        "patterns": {
-            "late_night_count": len(late_night_purchases),
-            "weekend_count": len(weekend_purchases),
-            "impulsive_count": len(impulsive_purchases)
-        }
+    patterns = {
+        "late_night_count": features["late_night_count"],
+        "weekend_count": features["weekend_count"],
+        "impulsive_count": features["impulsive_count"]
     }
+    return prompt, patterns
+
+@api_router.post("/ai/habit-correction")
+async def habit_correction_analysis(user_id: str = "default_user"):
+    """Neural habit correction engine - identify and suggest habit changes"""
+    prompt, patterns = await habit_correction_prompt(user_id)
+    analysis = await get_ai_response(prompt, HABIT_SYSTEM_MESSAGE, user_id=user_id)
+    
+    return {"analysis": analysis, "patterns": patterns}
+
+@api_router.post("/ai/habit-correction/stream")
+async def habit_correction_analysis_stream(http_request: Request, user_id: str = "default_user"):
+    """SSE variant of /ai/habit-correction"""
+    prompt, patterns = await habit_correction_prompt(user_id)
+    return stream_completion(
+        http_request, prompt, HABIT_SYSTEM_MESSAGE,
+        lambda text: {"analysis": text, "patterns": patterns}, user_id=user_id
+    )
 
 @api_router.post("/ai/emotional-spending")
 async def emotional_spending_predictor(user_id: str = "default_user"):
     """Predict emotional spending patterns"""
-    expenses = await db.expenses.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    features = await user_temporal_features(user_id)
     
     # Analyze time patterns
-    hourly_spending = {}
-    for expense in expenses:
-        date = datetime.fromisoformat(expense["date"].replace("Z", "+00:00"))
-        hour = date.hour
-        hourly_spending[hour] = hourly_spending.get(hour, 0) + expense["amount"]
+    hourly_spending = features["hourly_spending"]
     
     # Find emotional spending hours
     avg_spending = sum(hourly_spending.values()) / len(hourly_spending) if hourly_spending else 0
@@ -1344,7 +3782,7 @@ async def emotional_spending_predictor(user_id: str = "default_user"):
     
     prompt = f'''Analyze emotional spending patterns:
 
-Total Transactions: {len(expenses)}
+Total Transactions: {features["transaction_count"]}
 High-spending hours: {emotional_hours}
 Average hourly spend: ₹{avg_spending:.2f}
 
@@ -1357,7 +3795,7 @@ Identify:
 
 Provide psychological insights and preventive measures.'''
     
-    prediction = await get_ai_response(prompt, "You are a financial psychologist analyzing emotional spending behaviors.")
+    prediction = await get_ai_response(prompt, "You are a financial psychologist analyzing emotional spending behaviors.", user_id=user_id)
     
     return {
         "prediction": prediction,
@@ -1365,6 +3803,101 @@ Provide psychological insights and preventive measures.'''
         "risk_level": "high" if len(emotional_hours) > 5 else "medium" if len(emotional_hours) > 2 else "low"
     }
 
+# ============ BACKGROUND JOBS ============
+
+# Slow AI analyses can run as jobs instead of inside the request: submit
+# returns a job id at once, and the result is polled or pushed over SSE.
+# Jobs are deduplicated per (analysis, user, data version), so resubmitting
+# before anything changed returns the same job.
+JOB_ANALYSES = {
+    "habit-correction": habit_correction_analysis,
+    "emotional-spending": emotional_spending_predictor,
+    "financial-story": generate_financial_story,
+}
+JOB_EVENT_POLL_SECONDS = 1.0
+
+async def run_analysis_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    result = await JOB_ANALYSES[job["kind"]](user_id=job["user_id"])
+    if AI_UNAVAILABLE_MESSAGE in result.values():
+        # Retry later rather than storing the canned text as the answer
+        raise RuntimeError("LLM unavailable")
+    return jsonable_encoder(result)
+
+job_queue = JobQueue(
+    db.jobs,
+    {kind: run_analysis_job for kind in JOB_ANALYSES},
+    workers=int(os.environ.get("JOB_WORKERS", "4")),
+    max_attempts=int(os.environ.get("JOB_MAX_ATTEMPTS", "3")),
+    on_metric=incr_metric
+)
+
+JOB_PUBLIC_FIELDS = ["id", "kind", "user_id", "status", "attempts", "result", "error", "created_at", "finished_at", "reused"]
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: job[field] for field in JOB_PUBLIC_FIELDS if field in job}
+
+@api_router.post("/jobs/{analysis}", status_code=202)
+async def submit_analysis_job(analysis: str, user_id: str = "default_user"):
+    """Queue habit-correction, emotional-spending or financial-story; poll /jobs/{id} for the result"""
+    if analysis not in JOB_ANALYSES:
+        raise HTTPException(status_code=404, detail=f"Unknown analysis: {analysis}")
+    version = await user_data_version(user_id)
+    job = await job_queue.submit(analysis, user_id, f"{analysis}:{user_id}:{version}")
+    return public_job(job)
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@api_router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """SSE: a `status` event on every change, then `done` with the finished job"""
+    if not await job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_status = None
+        while not await request.is_disconnected():
+            job = await job_queue.get(job_id)
+            if not job:
+                yield sse_event("error", {"message": "Job not found"})
+                return
+            if job["status"] in ("done", "failed"):
+                yield sse_event("done", public_job(job))
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield sse_event("status", public_job(job))
+            await job_queue.wait(job_id, JOB_EVENT_POLL_SECONDS)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ============ METRICS ROUTE ============
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Process-local counters; each worker reports its own"""
+    hits = metrics.get("analytics_cache.local_hits", 0) + metrics.get("analytics_cache.shared_hits", 0)
+    lookups = hits + metrics.get("analytics_cache.misses", 0)
+    return {
+        "counters": dict(sorted(metrics.items())),
+        "analytics_cache": {
+            "size": len(analytics_cache),
+            "maxsize": analytics_cache.maxsize,
+            "ttl_seconds": ANALYTICS_CACHE_TTL,
+            "shared": ANALYTICS_CACHE_SHARED,
+            "hit_rate": hits / lookups if lookups else None
+        },
+        "categorizer": {**categorizer.stats(), "version": categorizer_version},
+        "llm": llm_gateway.stats()
+    }
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -1383,9 +3916,35 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Strong references to fire-and-forget tasks so they aren't garbage collected
+background_tasks = set()
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+@app.on_event("startup")
+async def startup_indexes():
+    await ensure_indexes()
+    start_background_task(run_migrations())
+    start_background_task(backfill_badge_rules())
+    start_background_task(categorizer_sync_loop())
+    start_background_task(recurring_scheduler_loop())
+    start_background_task(price_poll_loop())
+    start_background_task(ranking_recompute_loop())
+    start_background_task(weekly_report_loop())
+    start_background_task(job_queue.run())
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    await llm_gateway.aclose()
+    await price_poller.aclose()
+    if mailer:
+        await mailer.aclose()
+    receipt_executor.shutdown(wait=False)
 
 # ============ GLOBAL EXCEPTION HANDLER ============
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -1435,13 +3994,11 @@ async def create_expense_from_voice_fixed(request: VoiceExpenseRequest):
         data = json.loads(response.replace('```json','').replace('```','').strip())
         expense = Expense(amount=data["amount"], category=data["category"], description=data.get("description", request.voice_text))
     except:
-        # FALLBACK: Simple regex parsing
-        import re
-        amount = float(re.search(r'[0-9]+', request.voice_text).group() or 0) if re.search(r'[0-9]+', request.voice_text) else 0
-        expense = Expense(amount=amount, category="Other", description=request.voice_text)
+        # FALLBACK: Local grammar parse
+        parsed = parse_voice(request.voice_text, match_merchant_keywords)
+        expense = Expense(amount=parsed["amount"] or 0, category=parsed["category"] or "Other", description=parsed["description"] or request.voice_text)
     
-    doc = expense.model_dump()
-    await db.expenses.insert_one(doc)
+    await insert_expense(expense)
     return {"success": True, "expense": expense}
 
 # Override Receipt Scanner to work WITHOUT AI
@@ -1449,18 +4006,14 @@ async def create_expense_from_voice_fixed(request: VoiceExpenseRequest):
 async def scan_receipt_fixed(request: ReceiptAnalysisRequest):
     try:
         # Try AI analysis
-        from emergentintegrations.llm.chat import ImageContent
-        chat = LlmChat(api_key=EMERGENT_LLM_KEY, session_id=str(uuid.uuid4()),system_message="Extract receipt data as JSON").with_model("openai", "gpt-4o-mini")
-        image = ImageContent(image_base64=request.image_base64)
-        msg = UserMessage(text="Extract: merchant, total, category, date, items as JSON", file_contents=[image])
-        resp = await chat.send_message(msg)
+        resp = await llm_gateway.complete("Extract: merchant, total, category, date, items as JSON", "Extract receipt data as JSON", images=[request.image_base64])
         data = json.loads(resp.replace('```json','').replace('```','').strip())
     except:
         # FALLBACK: Create placeholder
         data = {"merchant": "Receipt", "total": 0, "category": "Shopping", "date": None, "items": []}
     
     expense = Expense(amount=data.get("total",0), category=data.get("category","Shopping"), description=f"Receipt: {data.get('merchant','Unknown')}")
-    await db.expenses.insert_one(expense.model_dump())
+    await insert_expense(expense)
     return {"success": True, "receipt_data": data, "expense": expense}
 
 
@@ -0,0 +1,67 @@
+"""
+Vectorized temporal spending features shared by the behaviour, habit and
+emotional-spending analytics.
+
+Expenses are loaded once into columnar numpy arrays (amount, IST hour,
+IST weekday, impulsive-category flag) and every histogram and count is
+computed from those arrays instead of per-row Python loops.
+"""
+
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+IMPULSIVE_CATEGORIES = {"Food", "Shopping"}
+IMPULSIVE_AMOUNT = 500
+LATE_NIGHT_START = 22
+LATE_NIGHT_END = 4
+
+
+def columns_from_rows(rows: Iterable[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Single pass over expense rows carrying amount, category, local_hour, local_weekday"""
+    amounts, hours, weekdays, impulsive_category = [], [], [], []
+    for row in rows:
+        amounts.append(row["amount"])
+        hours.append(row["local_hour"])
+        weekdays.append(row["local_weekday"])
+        impulsive_category.append(row.get("category") in IMPULSIVE_CATEGORIES)
+    return {
+        "amount": np.asarray(amounts, dtype=np.float64),
+        "hour": np.asarray(hours, dtype=np.int8),
+        "weekday": np.asarray(weekdays, dtype=np.int8),
+        "impulsive_category": np.asarray(impulsive_category, dtype=bool),
+    }
+
+
+def compute_features(columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    """Every temporal feature the analytics routes use, from one set of arrays"""
+    amount = columns["amount"]
+    hour = columns["hour"]
+    weekday = columns["weekday"]
+
+    weekday_totals = np.bincount(weekday, weights=amount, minlength=7)
+    weekday_counts = np.bincount(weekday, minlength=7)
+    hourly_totals = np.bincount(hour, weights=amount, minlength=24)
+    hourly_counts = np.bincount(hour, minlength=24)
+
+    late_night = (hour >= LATE_NIGHT_START) | (hour <= LATE_NIGHT_END)
+    weekend = weekday >= 5
+    impulsive = (amount > IMPULSIVE_AMOUNT) & columns["impulsive_category"]
+
+    return {
+        "transaction_count": int(amount.size),
+        "total_amount": float(amount.sum()),
+        # Only days/hours that actually saw spending, as the routes always reported
+        "weekday_spending": {
+            WEEKDAY_NAMES[d]: float(weekday_totals[d]) for d in range(7) if weekday_counts[d]
+        },
+        "hourly_spending": {h: float(hourly_totals[h]) for h in range(24) if hourly_counts[h]},
+        "late_night_count": int(late_night.sum()),
+        "late_night_amount": float(amount[late_night].sum()),
+        "weekend_count": int(weekend.sum()),
+        "weekend_amount": float(amount[weekend].sum()),
+        "impulsive_count": int(impulsive.sum()),
+        "impulsive_amount": float(amount[impulsive].sum()),
+    }
+
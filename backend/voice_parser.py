@@ -0,0 +1,242 @@
+"""
+Deterministic parser for spoken expense entries.
+
+Turns utterances such as "add chai 12 rupees", "petrol do hazaar" or
+"ऑटो पचास रुपये" into amount, description, merchant and category with a
+confidence score, without a model call. Handles digits ("1,200", "12.5k",
+"₹40"), number words in English, Hindi, Telugu, Tamil and Kannada (Latin
+transliteration and native script), thousand/lakh/crore multipliers and
+rs/₹/rupees units. Ambiguous utterances (two unrelated numbers, no
+recognisable category) come back with low confidence so the caller can
+fall back to the LLM.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# ============ LEXICON ============
+
+UNITS = {
+    "0": 0, "zero": 0,
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9,
+    "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19,
+    "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+    # Hindi
+    "ek": 1, "teen": 3, "char": 4, "chaar": 4, "paanch": 5, "panch": 5, "chhe": 6,
+    "saat": 7, "aath": 8, "nau": 9, "das": 10, "gyarah": 11, "barah": 12, "pandrah": 15,
+    "bees": 20, "pachees": 25, "tees": 30, "chalis": 40, "chaalis": 40, "pachas": 50, "pachaas": 50,
+    "sattar": 70, "assi": 80, "nabbe": 90,
+    "एक": 1, "दो": 2, "तीन": 3, "चार": 4, "पांच": 5, "पाँच": 5, "छह": 6, "सात": 7, "आठ": 8, "नौ": 9,
+    "दस": 10, "बीस": 20, "पच्चीस": 25, "तीस": 30, "चालीस": 40, "पचास": 50, "साठ": 60, "सत्तर": 70,
+    "अस्सी": 80, "नब्बे": 90,
+    # Telugu
+    "okati": 1, "rendu": 2, "moodu": 3, "naalugu": 4, "aidu": 5, "aaru": 6, "enimidi": 8,
+    "tommidi": 9, "padi": 10, "iravai": 20, "muppai": 30, "nalabhai": 40, "yabhai": 50,
+    "ఒకటి": 1, "రెండు": 2, "మూడు": 3, "నాలుగు": 4, "ఐదు": 5, "ఆరు": 6, "ఏడు": 7, "ఎనిమిది": 8,
+    "తొమ్మిది": 9, "పది": 10, "ఇరవై": 20, "ముప్పై": 30, "నలభై": 40, "యాభై": 50,
+    # Tamil
+    "onru": 1, "onnu": 1, "irandu": 2, "moonu": 3, "moondru": 3, "naalu": 4, "naangu": 4, "anju": 5,
+    "ainthu": 5, "ezhu": 7, "ettu": 8, "onbathu": 9, "pathu": 10, "irupathu": 20, "muppathu": 30,
+    "naarpathu": 40, "aimbathu": 50,
+    "ஒன்று": 1, "இரண்டு": 2, "மூன்று": 3, "நான்கு": 4, "ஐந்து": 5, "ஆறு": 6, "ஏழு": 7, "எட்டு": 8,
+    "ஒன்பது": 9, "பத்து": 10, "இருபது": 20, "முப்பது": 30, "நாற்பது": 40, "ஐம்பது": 50,
+    # Kannada
+    "ondu": 1, "eradu": 2, "mooru": 3, "naalku": 4, "elu": 7, "entu": 8, "ombattu": 9, "hattu": 10,
+    "ippattu": 20, "moovattu": 30, "nalavattu": 40, "aivattu": 50,
+    "ಒಂದು": 1, "ಎರಡು": 2, "ಮೂರು": 3, "ನಾಲ್ಕು": 4, "ಐದು": 5, "ಆರು": 6, "ಏಳು": 7, "ಎಂಟು": 8,
+    "ಒಂಬತ್ತು": 9, "ಹತ್ತು": 10, "ಇಪ್ಪತ್ತು": 20, "ಮೂವತ್ತು": 30, "ನಲವತ್ತು": 40, "ಐವತ್ತು": 50,
+}
+
+# Number words that are also ordinary English words; only read as numbers
+# right before a hundred/thousand word ("do hazaar", "che sau")
+SCALED_UNITS = {"do": 2, "che": 6, "edu": 7}
+
+HUNDREDS = {"hundred", "sau", "सौ", "vanda", "vandha", "వంద", "nooru", "நூறு", "ನೂರು"}
+
+MULTIPLIERS = {
+    "k": 1_000, "thousand": 1_000, "hazaar": 1_000, "hazar": 1_000, "हज़ार": 1_000, "हजार": 1_000,
+    "veyyi": 1_000, "వెయ్యి": 1_000, "aayiram": 1_000, "ஆயிரம்": 1_000, "saavira": 1_000, "ಸಾವಿರ": 1_000,
+    "lakh": 100_000, "lakhs": 100_000, "lac": 100_000, "lacs": 100_000, "लाख": 100_000,
+    "crore": 10_000_000, "crores": 10_000_000, "करोड़": 10_000_000,
+}
+
+CURRENCY_WORDS = {
+    "₹", "rs", "inr", "rupee", "rupees", "rupaye", "rupay", "rupaiya", "bucks",
+    "रुपये", "रुपए", "रुपया", "రూపాయలు", "రూపాయి", "ரூபாய்", "ರೂಪಾಯಿ",
+}
+
+FILLER_WORDS = {
+    "add", "added", "spent", "spend", "paid", "pay", "bought", "for", "on", "of", "to", "at", "a", "an",
+    "the", "and", "my", "today", "just", "please", "expense",
+    "ka", "ki", "ke", "ko", "mein", "me", "par", "pe", "kiya", "kharch", "kharcha", "diya", "diye", "karo", "liye",
+    "का", "की", "के", "को", "में", "पर", "किया", "खर्च", "दिया", "दिए", "करो", "लिए",
+}
+
+# Keyword -> category, for descriptions that name what was bought
+CATEGORY_KEYWORDS = {
+    "Food": [
+        "chai", "tea", "coffee", "breakfast", "lunch", "dinner", "snacks", "snack", "samosa", "biryani",
+        "dosa", "idli", "pizza", "burger", "meal", "food", "juice", "thali", "restaurant", "groceries",
+        "grocery", "vegetables", "sabzi", "milk", "doodh", "khana", "चाय", "खाना", "దోస", "காபி", "ಊಟ",
+    ],
+    "Transport": [
+        "auto", "rickshaw", "cab", "taxi", "metro", "bus", "train", "petrol", "diesel", "fuel", "parking",
+        "toll", "ऑटो", "पेट्रोल", "బస్", "ஆட்டோ", "ಬಸ್",
+    ],
+    "Shopping": ["shirt", "shoes", "clothes", "jeans", "dress", "shopping", "kurta", "saree", "bag", "watch"],
+    "Entertainment": ["movie", "movies", "cinema", "concert", "game", "games"],
+    "Healthcare": ["medicine", "medicines", "pharmacy", "doctor", "hospital", "clinic", "dawai", "दवाई", "chemist"],
+    "Bills": ["electricity", "rent", "wifi", "internet", "broadband", "gas", "water", "dth"],
+}
+
+# Keywords that say what kind of payment it was rather than what it was for
+# ("metro card recharge", "bus tickets"); they only decide the category when
+# no other keyword does
+GENERIC_KEYWORDS = {"recharge": "Bills", "bill": "Bills", "tickets": "Entertainment"}
+
+# Category of each merchant name the caller's merchant matcher can return
+MERCHANT_CATEGORIES = {
+    "Zomato": "Food", "Swiggy": "Food", "Starbucks": "Food", "McDonald's": "Food",
+    "BigBasket": "Food", "Blinkit": "Food",
+    "Uber": "Transport", "Ola": "Transport",
+    "Amazon": "Shopping", "Flipkart": "Shopping",
+    "Netflix": "Entertainment", "Prime Video": "Entertainment", "Spotify": "Entertainment",
+}
+
+KEYWORD_CATEGORY = {kw: category for category, kws in CATEGORY_KEYWORDS.items() for kw in kws}
+
+# Digits with optional separators/decimals and an optional glued k/l suffix ("5k", "1.5l")
+NUMERAL = re.compile(r"^(\d+(?:,\d+)*(?:\.\d+)?)(k|l|lakh|rs)?$")
+TOKEN = re.compile(r"₹|[\w\u0900-\u0DFF.,]+")
+
+# ============ PARSER ============
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased tokens with ₹ split off and trailing punctuation stripped"""
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        token = token.strip(".,")
+        if token.startswith("rs") and token[2:].replace(",", "").replace(".", "").isdigit():
+            tokens.extend(["rs", token[2:]])
+        elif token:
+            tokens.append(token)
+    return tokens
+
+
+def number_value(token: str) -> Optional[Tuple[float, int]]:
+    """(value, multiplier) of a numeral token; multiplier is 1 unless a k/l suffix is glued on"""
+    match = NUMERAL.match(token)
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", ""))
+    suffix = match.group(2)
+    multiplier = 1_000 if suffix == "k" else 100_000 if suffix in ("l", "lakh") else 1
+    return value, multiplier
+
+
+def number_groups(tokens: List[str]) -> List[Dict]:
+    """Runs of consecutive number tokens, each folded into one value with its token span"""
+    groups = []
+    i = 0
+    while i < len(tokens):
+        start = i
+        total = current = 0.0
+        seen = False
+        while i < len(tokens):
+            token = tokens[i]
+            numeral = number_value(token)
+            if numeral is not None:
+                value, multiplier = numeral
+                if multiplier > 1:
+                    total += (current + value) * multiplier
+                    current = 0.0
+                else:
+                    current += value
+            elif token in UNITS:
+                current += UNITS[token]
+            elif token in SCALED_UNITS and i + 1 < len(tokens) and (tokens[i + 1] in HUNDREDS or tokens[i + 1] in MULTIPLIERS):
+                current += SCALED_UNITS[token]
+            elif token in HUNDREDS:
+                current = max(current, 1) * 100
+            elif token in MULTIPLIERS and seen:
+                total += max(current, 1) * MULTIPLIERS[token]
+                current = 0.0
+            elif token in MULTIPLIERS and token != "k" and i + 1 < len(tokens) and number_value(tokens[i + 1]) is None:
+                # A bare "thousand"/"hazaar" means one thousand
+                total += MULTIPLIERS[token]
+            else:
+                break
+            seen = True
+            i += 1
+        if seen:
+            groups.append({"value": total + current, "start": start, "end": i})
+        else:
+            i += 1
+    return groups
+
+
+def next_to_currency(tokens: List[str], group: Dict) -> bool:
+    before = tokens[group["start"] - 1] if group["start"] > 0 else None
+    after = tokens[group["end"]] if group["end"] < len(tokens) else None
+    return before in CURRENCY_WORDS or after in CURRENCY_WORDS
+
+
+def parse_voice(
+    text: str,
+    merchant_of: Optional[Callable[[str], Optional[str]]] = None
+) -> Dict:
+    """Parse one utterance.
+
+    Returns amount, description, merchant, category (None when no
+    dictionary matched) and confidence in [0, 1] covering both the amount
+    and the category. merchant_of maps free text to a merchant name.
+    """
+    tokens = tokenize(text)
+    groups = number_groups(tokens)
+
+    # Which number is the price: the one next to a currency word, else the only one
+    priced = [g for g in groups if next_to_currency(tokens, g)]
+    if len(priced) == 1:
+        amount_group, amount_confidence = priced[0], 1.0 if len(groups) == 1 else 0.85
+    elif len(groups) == 1:
+        amount_group, amount_confidence = groups[0], 0.9
+    else:
+        amount_group, amount_confidence = None, 0.0
+
+    used = set()
+    for group in groups:
+        used.update(range(group["start"], group["end"]))
+    words = [
+        token for index, token in enumerate(tokens)
+        if index not in used and token not in CURRENCY_WORDS and token not in FILLER_WORDS
+        and token not in MULTIPLIERS and number_value(token) is None
+    ]
+    description = " ".join(words)
+
+    merchant = merchant_of(description) if merchant_of and description else None
+    category = MERCHANT_CATEGORIES.get(merchant) if merchant else None
+    category_confidence = 0.95 if category else 0.0
+    if category is None:
+        hits = {KEYWORD_CATEGORY[w] for w in words if w in KEYWORD_CATEGORY}
+        if not hits:
+            hits = {GENERIC_KEYWORDS[w] for w in words if w in GENERIC_KEYWORDS}
+        if len(hits) == 1:
+            category, category_confidence = hits.pop(), 0.9
+        elif len(hits) > 1:
+            category_confidence = 0.3  # e.g. "lunch and auto": two things in one entry
+
+    if not description:
+        amount_confidence *= 0.8
+
+    return {
+        "amount": round(amount_group["value"], 2) if amount_group and amount_group["value"] > 0 else None,
+        "description": description[:1].upper() + description[1:] if description else "",
+        "merchant": merchant,
+        "category": category,
+        "amount_confidence": amount_confidence if amount_group and amount_group["value"] > 0 else 0.0,
+        "category_confidence": category_confidence,
+        "confidence": amount_confidence * category_confidence,
+    }
+
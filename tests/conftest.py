@@ -0,0 +1,21 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# The backend modules are flat siblings of server.py, imported by name
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+@pytest.fixture(scope="session")
+def server():
+    """server.py imported without a database; only its pure helpers are usable"""
+    for module in ("fastapi", "motor", "PIL", "cachetools", "dotenv"):
+        pytest.importorskip(module)
+    # The Motor client connects lazily, so nothing is contacted at import
+    os.environ.setdefault("MONGO_URL", "mongodb://127.0.0.1:1")
+    os.environ.setdefault("DB_NAME", "finote_test")
+    os.environ.setdefault("LLM_BASE_URL", "http://127.0.0.1:1/v1")
+    import server
+    return server
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from categorizer import Categorizer
+
+HISTORY = [
+    ("u1", ["swiggy", "dinner"], "Food"),
+    ("u1", ["zomato", "lunch"], "Food"),
+    ("u2", ["swiggy", "biryani"], "Food"),
+    ("u2", ["uber", "office"], "Transport"),
+    ("u3", ["uber", "airport"], "Transport"),
+    ("u3", ["electricity", "bill"], "Bills"),
+]
+
+MIN_CONFIDENCE = 0.8
+
+
+@pytest.fixture
+def model():
+    model = Categorizer()
+    for user_id, features, category in HISTORY:
+        model.learn(user_id, features, category)
+    return model
+
+
+def test_predicts_the_majority_label(model):
+    assert model.predict(["swiggy"])[0] == "Food"
+    assert model.predict(["uber", "ride"])[0] == "Transport"
+
+
+def test_unknown_features_predict_nothing(model):
+    assert model.predict(["gym", "membership"]) == (None, 0.0)
+    assert Categorizer().predict(["swiggy"]) == (None, 0.0)
+
+
+def test_confidence_clears_the_threshold_only_for_clear_cases(model):
+    for _ in range(5):
+        model.learn("u1", ["swiggy"], "Food")
+    category, confidence = model.predict(["swiggy"])
+    assert category == "Food" and confidence >= MIN_CONFIDENCE
+
+    # One word seen once under each of two labels is a coin flip
+    model.learn("u1", ["amazon"], "Shopping")
+    model.learn("u2", ["amazon"], "Bills")
+    _, confidence = model.predict(["amazon"])
+    assert confidence < MIN_CONFIDENCE
+
+
+def test_confidence_is_a_probability(model):
+    _, confidence = model.predict(["swiggy", "uber"])
+    assert 0.0 < confidence <= 1.0
+
+
+def test_user_labels_outweigh_the_crowd(model):
+    model.learn("u9", ["uber"], "Food")
+    assert model.predict(["uber"])[0] == "Transport"
+    assert model.predict(["uber"], "u9")[0] == "Food"
+
+
+def test_correction_moves_the_prediction_incrementally(model):
+    assert model.predict(["electricity"], "u3")[0] == "Bills"
+    # update_expense: forget the recorded label, learn the fixed one with more weight
+    model.forget("u3", ["electricity", "bill"], "Bills")
+    model.learn("u3", ["electricity", "bill"], "Transport", 3.0)
+    assert model.predict(["electricity"], "u3")[0] == "Transport"
+
+
+def test_forget_undoes_learn_exactly(model):
+    before = model.stats()
+    model.learn("u4", ["netflix"], "Entertainment", 3.0)
+    model.forget("u4", ["netflix"], "Entertainment", 3.0)
+    assert model.stats() == {**before, "users": before["users"] + 1}
+    assert "netflix" not in model.global_counts.vocabulary
+    assert "Entertainment" not in model.global_counts.docs
+
+
+def test_documents_round_trip(model):
+    loaded = Categorizer()
+    for doc in model.to_documents():
+        loaded.load(doc)
+    assert loaded.stats() == model.stats()
+    for features, user_id in ((["swiggy"], None), (["uber", "office"], "u2"), (["bill"], "u3")):
+        assert loaded.predict(features, user_id) == pytest.approx(model.predict(features, user_id))
+
+
+def test_documents_survive_keys_mongo_rejects():
+    model = Categorizer()
+    model.learn("u1", ["merchant:Amazon Prime", "a.b"], "Kids.School")
+    loaded = Categorizer()
+    for doc in model.to_documents():
+        assert isinstance(doc["docs"], list) and isinstance(doc["features"], list)
+        loaded.load(doc)
+    assert loaded.predict(["a.b"], "u1")[0] == "Kids.School"
+
+
+def test_swap_replays_learns_made_while_building(server, monkeypatch):
+    monkeypatch.setattr(server, "categorizer", Categorizer())
+    correction = {
+        "user_id": "u1", "category": "Transport", "category_corrected": True,
+        "description": "ola to office", "merchant": None
+    }
+
+    async def build():
+        fresh = Categorizer()
+        fresh.learn("u1", ["swiggy"], "Food")
+        # A write handled while the scan or load is still running
+        server.learn_expense_category(correction)
+        await asyncio.sleep(0)
+        return fresh
+
+    fresh = asyncio.run(server.swap_categorizer(build))
+    assert server.categorizer is fresh
+    assert server.categorizer_pending is None
+    assert fresh.predict(["ola"], "u1")[0] == "Transport"
+    assert fresh.global_counts.docs["Transport"] == server.CORRECTION_WEIGHT
+
+
+def test_features_use_whole_word_merchants(server):
+    assert "merchant:Ola" in server.category_features({"description": "ola to office"})
+    assert not any(f.startswith("merchant:") for f in server.category_features({"description": "chocolate 50 rupees"}))
@@ -0,0 +1,243 @@
+import asyncio
+import contextlib
+import json
+from typing import Dict
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from llm_gateway import CircuitBreaker, LLMGateway, LLMUnavailable, OpenAICompatibleBackend
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeBackend:
+    """Answers after `delay` seconds, or raises when `fail` is set"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.fail = False
+        self.calls = 0
+
+    async def complete(self, prompt, system_message, images=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("provider down")
+        return "answer"
+
+    async def aclose(self):
+        pass
+
+
+def test_breaker_opens_after_threshold_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30, clock=clock)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now = 30
+    assert breaker.state == "half_open"
+    # Exactly one trial call goes through
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    # An abandoned trial frees the slot for the next caller without closing
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_abandoned()
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_gateway_fails_fast_while_open():
+    clock = FakeClock()
+    backend = FakeBackend()
+    gateway = LLMGateway(backend, breaker=CircuitBreaker(failure_threshold=3, reset_seconds=5, clock=clock))
+
+    async def run():
+        backend.fail = True
+        for _ in range(3):
+            with pytest.raises(LLMUnavailable, match="provider error"):
+                await gateway.complete("hi", "sys")
+        with pytest.raises(LLMUnavailable, match="circuit is open"):
+            await gateway.complete("hi", "sys")
+        open_calls = backend.calls
+
+        backend.fail = False
+        clock.now = 5
+        answer = await gateway.complete("hi", "sys")
+        return open_calls, answer
+
+    open_calls, answer = asyncio.run(run())
+    assert open_calls == 3  # the rejected call never reached the provider
+    assert answer == "answer"
+    assert gateway.breaker.state == "closed"
+
+
+def test_timeouts_count_as_failures():
+    gateway = LLMGateway(FakeBackend(delay=1), timeout=0.05, breaker=CircuitBreaker(failure_threshold=2))
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(LLMUnavailable, match="timed out"):
+                await gateway.complete("hi", "sys")
+
+    asyncio.run(run())
+    assert gateway.breaker.state == "open"
+
+
+def test_concurrency_caps_and_queue_timeout():
+    gateway = LLMGateway(FakeBackend(delay=0.1), max_concurrency=4, per_user_concurrency=1, queue_timeout=0.15)
+
+    async def attempt(user_id):
+        try:
+            return await gateway.complete("hi", "sys", user_id=user_id)
+        except LLMUnavailable:
+            return None
+
+    async def run():
+        return await asyncio.gather(*(attempt("same-user") for _ in range(4)))
+
+    results = asyncio.run(run())
+    # One slot per user: two calls fit inside the queue deadline, the rest give up
+    assert results.count("answer") == 2
+    assert results.count(None) == 2
+    assert gateway.in_flight == 0
+    assert gateway.user_slots == {}
+    # Queue timeouts are not the provider's fault
+    assert gateway.breaker.state == "closed"
+
+
+STREAM_WORDS = "a streamed stub answer".split()
+
+
+async def stub_server(behaviour: Dict[str, object]):
+    """Minimal OpenAI-compatible endpoint; streams STREAM_WORDS one every 50 ms"""
+    async def handle(reader, writer):
+        try:
+            headers = await reader.readuntil(b"\r\n\r\n")
+            length = next(
+                (int(line.split(b":")[1]) for line in headers.split(b"\r\n") if line.lower().startswith(b"content-length")), 0
+            )
+            request = json.loads(await reader.readexactly(length))
+            await asyncio.sleep(behaviour["delay"])
+            if request.get("stream"):
+                # Close-delimited SSE body
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nConnection: close\r\n\r\n")
+                for word in STREAM_WORDS:
+                    delta = json.dumps({"choices": [{"delta": {"content": word + " "}}]})
+                    writer.write(f"data: {delta}\n\n".encode())
+                    await writer.drain()
+                    behaviour["chunks_sent"] += 1
+                    await asyncio.sleep(0.05)
+                writer.write(b"data: [DONE]\n\n")
+                await writer.drain()
+                return
+            body = b'{"choices": [{"message": {"content": "stub answer"}}]}'
+            writer.write(
+                f"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Client went away, or the server is shutting down mid-response
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def with_stub(scenario, **gateway_options):
+    behaviour = {"delay": 0.0, "chunks_sent": 0}
+    server, port = await stub_server(behaviour)
+    gateway = LLMGateway(OpenAICompatibleBackend(f"http://127.0.0.1:{port}", "", "stub"), **gateway_options)
+    try:
+        return await scenario(gateway, behaviour)
+    finally:
+        await gateway.aclose()
+        server.close()
+        await server.wait_closed()
+
+
+def test_stream_yields_every_chunk():
+    async def scenario(gateway, behaviour):
+        return [chunk async for chunk in gateway.stream("hi", "sys", user_id="u1")], gateway
+
+    chunks, gateway = asyncio.run(with_stub(scenario))
+    assert "".join(chunks).split() == STREAM_WORDS
+    assert gateway.in_flight == 0
+    assert gateway.user_slots == {}
+
+
+def test_closing_stream_cancels_upstream():
+    async def scenario(gateway, behaviour):
+        async with contextlib.aclosing(gateway.stream("hi", "sys", user_id="u1")) as chunks:
+            async for _ in chunks:
+                break  # the client disconnects after the first chunk
+        await asyncio.sleep(0.3)  # long enough for the stub to have sent everything
+        return behaviour["chunks_sent"], gateway
+
+    sent, gateway = asyncio.run(with_stub(scenario))
+    assert sent < len(STREAM_WORDS)
+    assert gateway.in_flight == 0
+    assert gateway.user_slots == {}
+    assert gateway.breaker.state == "closed"
+
+
+def test_cancelled_consumer_releases_slots():
+    async def scenario(gateway, behaviour):
+        async def consume():
+            async for _ in gateway.stream("hi", "sys", user_id="u1"):
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.08)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return gateway
+
+    gateway = asyncio.run(with_stub(scenario, max_concurrency=1))
+    assert gateway.in_flight == 0
+    assert gateway.user_slots == {}
+    assert not gateway.global_slots.locked()
+    # Walking away is neither a success nor a provider failure
+    assert gateway.breaker.failures == 0
+
+
+def test_stalled_stream_fails():
+    async def scenario(gateway, behaviour):
+        behaviour["delay"] = 1.0
+        with pytest.raises(LLMUnavailable, match="stalled"):
+            async for _ in gateway.stream("hi", "sys"):
+                pass
+        return gateway
+
+    gateway = asyncio.run(with_stub(scenario, timeout=0.1))
+    assert gateway.breaker.failures == 1
+    assert gateway.in_flight == 0
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from typing import Dict, List
+
+import pytest
+
+aiosmtplib = pytest.importorskip("aiosmtplib")
+
+from mailer import Mailer
+
+
+async def smtp_sink(received: List[Dict[str, object]], fail_every: int = 0, reject: str = ""):
+    """Minimal SMTP server that keeps every message.
+
+    fail_every=N answers every Nth DATA with a 451; DATA for the `reject`
+    recipient gets a 550.
+    """
+    counter = {"data": 0}
+
+    async def handle(reader, writer):
+        def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+
+        reply("220 sink ready")
+        envelope: Dict[str, object] = {"rcpt": []}
+        try:
+            while True:
+                line = (await reader.readline()).decode().rstrip("\r\n")
+                if not line:
+                    break
+                verb = line.split(" ", 1)[0].upper()
+                if verb in ("EHLO", "HELO"):
+                    reply("250-sink\r\n250 SIZE 10485760" if verb == "EHLO" else "250 sink")
+                elif verb == "MAIL":
+                    envelope = {"from": line[10:].strip("<>"), "rcpt": []}
+                    reply("250 OK")
+                elif verb == "RCPT":
+                    envelope["rcpt"].append(line[8:].strip("<>"))
+                    reply("250 OK")
+                elif verb == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    body = await reader.readuntil(b"\r\n.\r\n")
+                    counter["data"] += 1
+                    if reject and reject in envelope["rcpt"]:
+                        reply("550 Mailbox unavailable")
+                    elif fail_every and counter["data"] % fail_every == 0:
+                        reply("451 Try again later")
+                    else:
+                        received.append({**envelope, "data": body[:-5].decode(errors="replace")})
+                        reply("250 Queued")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:  # RSET, NOOP
+                    reply("250 OK")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+async def with_sink(scenario, sink_options=None, **mailer_options):
+    received: List[Dict[str, object]] = []
+    counters: Dict[str, float] = {}
+    server, port = await smtp_sink(received, **(sink_options or {}))
+    mailer = Mailer(
+        "127.0.0.1", port, "reports@finote.local", start_tls=False,
+        on_metric=lambda name, value: counters.__setitem__(name, counters.get(name, 0) + value),
+        **mailer_options
+    )
+    try:
+        await scenario(mailer)
+    finally:
+        await mailer.aclose()
+        server.close()
+        await server.wait_closed()
+    return received, counters
+
+
+def send_all(count: int):
+    async def scenario(mailer):
+        await asyncio.gather(*(
+            mailer.send(mailer.message(f"user{i}@example.com", f"Report {i}", f"Hello {i}", f"<p>Hello {i}</p>"))
+            for i in range(count)
+        ))
+    return scenario
+
+
+def test_pooled_delivery():
+    received, counters = asyncio.run(with_sink(send_all(40), pool_size=4, rate_per_second=0))
+    assert sorted(m["rcpt"][0] for m in received) == sorted(f"user{i}@example.com" for i in range(40))
+    assert "Report 7" in next(m["data"] for m in received if m["rcpt"] == ["user7@example.com"])
+    # Connections are opened once per pool slot and reused across messages
+    assert counters["mail.connections"] <= 4
+    assert counters["mail.sent"] == 40
+
+
+def test_transient_failures_are_retried():
+    received, counters = asyncio.run(with_sink(
+        send_all(20), sink_options={"fail_every": 5}, pool_size=2, rate_per_second=0
+    ))
+    assert len({m["rcpt"][0] for m in received}) == 20
+    assert counters["mail.retries"] >= 4
+    assert "mail.failed" not in counters
+
+
+def test_permanent_rejection_is_not_retried():
+    async def scenario(mailer):
+        with pytest.raises(aiosmtplib.SMTPResponseException) as raised:
+            await mailer.send(mailer.message("gone@example.com", "Report", "Hello"))
+        assert raised.value.code == 550
+        await mailer.send(mailer.message("ok@example.com", "Report", "Hello"))
+
+    received, counters = asyncio.run(with_sink(scenario, sink_options={"reject": "gone@example.com"}, rate_per_second=0))
+    assert [m["rcpt"] for m in received] == [["ok@example.com"]]
+    assert counters["mail.rejected"] == 1
+    assert "mail.retries" not in counters
+
+
+def test_rate_limit_spaces_message_starts():
+    count, rate = 20, 100
+    started = time.perf_counter()
+    received, _ = asyncio.run(with_sink(send_all(count), pool_size=4, rate_per_second=rate))
+    elapsed = time.perf_counter() - started
+    assert len(received) == count
+    # Starts are 1/rate apart, so the last one can't begin before (count - 1)/rate
+    assert elapsed >= (count - 1) / rate
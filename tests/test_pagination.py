@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+AT = datetime(2026, 3, 10, 12, 0)
+
+
+def test_cursor_round_trip(server):
+    token = server.encode_cursor({"date_at": AT, "id": "b"})
+    assert server.decode_cursor(token) == (AT, "b")
+
+
+def test_cursor_for_a_row_without_date_at(server):
+    # Rows the date migration hasn't reached must not 500 the page
+    token = server.encode_cursor({"date": "2026-03-10", "id": "b"})
+    assert server.decode_cursor(token) == (None, "b")
+
+
+def test_invalid_cursor_is_a_400(server):
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor("not-a-cursor")
+    assert error.value.status_code == 400
+
+
+def test_keyset_reaches_rows_without_date_at(server):
+    after = server.keyset_filter((AT, "b"))
+    assert {"date_at": None} in after["$or"]
+    assert server.keyset_filter((None, "b")) == {"date_at": None, "id": {"$lt": "b"}}
+
+
+def test_keyset_never_overrides_query_fields(server):
+    token = server.encode_cursor({"id": "b"})
+    query = {"user_id": "u1", "date_at": {"$gte": AT}}
+    assert server.with_keyset(query, token) == {"$and": [query, {"date_at": None, "id": {"$lt": "b"}}]}
+    token = server.encode_cursor({"date_at": AT, "id": "b"})
+    assert server.with_keyset({"user_id": "u1"}, token) == {"user_id": "u1", **server.keyset_filter((AT, "b"))}
@@ -0,0 +1,184 @@
+import asyncio
+import time
+from typing import List, Tuple
+
+import pytest
+
+pytest.importorskip("httpx")
+
+import price_poller
+from price_poller import HostLimiter, PricePoller, UnsafeURL, check_url, extract_price
+
+FIXTURE_PAGES = {
+    "/json-ld": '<html><script type="application/ld+json">{"@type": "Product", "offers": {"price": "1,299.00"}}</script></html>',
+    "/meta": '<html><meta property="product:price:amount" content="499"></html>',
+    "/itemprop": '<html><span itemprop="price" content="89.50">₹89.50</span></html>',
+    "/no-price": "<html><p>Out of stock</p></html>",
+}
+
+
+async def fixture_server(requests: List[Tuple[str, float, bool]]):
+    """Serves FIXTURE_PAGES with an ETag per page; answers 304 when it matches"""
+    async def handle(reader, writer):
+        try:
+            head = (await reader.readuntil(b"\r\n\r\n")).decode()
+            path = head.split(" ")[1]
+            conditional = f'if-none-match: "{path}"' in head.lower()
+            requests.append((path, time.monotonic(), conditional))
+            await asyncio.sleep(0.05)
+            if path == "/redirect":
+                writer.write(b"HTTP/1.1 302 Found\r\nLocation: /json-ld\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            elif path == "/large":
+                body = b"<html>" + b"x" * 10_000 + b"</html>"
+                writer.write(b"HTTP/1.1 200 OK\r\nConnection: close\r\n\r\n" + body)
+            elif path not in FIXTURE_PAGES:
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            elif conditional:
+                writer.write(f'HTTP/1.1 304 Not Modified\r\nETag: "{path}"\r\nConnection: close\r\n\r\n'.encode())
+            else:
+                body = FIXTURE_PAGES[path].encode()
+                writer.write(
+                    f'HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\nETag: "{path}"\r\n'
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+                )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def test_extractors():
+    assert extract_price("https://shop.example/p", FIXTURE_PAGES["/json-ld"]) == 1299.0
+    assert extract_price("https://shop.example/p", FIXTURE_PAGES["/meta"]) == 499.0
+    assert extract_price("https://shop.example/p", FIXTURE_PAGES["/itemprop"]) == 89.5
+    assert extract_price("https://shop.example/p", FIXTURE_PAGES["/no-price"]) is None
+
+
+def test_conditional_fetch_and_host_spacing():
+    async def run():
+        requests: List[Tuple[str, float, bool]] = []
+        server, port = await fixture_server(requests)
+        poller = PricePoller(per_host=2, delay=0.1, allow_private_hosts=True)
+        base = f"http://127.0.0.1:{port}"
+        targets = [{"url": base + path} for path in [*FIXTURE_PAGES, "/missing"]]
+        try:
+            first = await poller.poll(targets)
+            starts = sorted(at for _, at, _ in requests)
+
+            requests.clear()
+            second = await poller.poll([{**target, "etag": result["etag"]} for target, result in zip(targets, first)])
+            conditional = [path for path, _, sent in requests if sent]
+        finally:
+            await poller.aclose()
+            server.close()
+            await server.wait_closed()
+        return first, second, starts, conditional
+
+    first, second, starts, conditional = asyncio.run(run())
+
+    assert [r["status"] for r in first] == ["fetched", "fetched", "fetched", "no_price", "error"]
+    assert [r["price"] for r in first[:3]] == [1299.0, 499.0, 89.5]
+    assert first[0]["etag"] == '"/json-ld"'
+    # Every request to the one host starts at least `delay` after the previous one
+    assert all(b - a >= 0.09 for a, b in zip(starts, starts[1:]))
+
+    assert sorted(conditional) == sorted(FIXTURE_PAGES)
+    assert [r["status"] for r in second] == ["not_modified"] * 4 + ["error"]
+
+
+def test_bad_target_does_not_fail_the_batch():
+    async def run():
+        poller = PricePoller(delay=0)
+        try:
+            return await poller.poll([{"url": "not a url"}, {"url": "ftp://example.com/item"}])
+        finally:
+            await poller.aclose()
+
+    results = asyncio.run(run())
+    assert [r["status"] for r in results] == ["error", "error"]
+    assert all(r["error"] for r in results)
+
+
+def test_host_slot_released_when_cancelled_during_delay():
+    async def run():
+        limiter = HostLimiter(per_host=1, delay=10)
+        await limiter.acquire("shop.example")
+        limiter.release("shop.example")
+        # The second acquire sleeps out the delay and is cancelled mid-sleep
+        waiter = asyncio.create_task(limiter.acquire("shop.example"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return limiter.semaphores["shop.example"].locked()
+
+    assert asyncio.run(run()) is False
+
+
+@pytest.mark.parametrize("url", [
+    "file:///etc/passwd",
+    "gopher://example.com/",
+    "http:///no-host",
+    "http://127.0.0.1/admin",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5:27017/",
+    "http://[::1]/",
+    "http://[::ffff:127.0.0.1]/",
+])
+def test_check_url_rejects_unsafe_urls(url):
+    with pytest.raises(UnsafeURL):
+        check_url(url)
+
+
+def test_check_url_accepts_public_urls():
+    assert check_url("https://www.example.com/item?id=1") == "https://www.example.com/item?id=1"
+    assert check_url("http://93.184.216.34/") == "http://93.184.216.34/"
+
+
+def serve_and_poll(targets_for, **poller_options):
+    async def run():
+        requests: List[Tuple[str, float, bool]] = []
+        server, port = await fixture_server(requests)
+        poller = PricePoller(delay=0, **poller_options)
+        try:
+            return await poller.poll(targets_for(f"http://127.0.0.1:{port}")), requests
+        finally:
+            await poller.aclose()
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(run())
+
+
+def test_private_hosts_are_not_fetched():
+    results, requests = serve_and_poll(lambda base: [{"url": base + "/json-ld"}, {"url": "http://localhost:9/"}])
+    assert [r["status"] for r in results] == ["error", "error"]
+    assert all("UnsafeURL" in r["error"] for r in results)
+    assert requests == []
+
+
+def test_every_redirect_hop_is_checked(monkeypatch):
+    seen = []
+
+    async def check_resolved(url):
+        seen.append(url)
+        if url.endswith("/json-ld"):
+            raise UnsafeURL("redirect to a private address")
+
+    monkeypatch.setattr(price_poller, "check_resolved", check_resolved)
+    results, requests = serve_and_poll(lambda base: [{"url": base + "/redirect"}])
+    assert [path for path, _, _ in requests] == ["/redirect"]
+    assert [url.rsplit("/", 1)[1] for url in seen] == ["redirect", "json-ld"]
+    assert results[0]["status"] == "error"
+
+
+def test_body_size_is_capped():
+    results, _ = serve_and_poll(
+        lambda base: [{"url": base + "/large"}, {"url": base + "/meta"}], allow_private_hosts=True, max_bytes=1_000
+    )
+    assert results[0]["status"] == "error"
+    assert "PageTooLarge" in results[0]["error"]
+    assert results[1]["price"] == 499.0
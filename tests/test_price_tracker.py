@@ -0,0 +1,92 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+NOW = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+
+
+class RecordingCollection:
+    """Just enough of a Motor collection for record_prices: canned finds, recorded bulk writes"""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.writes = []
+
+    def find(self, *args, **kwargs):
+        collection = self
+
+        class Cursor:
+            async def to_list(self, length):
+                return list(collection.docs)
+
+        return Cursor()
+
+    async def bulk_write(self, requests, **kwargs):
+        self.writes.extend(requests)
+
+    async def insert_many(self, docs):
+        self.writes.extend(docs)
+
+
+@pytest.fixture
+def tracker():
+    # Motor hands back naive UTC datetimes
+    return {
+        "id": "t1", "user_id": "u1", "product_name": "Kettle", "current_price": 1000.0,
+        "target_price": 900.0, "price_updated_at": NOW.replace(tzinfo=None)
+    }
+
+
+@pytest.fixture
+def db(server, monkeypatch, tracker):
+    collections = {name: RecordingCollection() for name in ("price_points", "price_alerts")}
+    collections["price_trackers"] = RecordingCollection([tracker])
+
+    class FakeDB:
+        def __getattr__(self, name):
+            return collections[name]
+
+    monkeypatch.setattr(server, "db", FakeDB())
+    return collections
+
+
+def test_backdated_bulk_update_keeps_current_price(server, db):
+    last_month = NOW - timedelta(days=30)
+    result = asyncio.run(server.record_prices([
+        server.PriceUpdate(tracker_id="t1", price=850.0, date=last_month.isoformat()),
+        server.PriceUpdate(tracker_id="t1", price=870.0, date=(last_month + timedelta(days=1)).isoformat()),
+    ]))
+
+    assert result == {"updated": 2, "alerts": 0, "unknown_trackers": []}
+    # Both points are stored, and join the embedded tail in date order
+    assert len(db["price_points"].writes) == 2
+    pushes = [w for w in db["price_trackers"].writes if "$push" in w._doc]
+    assert all(w._doc["$push"]["price_history"]["$sort"] == {"date": 1} for w in pushes)
+    # current_price only moves where the point is newer than the stored one
+    sets = [w for w in db["price_trackers"].writes if "$set" in w._doc]
+    assert len(sets) == 2
+    for write, at in zip(sets, [last_month, last_month + timedelta(days=1)]):
+        assert {"price_updated_at": {"$lt": at}} in write._filter["$or"]
+    assert db["price_alerts"].writes == []
+
+
+def test_newer_point_below_target_alerts_once(server, db):
+    result = asyncio.run(server.record_prices([
+        server.PriceUpdate(tracker_id="t1", price=800.0, date=(NOW - timedelta(days=2)).isoformat()),
+        server.PriceUpdate(tracker_id="t1", price=880.0, date=(NOW + timedelta(hours=1)).isoformat()),
+        server.PriceUpdate(tracker_id="t1", price=850.0, date=(NOW + timedelta(hours=2)).isoformat()),
+    ]))
+    assert result["alerts"] == 1
+    alert = db["price_alerts"].writes[0]
+    assert alert["price"] == 880.0
+    assert alert["previous_price"] == 1000.0
+
+
+def test_alerts_ignore_points_older_than_current_price(server, tracker):
+    before, after = NOW - timedelta(minutes=1), NOW + timedelta(minutes=1)
+    assert server.target_price_alerts({"t1": tracker}, [("t1", 500.0, before)]) == []
+    assert len(server.target_price_alerts({"t1": tracker}, [("t1", 500.0, after)])) == 1
+    # A tracker that never had a timestamp takes any point as newer
+    untimed = {**tracker, "price_updated_at": None}
+    assert len(server.target_price_alerts({"t1": untimed}, [("t1", 500.0, before)])) == 1
@@ -0,0 +1,120 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from temporal_features import columns_from_rows, compute_features
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def legacy_features(expenses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The per-row loops the behaviour, habit and emotional routes used to run"""
+    weekday_spending, hourly_spending = {}, {}
+    late_night, weekend, impulsive = [], [], []
+    for expense in expenses:
+        date = datetime.fromisoformat(expense["date"].replace("Z", "+00:00"))
+        weekday = date.strftime("%A")
+        hour = date.hour
+        weekday_spending[weekday] = weekday_spending.get(weekday, 0) + expense["amount"]
+        hourly_spending[hour] = hourly_spending.get(hour, 0) + expense["amount"]
+        if hour >= 22 or hour <= 4:
+            late_night.append(expense)
+        if weekday in ["Saturday", "Sunday"]:
+            weekend.append(expense)
+        if expense["amount"] > 500 and expense["category"] in ["Food", "Shopping"]:
+            impulsive.append(expense)
+    return {
+        "transaction_count": len(expenses),
+        "total_amount": sum(e["amount"] for e in expenses),
+        "weekday_spending": weekday_spending,
+        "hourly_spending": hourly_spending,
+        "late_night_count": len(late_night),
+        "late_night_amount": sum(e["amount"] for e in late_night),
+        "weekend_count": len(weekend),
+        "weekend_amount": sum(e["amount"] for e in weekend),
+        "impulsive_count": len(impulsive),
+        "impulsive_amount": sum(e["amount"] for e in impulsive),
+    }
+
+
+def synthetic_expenses(n: int, seed: int = 7) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(seed)
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    offsets = rng.integers(0, 365 * 24 * 3600, size=n)
+    amounts = np.round(rng.gamma(2.0, 300.0, size=n), 2)
+    categories = rng.choice(["Food", "Shopping", "Transport", "Bills", "Entertainment"], size=n)
+    rows = []
+    for offset, amount, category in zip(offsets, amounts, categories):
+        # Dates carry the IST offset, so the legacy loop sees the same local hour and weekday
+        when = (start + timedelta(seconds=int(offset))).astimezone(IST)
+        rows.append({
+            "amount": float(amount),
+            "category": str(category),
+            "date": when.isoformat(),
+            "local_hour": when.hour,
+            "local_weekday": when.weekday(),
+        })
+    return rows
+
+
+@pytest.mark.parametrize("n", [0, 1, 5_000])
+def test_vectorized_matches_legacy(n):
+    rows = synthetic_expenses(n)
+    legacy = legacy_features(rows)
+    features = compute_features(columns_from_rows(rows))
+
+    assert features.keys() == legacy.keys()
+    for key, expected in legacy.items():
+        if isinstance(expected, dict):
+            assert features[key].keys() == expected.keys()
+            for bucket, amount in expected.items():
+                assert features[key][bucket] == pytest.approx(amount)
+        else:
+            assert features[key] == pytest.approx(expected)
+
+
+def test_boundaries():
+    rows = [
+        {"amount": 500, "category": "Food", "local_hour": 4, "local_weekday": 4},
+        {"amount": 501, "category": "Shopping", "local_hour": 22, "local_weekday": 5},
+        {"amount": 900, "category": "Bills", "local_hour": 21, "local_weekday": 6},
+        {"amount": 10, "local_hour": 5, "local_weekday": 0},
+    ]
+    features = compute_features(columns_from_rows(rows))
+    assert features["late_night_count"] == 2
+    assert features["weekend_count"] == 2
+    assert features["impulsive_count"] == 1
+    assert features["impulsive_amount"] == 501
+    assert features["weekday_spending"] == {"Monday": 10, "Friday": 500, "Saturday": 501, "Sunday": 900}
+
+
+def timed(function, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="set RUN_BENCHMARKS=1 to time legacy vs vectorized")
+@pytest.mark.parametrize("n", [10_000, 100_000])
+def test_benchmark_legacy_vs_vectorized(n, capsys):
+    rows = synthetic_expenses(n)
+    legacy = timed(legacy_features, rows)
+    load = timed(columns_from_rows, rows)
+    columns = columns_from_rows(rows)
+    compute = timed(compute_features, columns)
+    vectorized = load + compute
+    with capsys.disabled():
+        print(
+            f"\n{n:>7} rows: legacy {legacy * 1000:8.1f} ms | "
+            f"vectorized {vectorized * 1000:7.1f} ms (load {load * 1000:.1f}, compute {compute * 1000:.2f}) | "
+            f"speedup {legacy / vectorized:.1f}x"
+        )
+    assert vectorized < legacy
@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from merchants import MERCHANT_KEYWORDS, match_merchant_keywords as merchant_of
+from voice_parser import MERCHANT_CATEGORIES, parse_voice
+
+THRESHOLD = 0.75
+
+# (utterance, amount, category); None marks an utterance that should go to the LLM
+CORPUS = [
+    ("Add chai 12 rupees", 12, "Food"),
+    ("spent 450 on lunch", 450, "Food"),
+    ("paid ₹1,200 for electricity bill", 1200, "Bills"),
+    ("uber 320", 320, "Transport"),
+    ("swiggy order rs 560", 560, "Food"),
+    ("auto fifty rupees", 50, "Transport"),
+    ("petrol two thousand", 2000, "Transport"),
+    ("rent 1.5 lakh", 150000, "Bills"),
+    ("rent 15k", 15000, "Bills"),
+    ("movie tickets 600", 600, "Entertainment"),
+    ("medicine 230 rs", 230, "Healthcare"),
+    ("two thousand five hundred for shoes", 2500, "Shopping"),
+    ("amazon 1499", 1499, "Shopping"),
+    ("netflix 649 rupees", 649, "Entertainment"),
+    ("coffee at starbucks 350", 350, "Food"),
+    ("ola cab 275", 275, "Transport"),
+    ("metro card recharge 500", 500, "Transport"),
+    ("mobile recharge 299", 299, "Bills"),
+    ("bus tickets 120", 120, "Transport"),
+    ("breakfast 80", 80, "Food"),
+    ("wifi bill 999", 999, "Bills"),
+    ("doctor fee five hundred", 500, "Healthcare"),
+    ("chai bees rupaye", 20, "Food"),
+    ("petrol do hazaar", 2000, "Transport"),
+    ("dawai teen sau", 300, "Healthcare"),
+    ("khana pachaas rupaye", 50, "Food"),
+    ("चाय बीस रुपये", 20, "Food"),
+    ("ऑटो पचास रुपये", 50, "Transport"),
+    ("पेट्रोल दो हजार", 2000, "Transport"),
+    ("dosa aidu vanda", 500, "Food"),
+    ("bus iravai rupees", 20, "Transport"),
+    ("దోస యాభై రూపాయలు", 50, "Food"),
+    ("auto muppathu rupees", 30, "Transport"),
+    ("காபி இருபது ரூபாய்", 20, "Food"),
+    ("ஆட்டோ ஐம்பது", 50, "Transport"),
+    ("bus ippattu", 20, "Transport"),
+    ("ಊಟ ನೂರು ರೂಪಾಯಿ", 100, "Food"),
+    ("ಬಸ್ ಮೂವತ್ತು", 30, "Transport"),
+    ("2 coffees 300", None, None),
+    ("lunch 200 and auto 50", None, None),
+    ("gave money to ramesh 500", 500, None),
+    ("something", None, None),
+    # Merchant keywords inside other words must not name a merchant
+    ("chocolate 50 rupees", 50, None),
+    ("coca cola 40 rs", 40, None),
+    ("tuber vegetables 60 rupees", 60, "Food"),
+    ("primer paint 500 rupees", 500, None),
+]
+
+
+def test_corpus_accuracy():
+    resolvable = [row for row in CORPUS if row[1] is not None and row[2] is not None]
+    resolved, wrong = [], []
+    for utterance, amount, category in CORPUS:
+        parsed = parse_voice(utterance, merchant_of)
+        if parsed["confidence"] < THRESHOLD:
+            continue
+        resolved.append(utterance)
+        if parsed["amount"] != amount or parsed["category"] != category:
+            wrong.append((utterance, parsed))
+
+    # Every accepted parse is right; anything ambiguous must go to the LLM instead
+    assert wrong == []
+    assert len(resolved) / len(resolvable) >= 0.9
+
+
+def test_corpus_latency():
+    timings = []
+    for _ in range(50):
+        for utterance, _, _ in CORPUS:
+            started = time.perf_counter()
+            parse_voice(utterance, merchant_of)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    assert timings[int(len(timings) * 0.95)] < 0.001
+
+
+@pytest.mark.parametrize("utterance,amount", [
+    ("to do list notebook 300", 300),
+    ("che guevara poster 250", 250),
+    ("edu app subscription 199", 199),
+])
+def test_english_words_are_not_numbers(utterance, amount):
+    assert parse_voice(utterance)["amount"] == amount
+
+
+def test_generic_keyword_yields_to_specific_one():
+    assert parse_voice("metro card recharge 500")["category"] == "Transport"
+    assert parse_voice("recharge 500")["category"] == "Bills"
+
+
+@pytest.mark.parametrize("text,merchant", [
+    ("ola cab 275", "Ola"),
+    ("Uber to airport", "Uber"),
+    ("McD's burger", "McDonald's"),
+    ("amazon video rental", "Amazon"),
+    ("chocolate", None),
+    ("coca cola", None),
+    ("tuber vegetables", None),
+    ("primer paint", None),
+])
+def test_merchant_keywords_match_whole_words(text, merchant):
+    assert merchant_of(text) == merchant
+
+
+def test_merchant_categories_name_known_merchants():
+    assert set(MERCHANT_CATEGORIES) <= set(MERCHANT_KEYWORDS)